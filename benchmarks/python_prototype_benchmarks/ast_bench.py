@@ -0,0 +1,65 @@
+# ast_bench.py
+#
+# Memory per node and full-tree traversal time of the AstNode tree against the
+# AstArena storage on a large generated program. Run from the repository root:
+#   python -m benchmarks.python_prototype_benchmarks.ast_bench
+
+import argparse
+import tracemalloc
+from src.python_prototype.ast import AstArena
+from src.python_prototype.lexer import tokenize
+from src.python_prototype.parser import parse
+from .harness import best_of, report
+from .incremental_bench import generate_source
+
+def traced_size(func):
+    """Return func()'s result and the memory it still holds, in bytes"""
+    tracemalloc.start()
+    try:
+        result = func()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+def walk_nodes(root) -> int:
+    """Count the nodes of an AstNode tree in pre-order"""
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(reversed(node.children))
+    return count
+
+def walk_arena(arena: AstArena, root: int) -> int:
+    """Count the nodes of an arena tree in pre-order"""
+    count = 0
+    for _ in arena.walk(root):
+        count += 1
+    return count
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--functions", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tokens = tokenize(generate_source(args.functions))
+    tree, tree_bytes = traced_size(lambda: parse(tokens))
+    arena = AstArena()
+    root, arena_bytes = traced_size(lambda: parse(tokens, arena))
+    nodes = len(arena)
+    assert walk_nodes(tree) == walk_arena(arena, root.handle) == nodes
+
+    tree_seconds = best_of(lambda: walk_nodes(tree), args.repeat)
+    arena_seconds = best_of(lambda: walk_arena(arena, root.handle), args.repeat)
+    rows = [
+        ("AstNode", nodes, tree_bytes / nodes, tree_seconds * 1e3),
+        ("AstArena", nodes, arena_bytes / nodes, arena_seconds * 1e3),
+    ]
+    report("AST storage", ("representation", "nodes", "bytes/node", "traversal ms"), rows)
+    print(f"memory ratio {tree_bytes / arena_bytes:.1f}x, "
+          f"traversal speedup {tree_seconds / arena_seconds:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# bytecode_bench.py
+#
+# Memory of compiled programs held as lists of instruction objects against
+# packed CodeObjects, and the size of their serialised form. Run from the
+# repository root:
+#   python -m benchmarks.python_prototype_benchmarks.bytecode_bench
+
+import argparse
+import tracemalloc
+from typing import Any, List
+from src.python_prototype.bytecode import CodeObject, Instruction, disassemble
+from src.python_prototype.compiler import compile_code
+from .harness import report
+from .incremental_bench import generate_source
+
+class LegacyInstruction:
+    """The instruction class bytecode used to be stored as"""
+    def __init__(self, opcode: Any, arg: Any = None):
+        self.opcode = opcode
+        self.arg = arg
+
+def code_objects(code: CodeObject) -> List[CodeObject]:
+    """code and every function nested in it"""
+    found = [code]
+    for const in code.consts:
+        if isinstance(const, CodeObject):
+            found.extend(code_objects(const))
+    return found
+
+def held_bytes(func) -> int:
+    """Memory still held by func()'s result"""
+    tracemalloc.start()
+    try:
+        result = func()
+        size = tracemalloc.get_traced_memory()[0]
+        del result
+        return size
+    finally:
+        tracemalloc.stop()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--functions", type=int, default=5_000)
+    args = parser.parse_args()
+
+    codes = code_objects(compile_code(generate_source(args.functions)))
+    decoded = [list(code.decode()) for code in codes]
+    count = sum(len(instructions) for instructions in decoded)
+
+    rows = []
+    for name, build in (
+        ("legacy instructions", lambda: [[LegacyInstruction(opcode, arg) for _, opcode, arg in instructions]
+                                         for instructions in decoded]),
+        ("slotted instructions", lambda: [[Instruction(opcode, arg) for _, opcode, arg in instructions]
+                                          for instructions in decoded]),
+        ("packed code words", lambda: [code.code[:] for code in codes]),
+    ):
+        size = held_bytes(build)
+        rows.append((name, count, size / 1024, size / count))
+    report("Instruction storage", ("representation", "instructions", "KB", "bytes/instruction"), rows)
+
+    module = codes[0]
+    serialised = module.dumps()
+    print(f"serialised program: {len(serialised) / 1024:.1f} KB for {count} instructions "
+          f"in {len(codes)} code objects")
+    print()
+    print(disassemble(codes[1]))
+
+if __name__ == "__main__":
+    main()
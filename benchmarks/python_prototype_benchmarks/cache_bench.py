@@ -0,0 +1,69 @@
+# cache_bench.py
+#
+# Cold (compile and store) against warm (load from .mooncache) startup, both
+# in-process and for a fresh interpreter process per run. Run from the
+# repository root:
+#   python -m benchmarks.python_prototype_benchmarks.cache_bench
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from src.python_prototype.cache import CACHE_DIRECTORY, BytecodeCache
+from .harness import best_of, report
+
+STARTUP = "import sys; from src.python_prototype.cache import compile_file; compile_file(sys.argv[1])"
+
+def generate_source(statements: int) -> str:
+    """Generate a script of top-level literal expression statements"""
+    return "".join(
+        f"10000.75 * 0.025 + (595 - {n}) / 12.5\n\"zakat\" ۩ \"{n}\"\n"
+        for n in range(statements)
+    )
+
+def run_script(path: str) -> float:
+    """Wall time of a fresh interpreter compiling path through the cache"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", STARTUP, path], check=True)
+    return time.perf_counter() - start
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    in_process = []
+    startup = []
+    with tempfile.TemporaryDirectory() as directory:
+        for statements in (100, 1_000, 10_000):
+            source = generate_source(statements)
+            cache_directory = os.path.join(directory, CACHE_DIRECTORY)
+
+            def cold():
+                shutil.rmtree(cache_directory, ignore_errors=True)
+                BytecodeCache(cache_directory).compile(source)
+
+            cold_seconds = best_of(cold, args.repeat)
+            warm_seconds = best_of(lambda: BytecodeCache(cache_directory).compile(source), args.repeat)
+            in_process.append((statements, cold_seconds * 1e3, warm_seconds * 1e3, cold_seconds / warm_seconds))
+
+            script = os.path.join(directory, "job.moon")
+            with open(script, "w", encoding="utf-8") as file:
+                file.write(source)
+            cold_runs = []
+            for _ in range(args.repeat):
+                shutil.rmtree(cache_directory, ignore_errors=True)
+                cold_runs.append(run_script(script))
+            warm_runs = [run_script(script) for _ in range(args.repeat)]
+            startup.append((statements, min(cold_runs) * 1e3, min(warm_runs) * 1e3,
+                            min(cold_runs) / min(warm_runs)))
+
+    headers = ("statements", "cold ms", "warm ms", "speedup")
+    report("Compile or load, in process", headers, in_process)
+    report("Process startup to loaded bytecode", headers, startup)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# closures_bench.py
+#
+# The closure-compiling interpreter against the tree-walking Interpreter on
+# a loop and on recursive calls. Run from the repository root:
+#   python -m benchmarks.python_prototype_benchmarks.closures_bench
+
+import argparse
+from src.python_prototype.closures import ClosureInterpreter
+from src.python_prototype.interpreter import Interpreter
+from src.python_prototype.lexer import tokenize
+from src.python_prototype.parser import parse
+from .harness import best_of, report
+
+LOOP = """
+n ۝ 0
+total ۝ 0
+while n < {n}:
+    total ۝ total + n * 2 - 1
+    n ۝ n + 1
+"""
+
+# Interpreter functions give the value of their last statement
+RECURSION = """
+def fib(n):
+    if n < 2:
+        result ۝ n
+    else:
+        result ۝ fib(n - 1) + fib(n - 2)
+    result
+﷽:
+    answer ۝ fib({depth})
+"""
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=50_000)
+    parser.add_argument("--depth", type=int, default=18)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    for name, source in (("loop", LOOP.format(n=args.iterations)), ("recursive fib", RECURSION.format(depth=args.depth))):
+        tree = parse(tokenize(source))
+        walking = best_of(lambda: Interpreter().interpret(tree), args.repeat)
+        closures = best_of(lambda: ClosureInterpreter().interpret(tree), args.repeat)
+        rows.append((name, walking, closures, walking / closures))
+    report("Closure compilation", ("benchmark", "tree-walking s", "closures s", "speedup"), rows)
+
+if __name__ == "__main__":
+    main()
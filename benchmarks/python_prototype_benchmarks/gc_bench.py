@@ -0,0 +1,107 @@
+# gc_bench.py
+#
+# Pause times and throughput of MemoryManager's collectors under allocation
+# churn: a service keeps a set of rooted sessions, each holding a few
+# blocks, replaces sessions as it goes and allocates short-lived temporaries
+# for every request. Compares the old stop-the-world collector, the
+# generational one with and without reference counting, and the latter with
+# incremental major collections. Run from the repository root:
+#   python -m benchmarks.python_prototype_benchmarks.gc_bench
+
+import argparse
+import random
+import time
+from typing import List, Set
+from src.python_prototype.memory import Handle, ManagedList, MemoryManager
+from .harness import report
+
+BLOCK_SIZE = 64
+
+class TracingMemoryManager(MemoryManager):
+    """Leaves every block to the tracing collectors, ignoring reference counts"""
+    def __init__(self, max_memory: int, **options):
+        super().__init__(max_memory, cycle_threshold=2 ** 62, **options)
+
+    def free_unreferenced(self) -> None:
+        self.zero_counts.clear()
+
+class LegacyMemoryManager(TracingMemoryManager):
+    """Collects as MemoryManager did before generations: a full recursive
+    mark from every root and a sweep over a copy of every address, only
+    when an allocation would run out of memory"""
+    def __init__(self, max_memory: int):
+        super().__init__(max_memory)
+        self.nursery_size = max_memory  # Never collect the young generation alone
+        self.gc_threshold = 1.0
+
+    def mark_and_sweep(self) -> None:
+        start = time.perf_counter()
+        marked: Set[int] = set()
+
+        def mark(address: int) -> None:
+            if address not in marked:
+                marked.add(address)
+                value = self.values[address]
+                if isinstance(value, ManagedList):
+                    for item in value:
+                        if isinstance(item, Handle) and self.is_allocated(item.address):
+                            mark(item.address)
+
+        for address in self.allocated():
+            if self.refcounts[address] > 0:
+                mark(address)
+        for address in self.allocated():
+            if address not in marked:
+                self.stats.freed_bytes += self.sizes[address]
+                self.free(address)
+        self.stats.major_collections += 1
+        self.stats.pauses.append(time.perf_counter() - start)
+
+def churn(memory: MemoryManager, requests: int, sessions: int, temporaries: int, seed: int = 0) -> float:
+    """Run the workload, returning its wall time in seconds"""
+    rng = random.Random(seed)
+    live: List[int] = []
+    start = time.perf_counter()
+    for request in range(requests):
+        for _ in range(temporaries):
+            memory.allocate(request, BLOCK_SIZE)
+        if len(live) < sessions or rng.random() < 0.2:
+            children = [Handle(memory.allocate(str(request), BLOCK_SIZE)) for _ in range(3)]
+            session = memory.allocate(ManagedList(children), BLOCK_SIZE)
+            memory.blocks[session].increment_ref()
+            if len(live) < sessions:
+                live.append(session)
+            else:
+                index = rng.randrange(sessions)
+                memory.blocks[live[index]].decrement_ref()
+                live[index] = session
+    return time.perf_counter() - start
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=50_000)
+    parser.add_argument("--sessions", type=int, default=2_000)
+    parser.add_argument("--temporaries", type=int, default=4)
+    parser.add_argument("--max-memory", type=int, default=1024 * 1024)
+    args = parser.parse_args()
+
+    collectors = (
+        ("stop-the-world", lambda: LegacyMemoryManager(args.max_memory)),
+        ("generational", lambda: TracingMemoryManager(args.max_memory)),
+        ("+ refcounts", lambda: MemoryManager(args.max_memory)),
+        ("+ incremental", lambda: MemoryManager(args.max_memory, incremental=True)),
+    )
+    rows = []
+    for name, factory in collectors:
+        memory = factory()
+        elapsed = churn(memory, args.requests, args.sessions, args.temporaries)
+        stats = memory.stats
+        allocations = stats.allocated_bytes // BLOCK_SIZE
+        rows.append((name, len(stats.pauses), stats.major_collections, stats.pause_percentile(50) * 1e3,
+                     stats.pause_percentile(99) * 1e3, stats.max_pause * 1e3, stats.total_pause * 1e3,
+                     100 * stats.refcount_freed / max(stats.freed_blocks, 1), allocations / elapsed / 1e3))
+    report("Allocation churn (pauses in ms)",
+           ("collector", "pauses", "majors", "p50", "p99", "max", "total GC", "% by counts", "k allocs/s"), rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+# harness.py
+
+import time
+from typing import Any, Callable, List, Sequence
+
+def best_of(func: Callable[[], Any], repeat: int = 3) -> float:
+    """Run func repeat times and return the fastest wall time in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def best_of_each(funcs: Sequence[Callable[[], Any]], repeat: int = 3) -> List[float]:
+    """best_of for several functions, alternating between them so drift in
+    machine speed affects them all alike"""
+    best = [float("inf")] * len(funcs)
+    for _ in range(repeat):
+        for index, func in enumerate(funcs):
+            start = time.perf_counter()
+            func()
+            best[index] = min(best[index], time.perf_counter() - start)
+    return best
+
+def report(title: str, headers: Sequence[str], rows: List[Sequence[Any]]) -> None:
+    """Print a benchmark result table"""
+    cells = [[str(header) for header in headers]]
+    cells += [[f"{value:.3f}" if isinstance(value, float) else str(value) for value in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    print(title)
+    for index, row in enumerate(cells):
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+        if index == 0:
+            print("  ".join("-" * width for width in widths))
+    print()
@@ -0,0 +1,48 @@
+# incremental_bench.py
+#
+# Edit latency of IncrementalDocument against a full tokenize + parse as the
+# document grows. Run from the repository root:
+#   python -m benchmarks.python_prototype_benchmarks.incremental_bench
+
+import argparse
+import statistics
+import time
+from src.python_prototype.incremental import IncrementalDocument
+from src.python_prototype.lexer import tokenize
+from src.python_prototype.parser import parse
+from .harness import best_of, report
+
+def generate_source(functions: int) -> str:
+    """Generate a program with the given number of top-level functions"""
+    parts = [
+        f"def zakat_{n}(amount, nisab):\n"
+        f"    \"zakat\"\n"
+        f"    return amount * 0.025 + nisab / 12.5 - {n}\n"
+        for n in range(functions)
+    ]
+    parts.append("﷽:\n    \"Bismillah\"\n")
+    return "".join(parts)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--edits", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = []
+    for functions in (100, 1_000, 10_000, 50_000):
+        source = generate_source(functions)
+        document = IncrementalDocument(source)
+        # Retype a character inside the body of the middle function
+        offset = source.index("0.025", len(source) // 2) + 4
+        latencies = []
+        for i in range(args.edits):
+            start = time.perf_counter()
+            document.edit(offset, 1, str(i % 10))
+            latencies.append(time.perf_counter() - start)
+        full = best_of(lambda: parse(tokenize(document.source)), 1)
+        median = statistics.median(latencies)
+        rows.append((functions, len(source) // 1024, median * 1e3, full * 1e3, full / median))
+    report("Edit latency", ("functions", "KB", "edit ms", "full parse ms", "speedup"), rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# inline_bench.py
+#
+# Time of call-heavy scripts optimized with and without FunctionInlining,
+# run by the tree-walking and closure interpreters. Run from the
+# repository root:
+#   python -m benchmarks.python_prototype_benchmarks.inline_bench
+
+import argparse
+from src.python_prototype.ast import AstNode
+from src.python_prototype.closures import ClosureInterpreter
+from src.python_prototype.interpreter import Interpreter
+from src.python_prototype.lexer import tokenize
+from src.python_prototype.optimizer import Optimizer
+from src.python_prototype.parser import parse
+from .harness import best_of_each, report
+
+SCRIPTS = (
+    ("one-line helper", """
+def add(x, y):
+    return x + y
+﷽:
+    n ۝ 0
+    while n < {n}:
+        n ۝ add(n, 1)
+"""),
+    ("nested helpers", """
+def square(x):
+    return x * x
+def add(x, y):
+    x + y
+def norm(a, b):
+    return add(square(a), square(b))
+﷽:
+    n ۝ 0
+    total ۝ 0
+    while n < {n}:
+        total ۝ add(total, norm(n, 2) / 100)
+        n ۝ add(n, 1)
+"""),
+    ("zakat helpers", """
+def percent(amount, rate):
+    return amount * rate / 100
+def above(amount, nisab):
+    return amount >= nisab
+def due(amount, nisab):
+    return above(amount, nisab) && percent(amount, 2.5)
+﷽:
+    account ۝ 0
+    total ۝ 0
+    while account < {n}:
+        total ۝ total + due(account * 40, 5567.5)
+        account ۝ account + 1
+"""),
+)
+
+def optimized(source: str, inline: bool) -> AstNode:
+    optimizer = Optimizer()
+    for pass_ in optimizer.passes:
+        if pass_.name == "function_inlining":
+            pass_.enabled = inline
+    return optimizer.optimize(parse(tokenize(source)))
+
+def calls(tree: AstNode) -> int:
+    """Number of FunctionCall nodes in tree"""
+    count = 0
+    pending = [tree]
+    while pending:
+        node = pending.pop()
+        count += node.type == "FunctionCall"
+        pending.extend(node.children)
+    return count
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    for name, script in SCRIPTS:
+        source = script.format(n=args.iterations)
+        plain, folded, inlined = parse(tokenize(source)), optimized(source, False), optimized(source, True)
+        walked = best_of_each([lambda tree=tree: Interpreter().interpret(tree) for tree in (plain, folded, inlined)],
+                              args.repeat)
+        closures = best_of_each([lambda tree=tree: ClosureInterpreter().interpret(tree) for tree in (folded, inlined)],
+                                args.repeat)
+        per_loop = 1e9 / args.iterations
+        rows.append((name, calls(folded), calls(inlined), walked[0] * per_loop, walked[1] * per_loop,
+                     walked[2] * per_loop, walked[1] / walked[2], closures[0] * per_loop, closures[1] * per_loop,
+                     closures[0] / closures[1]))
+    report("Call-heavy scripts (ns per loop iteration)",
+           ("script", "call sites", "after inlining", "tree unoptimized", "tree optimized", "tree inlined",
+            "speedup", "closures optimized", "closures inlined", "speedup"), rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# lexer_bench.py
+#
+# Throughput of the master-pattern lexer against the original character loop.
+# Run from the repository root:
+#   python -m benchmarks.python_prototype_benchmarks.lexer_bench [--mb 4]
+#
+# Also compares peak memory of the token representations, and of tokenize()
+# against draining tokenize_stream() over generated chunks.
+
+import argparse
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Iterator, List
+from src.python_prototype.lexer import tokenize, tokenize_stream, TokenType
+from .harness import best_of, report
+
+@dataclass
+class LegacyToken:
+    """The original dict-backed token dataclass"""
+    type: TokenType
+    value: Any
+
+def reference_tokenize(code: str) -> List[LegacyToken]:
+    """The original character-at-a-time lexer, kept as the baseline"""
+    keywords = {
+        'if': TokenType.IF,
+        'else': TokenType.ELSE,
+        'while': TokenType.WHILE,
+        'return': TokenType.RETURN,
+        'def': TokenType.DEF,
+    }
+    single = {
+        "﷽": TokenType.ENTRY_POINT, "۝": TokenType.ASSIGN, "۩": TokenType.CONCAT,
+        ":": TokenType.COLON, "(": TokenType.LEFT_PAREN, ")": TokenType.RIGHT_PAREN,
+        "+": TokenType.PLUS, "-": TokenType.MINUS, "*": TokenType.STAR,
+        "/": TokenType.SLASH, ",": TokenType.COMMA,
+    }
+    tokens = []
+    i = 0
+    while i < len(code):
+        char = code[i]
+        if char.isspace():
+            i += 1
+            continue
+        if char.isdigit():
+            num = ""
+            while i < len(code) and (code[i].isdigit() or code[i] == '.'):
+                num += code[i]
+                i += 1
+            tokens.append(LegacyToken(TokenType.NUMBER, float(num)))
+            continue
+        elif char == '"' or char == "'":
+            string = ""
+            quote = char
+            i += 1
+            while i < len(code) and code[i] != quote:
+                string += code[i]
+                i += 1
+            i += 1
+            tokens.append(LegacyToken(TokenType.STRING, string))
+            continue
+        elif char.isalpha():
+            ident = ""
+            while i < len(code) and (code[i].isalnum() or code[i] == "_"):
+                ident += code[i]
+                i += 1
+            tokens.append(LegacyToken(keywords.get(ident, TokenType.IDENTIFIER), ident))
+            continue
+        elif char in single:
+            tokens.append(LegacyToken(single[char], char))
+        i += 1
+    return tokens
+
+def generate_source(size: int, literal_length: int = 16) -> str:
+    """Generate a synthetic Moon program of roughly size characters"""
+    text = "بسم الله الرحمن الرحيم " * (literal_length // 20 + 1)
+    literal = text[:literal_length]
+    chunk = (
+        "def calculate_zakat_{n}(amount, nisab):\n"
+        "    share ۝ amount * 0.025 + nisab / 12.5 - 1\n"
+        "    return share ۩ \"" + literal + "\"\n"
+        "﷽:\n"
+        "    total_{n} ۝ calculate_zakat_{n}(10000.75, 595)\n"
+        "    print(total_{n})\n"
+    )
+    parts = []
+    length = 0
+    n = 0
+    while length < size:
+        part = chunk.format(n=n)
+        parts.append(part)
+        length += len(part)
+        n += 1
+    return "".join(parts)
+
+def generate_chunks(size: int, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Yield a generated program as UTF-8 byte chunks without holding it whole"""
+    piece = generate_source(chunk_size).encode("utf-8")
+    produced = 0
+    while produced < size:
+        yield piece
+        produced += len(piece)
+
+def peak_memory(func) -> float:
+    """Peak traced allocation of func() in megabytes"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+def drain(tokens) -> int:
+    count = 0
+    for _ in tokens:
+        count += 1
+    return count
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mb", type=float, default=4.0, help="source size in megabytes")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    
+    rows = []
+    for label, literal_length in (("short literals", 16), ("long literals", 4096)):
+        source = generate_source(int(args.mb * 1024 * 1024), literal_length)
+        megabytes = len(source.encode("utf-8")) / (1024 * 1024)
+        assert ([(token.type, token.value) for token in tokenize(source)] ==
+                [(token.type, token.value) for token in reference_tokenize(source)])
+        for name, func in (("reference loop", reference_tokenize), ("master pattern", tokenize)):
+            seconds = best_of(lambda: func(source), args.repeat)
+            rows.append((label, name, megabytes, seconds, megabytes / seconds))
+    report("Lexer throughput", ("source", "lexer", "MB", "seconds", "MB/s"), rows)
+    
+    source = generate_source(int(args.mb * 1024 * 1024))
+    count = len(tokenize(source))
+    rows = []
+    for name, func in (("dataclass tokens", reference_tokenize),
+                       ("slotted tokens", lambda code: list(tokenize(code))),
+                       ("token buffer", tokenize)):
+        peak = peak_memory(lambda: func(source))
+        rows.append((name, count, peak, peak * 1024 * 1024 / count))
+    report("Token storage", ("representation", "tokens", "peak MB", "bytes/token"), rows)
+    del source
+    
+    size = int(args.mb * 1024 * 1024)
+    rows = [
+        ("tokenize", peak_memory(lambda: tokenize(b"".join(generate_chunks(size)).decode("utf-8")))),
+        ("tokenize_stream", peak_memory(lambda: drain(tokenize_stream(generate_chunks(size))))),
+    ]
+    report(f"Peak memory for a {args.mb:g} MB source", ("lexer", "peak MB"), rows)
+
+if __name__ == "__main__":
+    main()
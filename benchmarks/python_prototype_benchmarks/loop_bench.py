@@ -0,0 +1,82 @@
+# loop_bench.py
+#
+# Time of loop-heavy financial scripts optimized with and without
+# LoopOptimization, run by the tree-walking and closure interpreters. Run
+# from the repository root:
+#   python -m benchmarks.python_prototype_benchmarks.loop_bench
+
+import argparse
+from src.python_prototype.ast import AstNode
+from src.python_prototype.closures import ClosureInterpreter
+from src.python_prototype.interpreter import Interpreter
+from src.python_prototype.lexer import tokenize
+from src.python_prototype.optimizer import Optimizer
+from src.python_prototype.parser import parse
+from .harness import best_of_each, report
+
+# Each script runs its loop n times
+SCRIPTS = (
+    ("loan projection", """
+def project(principal, annual, payment, years):
+    balance ۝ principal
+    month ۝ 0
+    while month < years * 12:
+        interest ۝ balance * (annual / 1200)
+        balance ۝ balance + interest - payment
+        month ۝ month + 1
+﷽:
+    project(100000, 5, 600, {n} / 12)
+"""),
+    ("savings schedule", """
+def schedule(rate, deposit):
+    day ۝ 0
+    total ۝ 0
+    while day < {n}:
+        total ۝ total + deposit * (day * 7) / (day * 7 + rate)
+        label ۝ day * 7 ۩ " days"
+        day ۝ day + 1
+﷽:
+    schedule(30, 25)
+"""),
+    ("zakat ledger", """
+def ledger(holdings, price, rate, accounts):
+    account ۝ 0
+    total ۝ 0
+    while account < accounts:
+        value ۝ holdings * price + account
+        total ۝ total + value * (rate / 100)
+        account ۝ account + 1
+﷽:
+    ledger(85, 65.5, 2.5, {n})
+"""),
+)
+
+def optimized(source: str, loops: bool) -> AstNode:
+    optimizer = Optimizer()
+    for pass_ in optimizer.passes:
+        if pass_.name == "loop_optimization":
+            pass_.enabled = loops
+    return optimizer.optimize(parse(tokenize(source)))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    for name, script in SCRIPTS:
+        source = script.format(n=args.iterations)
+        trees = (optimized(source, False), optimized(source, True))
+        walked = best_of_each([lambda tree=tree: Interpreter().interpret(tree) for tree in trees], args.repeat)
+        closures = best_of_each([lambda tree=tree: ClosureInterpreter().interpret(tree) for tree in trees],
+                                args.repeat)
+        per_loop = 1e9 / args.iterations
+        rows.append((name, walked[0] * per_loop, walked[1] * per_loop, walked[0] / walked[1],
+                     closures[0] * per_loop, closures[1] * per_loop, closures[0] / closures[1]))
+    report("Loop-heavy scripts (ns per iteration)",
+           ("script", "tree", "tree, loops optimized", "speedup", "closures", "closures, loops optimized",
+            "speedup"), rows)
+
+if __name__ == "__main__":
+    main()
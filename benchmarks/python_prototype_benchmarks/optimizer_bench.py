@@ -0,0 +1,128 @@
+# optimizer_bench.py
+#
+# Time of the AST optimizer's worklist driver against the old one, which
+# re-walked the whole tree once per pass per round, on generated programs
+# of growing size and on single deeply nested expressions, which the old
+# one recursed too deep for. Also shows each pass's share of the time, and
+# how much sooner a configuration-heavy script runs once constants are
+# propagated through it. Run from the repository root:
+#   python -m benchmarks.python_prototype_benchmarks.optimizer_bench
+
+import argparse
+from typing import List, Union
+from src.python_prototype.ast import AstNode
+from src.python_prototype.interpreter import Interpreter
+from src.python_prototype.lexer import tokenize
+from src.python_prototype.optimizer import OptimizationPass, Optimizer
+from src.python_prototype.parser import parse
+from .harness import best_of, best_of_each, report
+
+class LegacyOptimizer(Optimizer):
+    """Drives the passes as Optimizer did before the worklist: every pass
+    over the whole tree, repeated while the root compares unequal"""
+    def optimize(self, node: AstNode) -> AstNode:
+        modified = True
+        while modified:
+            modified = False
+            for pass_ in self.passes:
+                if pass_.enabled:
+                    new_node = self._optimize_tree(node, pass_)
+                    if new_node != node:
+                        node = new_node
+                        modified = True
+        return node
+
+    def _optimize_tree(self, node: AstNode, pass_: OptimizationPass) -> AstNode:
+        if node.children:
+            node.children = [self._optimize_tree(child, pass_) for child in node.children]
+        # The passes once checked node types themselves
+        if pass_.node_types is not None and node.type not in pass_.node_types:
+            return node
+        return pass_.optimize(node)
+
+def generate(statements: int) -> str:
+    """A program of assignments mixing foldable and variable arithmetic"""
+    lines = ["rate ۝ 0.025"]
+    for index in range(statements):
+        lines.append(f"v{index} ۝ (rate * (12 * 30 - 350)) + (v{max(index - 1, 0)} * 2 + {index} * 4 / 8)")
+    return "\n".join(lines) + "\n"
+
+def deep(terms: int) -> str:
+    """One left-nested sum of terms operands"""
+    return "x ۝ " + " + ".join(["y"] + [str(index) for index in range(terms)]) + "\n"
+
+def configuration(iterations: int) -> str:
+    """A zakat calculation: derived settings, then a loop over accounts using them"""
+    return f"""gold_nisab ۝ 85
+gold_price ۝ 65.5
+nisab ۝ gold_nisab * gold_price
+rate ۝ 2.5 / 100
+label ۝ "Zakat at " ۩ rate * 100 ۩ "%"
+threshold ۝ nisab * (1 + len("hawl") / 100)
+account ۝ 0
+total ۝ 0
+while account < {iterations}:
+    balance ۝ threshold * 2 - nisab / 2 + account
+    due ۝ balance * rate - (nisab - threshold) * rate
+    total ۝ total + due
+    account ۝ account + 1
+"""
+
+def parse_each(source: str, count: int) -> List[AstNode]:
+    """count separate trees for source, since optimizing changes a tree"""
+    return [parse(tokenize(source)) for _ in range(count)]
+
+def time_legacy(source: str, repeat: int) -> Union[float, str]:
+    trees = parse_each(source, repeat)
+    try:
+        return best_of(lambda: LegacyOptimizer().optimize(trees.pop()), repeat) * 1e3
+    except RecursionError:
+        return "RecursionError"
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 4_000, 16_000])
+    parser.add_argument("--depths", type=int, nargs="+", default=[500, 5_000])
+    parser.add_argument("--iterations", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        source = generate(size)
+        trees = parse_each(source, 2 * args.repeat)
+        legacy, worklist = best_of_each((lambda: LegacyOptimizer().optimize(trees.pop()),
+                                         lambda: Optimizer().optimize(trees.pop())), args.repeat)
+        optimizer = Optimizer()
+        optimizer.optimize(parse(tokenize(source)))
+        calls = sum(stats.calls for stats in optimizer.stats.values())
+        rows.append((size, legacy * 1e3, worklist * 1e3, legacy / worklist, optimizer.visited, calls))
+    report("Optimizing generated programs (ms)",
+           ("statements", "legacy", "worklist", "speedup", "nodes visited", "pass calls"), rows)
+
+    rows = []
+    for terms in args.depths:
+        trees = parse_each(deep(terms), args.repeat)
+        worklist = best_of(lambda: Optimizer().optimize(trees.pop()), args.repeat)
+        rows.append((terms, time_legacy(deep(terms), args.repeat), worklist * 1e3))
+    report("Optimizing one nested expression (ms)", ("terms", "legacy", "worklist"), rows)
+
+    rows = []
+    for iterations in args.iterations:
+        source = configuration(iterations)
+        plain = parse(tokenize(source))
+        optimized = Optimizer().optimize(parse(tokenize(source)))
+        before, after = best_of_each((lambda: Interpreter().interpret(plain),
+                                      lambda: Interpreter().interpret(optimized)), args.repeat)
+        rows.append((iterations, before * 1e3, after * 1e3, before / after))
+    report("Running a configuration script (ms)", ("iterations", "unoptimized", "optimized", "speedup"), rows)
+
+    optimizer = Optimizer(timed=True)
+    optimizer.optimize(parse(tokenize(generate(args.sizes[-1]))))
+    total = sum(stats.seconds for stats in optimizer.stats.values())
+    report(f"Passes over {args.sizes[-1]} statements", ("pass", "calls", "rewrites", "ms", "% of pass time"),
+           [(name, stats.calls, stats.rewrites, stats.seconds * 1e3, 100 * stats.seconds / total)
+            for name, stats in optimizer.stats.items()])
+
+if __name__ == "__main__":
+    main()
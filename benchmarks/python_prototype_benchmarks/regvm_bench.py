@@ -0,0 +1,87 @@
+# regvm_bench.py
+#
+# Instructions executed and wall time of the register VM against the stack
+# VM on arithmetic- and assignment-heavy programs. Run from the repository
+# root:
+#   python -m benchmarks.python_prototype_benchmarks.regvm_bench
+
+import argparse
+import sys
+from typing import Any, Callable
+from src.python_prototype.compiler import compile_code
+from src.python_prototype.regvm import RegisterVirtualMachine, compile_registers
+from src.python_prototype.vm import VirtualMachine
+from .harness import best_of, report
+
+ARITHMETIC = """
+def poly(x):
+    return x * x * 3 - x * 2 + 7 / x
+﷽:
+    n ۝ 1
+    total ۝ 0
+    while n <= {n}:
+        total ۝ total + n * n - n / 2 + poly(n)
+        n ۝ n + 1
+"""
+
+ASSIGNMENTS = """
+def shuffle(limit):
+    a ۝ 1
+    b ۝ 2
+    c ۝ 3
+    i ۝ 0
+    while i < limit:
+        t ۝ a
+        a ۝ b
+        b ۝ c
+        c ۝ t + 1
+        i ۝ i + 1
+        if i >= limit:
+            return a + b + c
+﷽:
+    result ۝ shuffle({n})
+"""
+
+# Closures of the VMs' dispatch builders other than opcode handlers
+HELPERS = frozenset(("run_frame", "lookup", "compare", "jump_unless"))
+
+def executed(run: Callable[[], Any]) -> int:
+    """Number of opcode handlers run() dispatches to"""
+    count = 0
+
+    def profile(frame, event, arg):
+        nonlocal count
+        code = frame.f_code
+        if event == "call" and "_make_dispatch.<locals>." in code.co_qualname and code.co_name not in HELPERS:
+            count += 1
+
+    sys.setprofile(profile)
+    try:
+        run()
+    finally:
+        sys.setprofile(None)
+    return count
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    for name, template in (("arithmetic", ARITHMETIC), ("assignments", ASSIGNMENTS)):
+        source = template.format(n=args.iterations)
+        stack_code = compile_code(source)
+        register_code = compile_registers(source)
+        run_stack = lambda: VirtualMachine().execute(stack_code)
+        run_registers = lambda: RegisterVirtualMachine().execute(register_code)
+        stack_count = executed(run_stack)
+        register_count = executed(run_registers)
+        stack_time = best_of(run_stack, args.repeat)
+        register_time = best_of(run_registers, args.repeat)
+        rows.append((name, stack_count, register_count, stack_time, register_time, stack_time / register_time))
+    report("Register VM", ("benchmark", "stack instructions", "register instructions", "stack s", "register s",
+                           "speedup"), rows)
+
+if __name__ == "__main__":
+    main()
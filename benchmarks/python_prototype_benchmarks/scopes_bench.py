@@ -0,0 +1,91 @@
+# scopes_bench.py
+#
+# Cost of user function calls in the tree-walking interpreter with per-call
+# scopes, against the old scheme of copying every variable on each call and
+# restoring the copy on return. Runs recursive fib, then a loop of calls with
+# a growing number of globals defined. Run from the repository root:
+#   python -m benchmarks.python_prototype_benchmarks.scopes_bench
+
+import argparse
+import sys
+from typing import Any
+from src.python_prototype.ast import AstNode
+from src.python_prototype.interpreter import Interpreter
+from src.python_prototype.lexer import tokenize
+from src.python_prototype.parser import parse
+from .harness import best_of_each, report
+
+FIB = """
+def fib(n):
+    if n < 2:
+        return n
+    else:
+        return fib(n - 1) + fib(n - 2)
+﷽:
+    result ۝ fib({n})
+"""
+
+LOOP = """
+def step(x):
+    return x + 1
+﷽:
+    n ۝ 0
+    while n < {n}:
+        n ۝ step(n)
+"""
+
+class CopyingInterpreter(Interpreter):
+    """Calls functions as the interpreter did before call scopes.
+
+    Parameters are bound straight into the globals, which are copied first
+    and put back afterwards, so each call costs time proportional to the
+    number of variables defined.
+    """
+    def call_function(self, func_node: AstNode, args: list) -> Any:
+        saved = self.globals.variables.copy()
+        for param, arg in zip(func_node.params, args):
+            self.globals.variables[param] = self.interpret(arg)
+        result = None
+        for statement in func_node.children:
+            result = self.interpret(statement)
+            if self.returning:
+                self.returning = False
+                break
+        self.globals.variables = self.variables = saved
+        return result
+
+def run(interpreter_class: type, tree: AstNode, globals_count: int = 0) -> Interpreter:
+    interpreter = interpreter_class()
+    for index in range(globals_count):
+        interpreter.variables[f"global{index}"] = float(index)
+    interpreter.interpret(tree)
+    return interpreter
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fib", type=int, nargs="+", default=[12, 15, 18])
+    parser.add_argument("--iterations", type=int, default=5_000)
+    parser.add_argument("--globals", type=int, nargs="+", default=[0, 100, 1_000, 5_000])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10_000))
+
+    rows = []
+    for n in args.fib:
+        tree = parse(tokenize(FIB.format(n=n)))
+        copying, scopes = best_of_each([lambda: run(CopyingInterpreter, tree), lambda: run(Interpreter, tree)],
+                                       args.repeat)
+        rows.append((f"fib({n})", copying * 1e3, scopes * 1e3, copying / scopes))
+    report("Recursive fib (ms)", ("program", "copying", "scopes", "speedup"), rows)
+
+    rows = []
+    tree = parse(tokenize(LOOP.format(n=args.iterations)))
+    per_call = 1e9 / args.iterations
+    for count in args.globals:
+        copying, scopes = best_of_each([lambda: run(CopyingInterpreter, tree, count),
+                                        lambda: run(Interpreter, tree, count)], args.repeat)
+        rows.append((count, copying * per_call, scopes * per_call, copying / scopes))
+    report("Calls with many globals (ns per call)", ("globals", "copying", "scopes", "speedup"), rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# semantic_bench.py
+#
+# Time of the single-pass SemanticAnalyzer against the old one, which
+# visited every While, FunctionDef and Assignment subtree a second time and
+# so took time exponential in the nesting depth, on deeply nested loops.
+# Then the single pass alone on programs of many functions of nested loops,
+# with the time per node and per phase. Run from the repository root:
+#   python -m benchmarks.python_prototype_benchmarks.semantic_bench
+
+import argparse
+from typing import Union
+from src.python_prototype.ast import AstNode
+from src.python_prototype.error import CompilerError, raise_name_error, raise_type_error
+from src.python_prototype.lexer import tokenize
+from src.python_prototype.parser import parse
+from src.python_prototype.semantic import SemanticAnalyzer, SymbolTable
+from .harness import best_of, best_of_each, report
+
+class LegacyAnalyzer(SemanticAnalyzer):
+    """Analyzes as SemanticAnalyzer did before it was rewritten: each node
+    handled, then its children analyzed again"""
+    def analyze(self, node: AstNode) -> None:
+        self.visited += 1
+        if node.type == "Program":
+            for child in node.children:
+                self.analyze(child)
+        elif node.type == "FunctionDef":
+            self.function_depth += 1
+            old_scope = self.current_scope
+            self.current_scope = SymbolTable(parent=old_scope)
+            for param in node.params:
+                self.current_scope.define(param, "Any")
+            for child in node.children:
+                self.analyze(child)
+            self.current_scope = old_scope
+            self.function_depth -= 1
+        elif node.type == "Assignment":
+            symbol = self.current_scope.lookup(node.value)
+            if symbol and not symbol.is_mutable:
+                raise_type_error(f"Cannot assign to immutable variable '{node.value}'")
+            self.analyze(node.children[0])
+            if not symbol:
+                self.current_scope.define(node.value, "Any")
+        elif node.type == "While":
+            self.loop_depth += 1
+            self.analyze(node.children[0])
+            for child in node.children[1:]:
+                self.analyze(child)
+            self.loop_depth -= 1
+        elif node.type == "Return":
+            if self.function_depth == 0:
+                raise_type_error("'return' outside function")
+            if node.children:
+                self.analyze(node.children[0])
+        elif node.type == "Identifier":
+            if not self.current_scope.lookup(node.value):
+                raise_name_error(f"Undefined variable '{node.value}'")
+        for child in node.children:
+            self.analyze(child)
+
+def loops(depth: int) -> str:
+    """Module-level loops nested depth deep, each updating a counter"""
+    lines = ["i ۝ 0"]
+    for level in range(depth):
+        lines.append(f"{'    ' * level}while i < {level + 2}:")
+        lines.append(f"{'    ' * (level + 1)}i ۝ i + 1")
+    return "\n".join(lines) + "\n"
+
+def functions(count: int, depth: int) -> str:
+    """count functions of loops nested depth deep, reading parameters, locals and globals"""
+    lines = ["limit ۝ 10"]
+    for index in range(count):
+        lines += [f"def f{index}(n):", "    total ۝ 0"]
+        for level in range(depth):
+            lines.append(f"{'    ' * (level + 1)}while total < n * limit:")
+            lines.append(f"{'    ' * (level + 2)}total ۝ total + n / {level + 1}")
+        lines.append(f"{'    ' * (depth + 1)}return total")
+    lines += ["﷽:", "    x ۝ f0(2)"]
+    return "\n".join(lines) + "\n"
+
+def nodes(tree: AstNode) -> int:
+    count = 0
+    pending = [tree]
+    while pending:
+        node = pending.pop()
+        count += 1
+        pending.extend(node.children)
+    return count
+
+def time_legacy(tree: AstNode, repeat: int) -> Union[float, str]:
+    try:
+        return best_of(lambda: LegacyAnalyzer().analyze(tree), repeat) * 1e3
+    except CompilerError as error:
+        return error.error_type.name
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--depths", type=int, nargs="+", default=[4, 8, 12, 16])
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 100, 1_000])
+    parser.add_argument("--nesting", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for depth in args.depths:
+        tree = parse(tokenize(loops(depth)))
+        legacy = LegacyAnalyzer()
+        legacy.analyze(tree)
+        analyzer = SemanticAnalyzer()
+        analyzer.analyze(tree)
+        old, new = best_of_each((lambda: LegacyAnalyzer().analyze(tree),
+                                 lambda: SemanticAnalyzer().analyze(tree)), args.repeat)
+        rows.append((depth, nodes(tree), legacy.visited, analyzer.visited, old * 1e3, new * 1e3, old / new))
+    report("Analyzing nested loops (ms)",
+           ("depth", "nodes", "legacy visits", "visits", "legacy", "single pass", "speedup"), rows)
+
+    rows = []
+    for count in args.counts:
+        tree = parse(tokenize(functions(count, args.nesting)))
+        size = nodes(tree)
+        seconds = best_of(lambda: SemanticAnalyzer().analyze(tree), args.repeat)
+        analyzer = SemanticAnalyzer()
+        analyzer.analyze(tree)
+        rows.append((count, size, time_legacy(tree, 1), seconds * 1e3, seconds * 1e9 / size,
+                     analyzer.timings["traverse"] * 1e3, analyzer.timings["resolve"] * 1e3))
+    report(f"Analyzing functions of loops nested {args.nesting} deep (ms)",
+           ("functions", "nodes", "legacy", "single pass", "ns per node", "traverse", "resolve"), rows)
+
+if __name__ == "__main__":
+    main()
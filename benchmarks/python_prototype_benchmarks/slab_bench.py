@@ -0,0 +1,92 @@
+# slab_bench.py
+#
+# A long-running service's allocation pattern: a steady pool of live small
+# values, one replaced per step, millions of times. Compares MemoryManager's
+# size-class slabs and parallel metadata arrays against the old allocator,
+# which kept a MemoryBlock object per block in a dict and never reused an
+# address. Run from the repository root:
+#   python -m benchmarks.python_prototype_benchmarks.slab_bench
+
+import argparse
+import random
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List
+from src.python_prototype.memory import MemoryManager
+from .harness import report
+
+@dataclass
+class DictBlock:
+    value: Any
+    size: int
+    references: int = 0
+
+class DictAllocator:
+    """MemoryManager's old allocate and free, without collection"""
+    def __init__(self):
+        self.used_memory = 0
+        self.blocks: Dict[int, DictBlock] = {}
+        self.next_address = 1
+
+    def allocate(self, value: Any, size: int) -> int:
+        address = self.next_address
+        self.blocks[address] = DictBlock(value, size)
+        self.used_memory += size
+        self.next_address += 1
+        return address
+
+    def free(self, address: int) -> None:
+        if address in self.blocks:
+            self.used_memory -= self.blocks[address].size
+            del self.blocks[address]
+
+    def address_space(self) -> int:
+        return self.next_address
+
+    def metadata_bytes(self) -> int:
+        blocks = self.blocks.values()
+        return sys.getsizeof(self.blocks) + sum(sys.getsizeof(block) + sys.getsizeof(block.__dict__)
+                                                for block in blocks)
+
+class SlabAllocator(MemoryManager):
+    def __init__(self):
+        # Large enough that the benchmark measures allocation, not collection
+        super().__init__(max_memory=1 << 40)
+
+    def address_space(self) -> int:
+        return len(self.values)
+
+    def metadata_bytes(self) -> int:
+        return (sum(sys.getsizeof(table) for table in (self.values, self.sizes, self.refcounts, self.heap_refs,
+                                                       self.slot_classes, self.live, self.young))
+                + sum(sys.getsizeof(free_list) for free_list in self.free_lists))
+
+def serve(allocator: Any, steps: int, live: int, seed: int = 0) -> float:
+    """Replace one of live values per step, returning the wall time in seconds"""
+    rng = random.Random(seed)
+    sizes = [rng.randrange(8, 200) for _ in range(1024)]
+    pool: List[int] = [allocator.allocate(index, sizes[index % 1024]) for index in range(live)]
+    start = time.perf_counter()
+    for step in range(steps):
+        index = rng.randrange(live)
+        allocator.free(pool[index])
+        pool[index] = allocator.allocate(step, sizes[step % 1024])
+    return time.perf_counter() - start
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, default=1_000_000)
+    parser.add_argument("--live", type=int, default=10_000)
+    args = parser.parse_args()
+
+    rows = []
+    for name, allocator in (("dict of blocks", DictAllocator()), ("size-class slabs", SlabAllocator())):
+        elapsed = serve(allocator, args.steps, args.live)
+        rows.append((name, args.steps / elapsed / 1e3, allocator.address_space(),
+                     allocator.metadata_bytes() / args.live))
+    report(f"{args.steps} replacements among {args.live} live values",
+           ("allocator", "k steps/s", "address space", "metadata bytes/block"), rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# types_bench.py
+#
+# Time of numeric and string loops on the stack VM, compiled with the
+# generic operator opcodes and with the ones specialised for the operand
+# types inferred, at both peephole levels. Also counts the specialised
+# instructions and times the inference. Run from the repository root:
+#   python -m benchmarks.python_prototype_benchmarks.types_bench
+
+import argparse
+import time
+from src.python_prototype.bytecode import CodeObject, OpCode
+from src.python_prototype.compiler import Compiler, compile_code
+from src.python_prototype.lexer import tokenize
+from src.python_prototype.parser import parse
+from src.python_prototype.peephole import BASIC_OPTIMIZATION, FULL_OPTIMIZATION, optimize_code
+from src.python_prototype.semantic import SemanticAnalyzer, TypeInference
+from src.python_prototype.vm import VirtualMachine
+from .harness import best_of_each, report
+
+SPECIALISED = (OpCode.BINARY_ADD_FLOAT, OpCode.CONCAT_STR)
+
+SCRIPTS = (
+    ("compound growth", """
+def grow(balance, rate, deposit):
+    month ۝ 0
+    while month < {n}:
+        balance ۝ balance + balance * rate + deposit
+        month ۝ month + 1
+﷽:
+    grow(1000, 0.004, 25)
+"""),
+    ("running totals", """
+def totals(prices):
+    total ۝ 0
+    due ۝ 0
+    n ۝ 0
+    while n < {n}:
+        total ۝ total + prices + n
+        due ۝ due + total / 40
+        n ۝ n + 1
+﷽:
+    totals(12.5)
+"""),
+    ("labels", """
+def labels(name):
+    n ۝ 0
+    while n < {n}:
+        line ۝ name ۩ ": " ۩ "due"
+        n ۝ n + 1
+﷽:
+    labels("zakat")
+"""),
+)
+
+def generic(source: str, level: int) -> CodeObject:
+    """source compiled without inferring types"""
+    compiler = Compiler()
+    compiler.compile(parse(tokenize(source)))
+    return optimize_code(compiler.get_code(), level)
+
+def specialised(code: CodeObject) -> int:
+    """Number of specialised instructions in code and its functions"""
+    count = sum(instruction.opcode in SPECIALISED for instruction in code)
+    return count + sum(specialised(const) for const in code.consts if isinstance(const, CodeObject))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    rows = []
+    for name, script in SCRIPTS:
+        source = script.format(n=args.iterations)
+        for level in (BASIC_OPTIMIZATION, FULL_OPTIMIZATION):
+            plain, typed = generic(source, level), compile_code(source, level)
+            times = best_of_each([lambda code=code: VirtualMachine().execute(code) for code in (plain, typed)],
+                                 args.repeat)
+            per_loop = 1e9 / args.iterations
+            rows.append((name, level, specialised(typed), times[0] * per_loop, times[1] * per_loop,
+                         times[0] / times[1]))
+    report("Loops on the stack VM (ns per iteration)",
+           ("script", "peephole level", "specialised", "generic", "typed", "speedup"), rows)
+
+    rows = []
+    for name, script in SCRIPTS:
+        tree = parse(tokenize(script.format(n=args.iterations)))
+        analyzer = SemanticAnalyzer()
+        analyzer.analyze(tree)
+        types = TypeInference(analyzer)
+        start = time.perf_counter()
+        types.infer(tree)
+        rows.append((name, types.rounds, (time.perf_counter() - start) * 1e6))
+    report("Inferring types", ("script", "rounds", "us"), rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# vm_bench.py
+#
+# Instructions per second of the VM's handler-table dispatch loop against the
+# if/elif loop it replaced, on tight arithmetic, name lookup and call
+# micro-benchmarks. Run from the repository root:
+#   python -m benchmarks.python_prototype_benchmarks.vm_bench
+
+import argparse
+from typing import Any, Dict, List, Optional
+from src.python_prototype.bytecode import ARG_BITS, CodeObject, OpCode
+from src.python_prototype.compiler import compile_code
+from src.python_prototype.vm import COMPARE_FUNCTIONS, Function, VirtualMachine
+from src.python_prototype.builtins import BUILTIN_FUNCTIONS
+from .harness import best_of, report
+
+ARITHMETIC = """
+n ۝ 0
+total ۝ 0
+while n < {n}:
+    total ۝ total + n * 2 - 1
+    n ۝ n + 1
+"""
+
+NAME_LOOKUPS = """
+def scan(limit):
+    i ۝ 0
+    while i < limit:
+        i ۝ i + step + rate * base - rate * base
+﷽:
+    step ۝ 1
+    rate ۝ 0.025
+    base ۝ 595
+    scan({n})
+"""
+
+CALLS = """
+def add(a, b):
+    return a + b
+﷽:
+    n ۝ 0
+    while n < {n}:
+        n ۝ add(n, 1)
+"""
+
+class LegacyFrame:
+    def __init__(self, code: CodeObject, globals_: Dict[str, Any], fast: Optional[List[Any]] = None):
+        self.code = code
+        self.globals = globals_
+        self.fast = [] if fast is None else fast
+        self.stack: List[Any] = []
+        self.ip = 0
+
+class LegacyVirtualMachine:
+    """The if/elif dispatch loop the VM used before, counting instructions.
+
+    The count is kept in a local so it adds as little as possible.
+    """
+    def __init__(self):
+        self.globals: Dict[str, Any] = {}
+        self.executed = 0
+
+    def execute(self, code: CodeObject) -> Any:
+        return self._run(LegacyFrame(code, self.globals))
+
+    def _run(self, frame: LegacyFrame) -> Any:
+        code = frame.code.code
+        consts = frame.code.consts
+        names = frame.code.names
+        stack = frame.stack
+        extended = 0
+        executed = 0
+        try:
+            while frame.ip * 2 < len(code):
+                index = frame.ip * 2
+                opcode = code[index]
+                arg = code[index + 1] | extended
+                extended = 0
+                frame.ip += 1
+                executed += 1
+
+                if opcode == OpCode.EXTENDED_ARG:
+                    extended = arg << ARG_BITS
+                elif opcode == OpCode.LOAD_CONST:
+                    stack.append(consts[arg])
+                elif opcode == OpCode.LOAD_FAST:
+                    stack.append(frame.fast[arg])
+                elif opcode == OpCode.STORE_FAST:
+                    frame.fast[arg] = stack.pop()
+                elif opcode == OpCode.STORE_NAME:
+                    frame.globals[names[arg]] = stack.pop()
+                elif opcode == OpCode.LOAD_NAME or opcode == OpCode.LOAD_GLOBAL:
+                    name = names[arg]
+                    if name in frame.globals:
+                        stack.append(frame.globals[name])
+                    elif name in BUILTIN_FUNCTIONS:
+                        stack.append(BUILTIN_FUNCTIONS[name])
+                    else:
+                        raise NameError(f"name '{name}' is not defined")
+                elif opcode == OpCode.BINARY_ADD or opcode == OpCode.ADD:
+                    right = stack.pop()
+                    stack.append(stack.pop() + right)
+                elif opcode == OpCode.BINARY_SUBTRACT:
+                    right = stack.pop()
+                    stack.append(stack.pop() - right)
+                elif opcode == OpCode.BINARY_MULTIPLY:
+                    right = stack.pop()
+                    stack.append(stack.pop() * right)
+                elif opcode == OpCode.BINARY_DIVIDE:
+                    right = stack.pop()
+                    stack.append(stack.pop() / right)
+                elif opcode == OpCode.BINARY_CONCAT:
+                    right = stack.pop()
+                    stack.append(str(stack.pop()) + str(right))
+                elif opcode == OpCode.COMPARE_OP:
+                    right = stack.pop()
+                    stack.append(COMPARE_FUNCTIONS[arg](stack.pop(), right))
+                elif opcode == OpCode.UNARY_NEGATIVE:
+                    stack.append(-stack.pop())
+                elif opcode == OpCode.UNARY_NOT:
+                    stack.append(not stack.pop())
+                elif opcode == OpCode.POP_TOP:
+                    stack.pop()
+                elif opcode == OpCode.JUMP_ABSOLUTE:
+                    frame.ip = arg
+                elif opcode == OpCode.POP_JUMP_IF_FALSE:
+                    if not stack.pop():
+                        frame.ip = arg
+                elif opcode == OpCode.JUMP_IF_FALSE_OR_POP:
+                    if stack[-1]:
+                        stack.pop()
+                    else:
+                        frame.ip = arg
+                elif opcode == OpCode.JUMP_IF_TRUE_OR_POP:
+                    if stack[-1]:
+                        frame.ip = arg
+                    else:
+                        stack.pop()
+                elif opcode == OpCode.MAKE_FUNCTION:
+                    stack.append(Function(stack.pop(), frame.globals))
+                elif opcode == OpCode.CALL_FUNCTION:
+                    args = stack[len(stack) - arg:]
+                    del stack[len(stack) - arg:]
+                    function = stack.pop()
+                    if isinstance(function, Function):
+                        fast = [None] * len(function.code.varnames)
+                        fast[:len(args)] = args
+                        callee = LegacyFrame(function.code, function.globals, fast)
+                        stack.append(self._run(callee))
+                    else:
+                        stack.append(function(*args))
+                elif opcode == OpCode.RETURN_VALUE:
+                    return stack.pop() if stack else None
+                else:
+                    raise RuntimeError(f"Unknown opcode {OpCode(opcode).name}")
+            return None
+        finally:
+            self.executed += executed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for name, template in (("arithmetic loop", ARITHMETIC), ("name lookups", NAME_LOOKUPS), ("calls", CALLS)):
+        code = compile_code(template.format(n=args.iterations))
+        counter = LegacyVirtualMachine()
+        counter.execute(code)
+        executed = counter.executed
+
+        legacy = best_of(lambda: LegacyVirtualMachine().execute(code), args.repeat)
+        current = best_of(lambda: VirtualMachine().execute(code), args.repeat)
+        rows.append((name, executed, executed / legacy / 1e6, executed / current / 1e6, legacy / current))
+    report("VM dispatch", ("benchmark", "instructions", "if/elif Minstr/s", "handler table Minstr/s", "speedup"),
+           rows)
+
+if __name__ == "__main__":
+    main()
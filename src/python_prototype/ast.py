@@ -1,5 +1,6 @@
+from array import array
 from dataclasses import dataclass, field
-from typing import List, Optional, Any
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
 @dataclass
 class AstNode:
@@ -10,9 +11,223 @@ class AstNode:
     name: Optional[str] = field(default=None)
     left: Optional['AstNode'] = field(default=None)
     right: Optional['AstNode'] = field(default=None)
+    # Scratch space for interpreter inline caches; not part of the tree
+    cache: Any = field(default=None, compare=False, repr=False)
 
     def __post_init__(self):
         if self.children is None:
             self.children = []
         if self.params is None:
             self.params = []
+
+# Node types whose value is also their name
+NAMED_TYPES = frozenset(("FunctionDef", "Assignment"))
+
+NO_NODE = -1
+
+class AstArena:
+    """Compact AST storage: one row per node in parallel arrays.
+
+    Nodes are addressed by integer handles. Children form a linked list
+    through first_child/next_sibling, values are interned in a shared table
+    and the rare function parameters live in a side table.
+    """
+    def __init__(self):
+        self.kinds = array('B')
+        self.values = array('I')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.kind_names: List[str] = []
+        # AstNode.cache for arena nodes, by handle
+        self.caches: Dict[int, Any] = {}
+        self.kind_codes: Dict[str, int] = {}
+        self.value_table: List[Any] = [None]
+        self.value_codes: Dict[Any, int] = {}
+        self.params: Dict[int, List[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def add(self, type: str, value: Any = None, children: Sequence[int] = (),
+            start: int = 0, end: int = 0) -> int:
+        """Append a node over already added children and return its handle"""
+        kind = self.kind_codes.get(type)
+        if kind is None:
+            kind = self.kind_codes[type] = len(self.kind_names)
+            self.kind_names.append(type)
+        code = 0
+        if value is not None:
+            # Parser values are strings; other types are keyed with their
+            # class so that 1, 1.0 and True stay distinct
+            key = value if value.__class__ is str else (value.__class__, value)
+            code = self.value_codes.get(key, 0)
+            if not code:
+                code = self.value_codes[key] = len(self.value_table)
+                self.value_table.append(value)
+
+        handle = len(self.kinds)
+        self.kinds.append(kind)
+        self.values.append(code)
+        self.next_sibling.append(NO_NODE)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.first_child.append(NO_NODE)
+        self.link(handle, children)
+        return handle
+
+    def link(self, handle: int, children: Sequence[int]) -> None:
+        """Make children the child list of handle"""
+        next_sibling = self.next_sibling
+        self.first_child[handle] = children[0] if children else NO_NODE
+        for previous, child in zip(children, children[1:]):
+            next_sibling[previous] = child
+        if children:
+            next_sibling[children[-1]] = NO_NODE
+
+    def type(self, handle: int) -> str:
+        return self.kind_names[self.kinds[handle]]
+
+    def value(self, handle: int) -> Any:
+        return self.value_table[self.values[handle]]
+
+    def children(self, handle: int) -> List[int]:
+        """Handles of the children of handle, in order"""
+        next_sibling = self.next_sibling
+        result = []
+        child = self.first_child[handle]
+        while child != NO_NODE:
+            result.append(child)
+            child = next_sibling[child]
+        return result
+
+    def walk(self, handle: int) -> Iterator[int]:
+        """Yield handle and its descendants in pre-order"""
+        first_child = self.first_child
+        next_sibling = self.next_sibling
+        yield handle
+        stack = []
+        child = first_child[handle]
+        if child != NO_NODE:
+            stack.append(child)
+        while stack:
+            handle = stack.pop()
+            yield handle
+            sibling = next_sibling[handle]
+            if sibling != NO_NODE:
+                stack.append(sibling)
+            child = first_child[handle]
+            if child != NO_NODE:
+                stack.append(child)
+
+    def adopt(self, node: AstNode) -> int:
+        """Copy an AstNode tree into the arena and return its root handle"""
+        handles: Dict[int, int] = {}
+        stack: List[Tuple[AstNode, bool]] = [(node, False)]
+        while stack:
+            current, expanded = stack.pop()
+            if not expanded:
+                stack.append((current, True))
+                stack.extend((child, False) for child in reversed(current.children))
+                continue
+            handle = self.add(current.type, current.value,
+                              [handles.pop(id(child)) for child in current.children])
+            if current.params:
+                self.params[handle] = list(current.params)
+            handles[id(current)] = handle
+        return handles[id(node)]
+
+    def to_node(self, handle: int) -> AstNode:
+        """Copy the subtree at handle out into AstNode objects"""
+        nodes: Dict[int, AstNode] = {}
+        for current in reversed(list(self.walk(handle))):
+            type = self.type(current)
+            value = self.value(current)
+            node = AstNode(type, value)
+            node.children = [nodes.pop(child) for child in self.children(current)]
+            if current in self.params:
+                node.params = list(self.params[current])
+            if type in NAMED_TYPES:
+                node.name = value
+            nodes[current] = node
+        return nodes[handle]
+
+    def view(self, handle: int) -> 'NodeView':
+        return NodeView(self, handle)
+
+class NodeView:
+    """A node of an AstArena with the attribute interface of AstNode.
+
+    Lets the existing visitors walk arena-backed trees unchanged. Views are
+    cheap and created on demand; two views of the same node compare equal.
+    """
+    __slots__ = ("arena", "handle")
+
+    def __init__(self, arena: AstArena, handle: int):
+        self.arena = arena
+        self.handle = handle
+
+    @property
+    def type(self) -> str:
+        return self.arena.kind_names[self.arena.kinds[self.handle]]
+
+    @property
+    def value(self) -> Any:
+        return self.arena.value_table[self.arena.values[self.handle]]
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.value if self.type in NAMED_TYPES else None
+
+    @property
+    def params(self) -> List[str]:
+        return self.arena.params.get(self.handle, [])
+
+    @property
+    def span(self) -> Tuple[int, int]:
+        """Source offsets covered by the node"""
+        return self.arena.starts[self.handle], self.arena.ends[self.handle]
+
+    @property
+    def cache(self) -> Any:
+        return self.arena.caches.get(self.handle)
+
+    @cache.setter
+    def cache(self, value: Any) -> None:
+        self.arena.caches[self.handle] = value
+
+    @property
+    def children(self) -> List['NodeView']:
+        arena = self.arena
+        return [NodeView(arena, child) for child in arena.children(self.handle)]
+
+    @children.setter
+    def children(self, children: Iterable[Union['NodeView', AstNode]]) -> None:
+        arena = self.arena
+        handles = [child.handle if isinstance(child, NodeView) and child.arena is arena
+                   else arena.adopt(child if isinstance(child, AstNode) else child.to_node())
+                   for child in children]
+        arena.link(self.handle, handles)
+
+    def to_node(self) -> AstNode:
+        return self.arena.to_node(self.handle)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, NodeView):
+            return self.arena is other.arena and self.handle == other.handle
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((id(self.arena), self.handle))
+
+    def __repr__(self) -> str:
+        return f"NodeView({self.type!r}, {self.value!r}, handle={self.handle})"
+
+def node_key(node: Union[AstNode, NodeView]) -> Hashable:
+    """A key for node in side tables: its arena row for a NodeView, as views
+    are made afresh on every access, or else its identity, so the tree must
+    be kept alive while the table is used"""
+    if node.__class__ is NodeView:
+        return (id(node.arena), node.handle)
+    return id(node)
@@ -0,0 +1,310 @@
+# bytecode.py
+
+import marshal
+from array import array
+from enum import IntEnum
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+class OpCode(IntEnum):
+    # Values are part of the .mooncache format; append new opcodes at the end
+    LOAD_CONST = 1
+    ADD = 2
+    RETURN_VALUE = 3
+    ROT_THREE = 4
+    MAKE_FUNCTION = 5
+    GET_ITER = 6
+    POP_JUMP_IF_FALSE = 7
+    STORE_NAME = 8
+    LOAD_NAME = 9
+    CALL_FUNCTION = 10
+    BINARY_ADD = 11
+    BINARY_SUBTRACT = 12
+    BINARY_MULTIPLY = 13
+    BINARY_DIVIDE = 14
+    COMPARE_OP = 15
+    EXTENDED_ARG = 16
+    POP_TOP = 17
+    JUMP_ABSOLUTE = 18
+    JUMP_IF_FALSE_OR_POP = 19
+    JUMP_IF_TRUE_OR_POP = 20
+    UNARY_NEGATIVE = 21
+    UNARY_NOT = 22
+    BINARY_CONCAT = 23
+    # Superinstructions produced by the peephole optimiser
+    LOAD_NAME_LOAD_CONST_ADD = 24
+    INCR_NAME = 25
+    COMPARE_JUMP_IF_FALSE = 26
+    # Variables resolved at compile time: function locals live in numbered
+    # slots, everything else in the globals
+    LOAD_FAST = 27
+    STORE_FAST = 28
+    LOAD_GLOBAL = 29
+    LOAD_FAST_LOAD_CONST_ADD = 30
+    INCR_FAST = 31
+    # Specialised for operand types the compiler inferred; the VM checks
+    # them, and on a mismatch turns the instruction back into BINARY_ADD or
+    # BINARY_CONCAT for good
+    BINARY_ADD_FLOAT = 32
+    CONCAT_STR = 33
+
+# Opcodes whose argument is an instruction offset
+JUMPS = frozenset((OpCode.POP_JUMP_IF_FALSE, OpCode.JUMP_ABSOLUTE,
+                   OpCode.JUMP_IF_FALSE_OR_POP, OpCode.JUMP_IF_TRUE_OR_POP))
+
+# Jumps whose argument packs the offset above a COMPARE_OPS index
+COMPARE_JUMPS = frozenset((OpCode.COMPARE_JUMP_IF_FALSE,))
+COMPARE_BITS = 3
+
+# Opcodes whose argument packs a name index above a constant index
+NAME_CONST_OPS = frozenset((OpCode.LOAD_NAME_LOAD_CONST_ADD, OpCode.INCR_NAME))
+
+# Opcodes whose argument is a local variable slot
+FAST_OPS = frozenset((OpCode.LOAD_FAST, OpCode.STORE_FAST))
+
+# Opcodes whose argument packs a local slot above a constant index
+FAST_CONST_OPS = frozenset((OpCode.LOAD_FAST_LOAD_CONST_ADD, OpCode.INCR_FAST))
+
+# COMPARE_OP arguments index this table
+COMPARE_OPS = ("==", "!=", "<", "<=", ">", ">=")
+
+ARG_BITS = 16
+ARG_MASK = (1 << ARG_BITS) - 1
+
+# Superinstructions pack two table indices below 256 into one 16-bit oparg
+PACK_BITS = 8
+PACK_MASK = (1 << PACK_BITS) - 1
+
+def pack(high: int, low: int) -> int:
+    """Combine two table indices into one superinstruction argument"""
+    return high << PACK_BITS | low
+
+def unpack(arg: int) -> Tuple[int, int]:
+    return arg >> PACK_BITS, arg & PACK_MASK
+
+def jump_target(opcode: int, arg: int) -> int:
+    """The offset a jump argument refers to"""
+    return arg >> COMPARE_BITS if opcode in COMPARE_JUMPS else arg
+
+def retarget(opcode: int, arg: int, target: int) -> int:
+    """A jump argument with its offset replaced by target"""
+    if opcode in COMPARE_JUMPS:
+        return target << COMPARE_BITS | arg & ((1 << COMPARE_BITS) - 1)
+    return target
+
+class Instruction:
+    """A single decoded instruction.
+
+    The compiler and hand-written programs build lists of these; a
+    CodeObject holds the packed form.
+    """
+    __slots__ = ("opcode", "arg")
+
+    def __init__(self, opcode: OpCode, arg: Any = None):
+        self.opcode = opcode
+        self.arg = arg
+
+    def __repr__(self) -> str:
+        return f"Instruction({self.opcode.name}, {self.arg!r})"
+
+def _size(arg: int) -> int:
+    """Number of instruction slots needed for arg, counting EXTENDED_ARG prefixes"""
+    size = 1
+    while arg > ARG_MASK:
+        arg >>= ARG_BITS
+        size += 1
+    return size
+
+class CodeObject:
+    """Compiled bytecode with its constant and name tables.
+
+    code is a flat array of (opcode, oparg) 16-bit word pairs. Arguments that
+    do not fit in 16 bits are preceded by EXTENDED_ARG words carrying the high
+    bits, and jump arguments are slot offsets into code. Nested functions are
+    CodeObjects in consts.
+
+    varnames names the local variable slots, parameters first. LOAD_GLOBAL
+    caches each name's value in global_versions/global_values together with
+    the version of the globals it was read from, and CALL_FUNCTION caches its
+    resolved callee in call_sites by instruction slot; caches are not
+    serialised.
+    """
+    __slots__ = ("name", "code", "consts", "names", "params", "varnames", "global_versions", "global_values",
+                 "call_sites")
+
+    def __init__(self, name: str, code: array, consts: List[Any], names: List[str],
+                 params: Sequence[str] = (), varnames: Sequence[str] = ()):
+        self.name = name
+        self.code = code
+        self.consts = consts
+        self.names = names
+        self.params = tuple(params)
+        self.varnames = tuple(varnames)
+        self.global_versions = [0] * len(names)
+        self.global_values: List[Any] = [None] * len(names)
+        self.call_sites: List[Any] = [None] * len(self)
+
+    def __len__(self) -> int:
+        """Number of instruction slots, including EXTENDED_ARG prefixes"""
+        return len(self.code) // 2
+
+    def decode(self) -> Iterator[Tuple[int, OpCode, int]]:
+        """Yield (offset, opcode, oparg) with EXTENDED_ARG prefixes folded in"""
+        code = self.code
+        extended = 0
+        start = None
+        for index in range(0, len(code), 2):
+            opcode, arg = code[index], code[index + 1]
+            if opcode == OpCode.EXTENDED_ARG:
+                if start is None:
+                    start = index // 2
+                extended = (extended | arg) << ARG_BITS
+                continue
+            yield (index // 2 if start is None else start), OpCode(opcode), extended | arg
+            extended = 0
+            start = None
+
+    def __iter__(self) -> Iterator[Instruction]:
+        for _, opcode, arg in self.decode():
+            yield Instruction(opcode, arg)
+
+    def dumps(self) -> bytes:
+        """Serialise to bytes; the code words are stored as raw machine words"""
+        return marshal.dumps(self._to_tuple())
+
+    @classmethod
+    def loads(cls, data: bytes) -> 'CodeObject':
+        return cls._from_tuple(marshal.loads(data))
+
+    def _to_tuple(self) -> tuple:
+        consts = [const._to_tuple() if isinstance(const, CodeObject) else const for const in self.consts]
+        nested = [index for index, const in enumerate(self.consts) if isinstance(const, CodeObject)]
+        return (self.name, self.code.tobytes(), consts, nested, self.names, self.params, self.varnames)
+
+    @classmethod
+    def _from_tuple(cls, data: tuple) -> 'CodeObject':
+        name, words, consts, nested, names, params, varnames = data
+        for index in nested:
+            consts[index] = cls._from_tuple(consts[index])
+        code = array('H')
+        code.frombytes(words)
+        return cls(name, code, consts, names, params, varnames)
+
+def assemble(instructions: Sequence[Instruction], consts: List[Any], names: List[str],
+             name: str = "<module>", params: Sequence[str] = (), varnames: Sequence[str] = ()) -> CodeObject:
+    """Pack instructions whose args are already table indices into a CodeObject.
+
+    Jump arguments are indices into instructions and are translated into slot
+    offsets, widening any instruction whose argument needs EXTENDED_ARG.
+    """
+    args = [instruction.arg or 0 for instruction in instructions]
+    targets = {index: jump_target(instruction.opcode, arg)
+               for index, (instruction, arg) in enumerate(zip(instructions, args))
+               if instruction.opcode in JUMPS or instruction.opcode in COMPARE_JUMPS}
+    sizes = [_size(arg) for arg in args]
+    while True:
+        offsets = [0] * (len(instructions) + 1)
+        for index, size in enumerate(sizes):
+            offsets[index + 1] = offsets[index] + size
+        changed = False
+        for index, target in targets.items():
+            args[index] = retarget(instructions[index].opcode, args[index], offsets[target])
+            size = _size(args[index])
+            if size != sizes[index]:
+                sizes[index] = size
+                changed = True
+        if not changed:
+            break
+
+    code = array('H')
+    for instruction, arg, size in zip(instructions, args, sizes):
+        for shift in range(size - 1, 0, -1):
+            code.append(OpCode.EXTENDED_ARG)
+            code.append((arg >> (shift * ARG_BITS)) & ARG_MASK)
+        code.append(instruction.opcode)
+        code.append(arg & ARG_MASK)
+    return CodeObject(name, code, consts, names, params, varnames)
+
+def to_instructions(code: CodeObject) -> List[Instruction]:
+    """Unpack a CodeObject into Instructions whose jumps target instruction indices.
+
+    This is the inverse of assemble(), for passes that rewrite bytecode.
+    """
+    decoded = list(code.decode())
+    indices = {offset: index for index, (offset, _, _) in enumerate(decoded)}
+    indices[len(code)] = len(decoded)
+    instructions = []
+    for _, opcode, arg in decoded:
+        if opcode in JUMPS or opcode in COMPARE_JUMPS:
+            arg = retarget(opcode, arg, indices[jump_target(opcode, arg)])
+        instructions.append(Instruction(opcode, arg))
+    return instructions
+
+# Opcodes whose hand-written argument is a name rather than a table index
+NAME_OPS = frozenset((OpCode.LOAD_NAME, OpCode.STORE_NAME, OpCode.LOAD_GLOBAL))
+
+def from_instructions(instructions: Sequence[Instruction], name: str = "<module>") -> CodeObject:
+    """Build a CodeObject from instructions carrying literal arguments.
+
+    LOAD_CONST takes the constant itself, name opcodes the name and
+    LOAD_FAST/STORE_FAST the local's name; they are moved into the constant,
+    name and varnames tables.
+    """
+    consts: List[Any] = []
+    names: List[str] = []
+    varnames: List[str] = []
+    indexed = []
+    for instruction in instructions:
+        arg = instruction.arg
+        if instruction.opcode == OpCode.LOAD_CONST:
+            table = consts
+        elif instruction.opcode in NAME_OPS:
+            table = names
+        elif instruction.opcode in FAST_OPS:
+            table = varnames
+        else:
+            indexed.append(instruction)
+            continue
+        for index, entry in enumerate(table):
+            if entry.__class__ is arg.__class__ and entry == arg:
+                break
+        else:
+            index = len(table)
+            table.append(arg)
+        indexed.append(Instruction(instruction.opcode, index))
+    return assemble(indexed, consts, names, name, varnames=varnames)
+
+def _describe(code: CodeObject, opcode: OpCode, arg: int) -> str:
+    if opcode == OpCode.LOAD_CONST:
+        const = code.consts[arg]
+        return f"<code {const.name}>" if isinstance(const, CodeObject) else repr(const)
+    if opcode in NAME_OPS:
+        return code.names[arg]
+    if opcode in FAST_OPS:
+        return code.varnames[arg]
+    if opcode == OpCode.COMPARE_OP:
+        return COMPARE_OPS[arg]
+    if opcode in JUMPS:
+        return f"to {arg}"
+    if opcode in COMPARE_JUMPS:
+        return f"{COMPARE_OPS[arg & ((1 << COMPARE_BITS) - 1)]}, to {jump_target(opcode, arg)}"
+    if opcode in NAME_CONST_OPS:
+        name, const = unpack(arg)
+        return f"{code.names[name]}, {code.consts[const]!r}"
+    if opcode in FAST_CONST_OPS:
+        slot, const = unpack(arg)
+        return f"{code.varnames[slot]}, {code.consts[const]!r}"
+    return ""
+
+def disassemble(code: CodeObject, out: Optional[List[str]] = None) -> str:
+    """Human-readable listing of code and the functions nested in it"""
+    lines = [] if out is None else out
+    params = f"({', '.join(code.params)})" if code.params else ""
+    lines.append(f"Disassembly of {code.name}{params}:")
+    for offset, opcode, arg in code.decode():
+        description = _describe(code, opcode, arg)
+        lines.append(f"{offset:>6}  {opcode.name:<22}{arg:>6}" + (f"  ({description})" if description else ""))
+    for const in code.consts:
+        if isinstance(const, CodeObject):
+            lines.append("")
+            disassemble(const, lines)
+    return "\n".join(lines)
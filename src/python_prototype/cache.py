@@ -0,0 +1,103 @@
+# cache.py
+
+import hashlib
+import os
+import sys
+import tempfile
+from typing import Optional
+from .bytecode import CodeObject, OpCode
+from .compiler import COMPILER_VERSION, compile_code
+from .peephole import DEFAULT_OPTIMIZATION
+
+CACHE_DIRECTORY = "__mooncache__"
+CACHE_SUFFIX = ".mooncache"
+MAGIC = b"MOON"
+
+def _bytecode_version() -> bytes:
+    """Tag that changes with the compiler, the opcode set or the storage format"""
+    opcodes = ",".join(f"{opcode.name}={opcode.value}" for opcode in OpCode)
+    signature = f"{COMPILER_VERSION}:{sys.implementation.cache_tag}:{sys.byteorder}:{opcodes}"
+    return hashlib.sha256(signature.encode("utf-8")).digest()[:8]
+
+BYTECODE_VERSION = _bytecode_version()
+_HEADER_SIZE = len(MAGIC) + len(BYTECODE_VERSION) + hashlib.sha256().digest_size
+
+def source_hash(source: str) -> bytes:
+    return hashlib.sha256(source.encode("utf-8")).digest()
+
+def dumps(source: str, code: CodeObject) -> bytes:
+    """Serialise a code object into the .mooncache format.
+
+    A header of magic, bytecode version and source hash is followed by the
+    code object's own serialised form.
+    """
+    return MAGIC + BYTECODE_VERSION + source_hash(source) + code.dumps()
+
+def loads(data: bytes, source: str) -> Optional[CodeObject]:
+    """Deserialise cached bytecode, or return None if it does not match source"""
+    if (data[:len(MAGIC)] != MAGIC
+            or data[len(MAGIC):len(MAGIC) + len(BYTECODE_VERSION)] != BYTECODE_VERSION
+            or data[len(MAGIC) + len(BYTECODE_VERSION):_HEADER_SIZE] != source_hash(source)):
+        return None
+    try:
+        return CodeObject.loads(data[_HEADER_SIZE:])
+    except (EOFError, ValueError, TypeError):
+        return None  # Truncated or corrupt file
+
+class BytecodeCache:
+    """Compiled bytecode on disk, one .mooncache file per source text.
+
+    Files are named by the source's content hash, so identical scripts share
+    an entry; a stale or corrupt entry is recompiled and overwritten. Like
+    .opt-N.pyc files, non-default optimisation levels get their own entries.
+    """
+    def __init__(self, directory: str = CACHE_DIRECTORY, optimize: int = DEFAULT_OPTIMIZATION):
+        self.directory = directory
+        self.optimize = optimize
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, source: str) -> str:
+        tag = "" if self.optimize == DEFAULT_OPTIMIZATION else f".opt-{self.optimize}"
+        return os.path.join(self.directory, source_hash(source).hex() + tag + CACHE_SUFFIX)
+
+    def load(self, source: str) -> Optional[CodeObject]:
+        """Return the cached bytecode for source, or None"""
+        try:
+            with open(self.path(source), "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+        return loads(data, source)
+
+    def store(self, source: str, code: CodeObject) -> None:
+        """Write bytecode for source; failures only cost a later recompile"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(descriptor, "wb") as file:
+                    file.write(dumps(source, code))
+                os.replace(temporary, self.path(source))
+            except BaseException:
+                os.unlink(temporary)
+                raise
+        except (OSError, ValueError):
+            pass  # Unwritable directory, or constants marshal cannot store
+
+    def compile(self, source: str) -> CodeObject:
+        """Load bytecode for source from the cache, compiling it on a miss"""
+        code = self.load(source)
+        if code is not None:
+            self.hits += 1
+            return code
+        self.misses += 1
+        code = compile_code(source, self.optimize)
+        self.store(source, code)
+        return code
+
+def compile_file(path: str, optimize: int = DEFAULT_OPTIMIZATION) -> CodeObject:
+    """Compile a Moon script, caching its bytecode in __mooncache__ beside it"""
+    with open(path, encoding="utf-8") as file:
+        source = file.read()
+    return BytecodeCache(os.path.join(os.path.dirname(path), CACHE_DIRECTORY), optimize).compile(source)
@@ -0,0 +1,312 @@
+# closures.py
+
+import operator
+from typing import Any, Callable, Dict, List, Optional, Sequence, cast
+from .ast import AstNode
+from .stdlib import StdLib
+
+# A compiled node: call it to evaluate the node
+Closure = Callable[[], Any]
+
+# Value of a cell whose variable is not defined
+UNSET = object()
+
+def _divide(left: Any, right: Any) -> Any:
+    if right == 0:
+        raise ZeroDivisionError("Division by zero")
+    return left / right
+
+def _concat(left: Any, right: Any) -> str:
+    return str(left) + str(right)
+
+BINARY_FUNCTIONS: Dict[str, Callable[[Any, Any], Any]] = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": _divide,
+    "۩": _concat,  # Islamic concatenation
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+UNARY_FUNCTIONS: Dict[str, Callable[[Any], Any]] = {
+    "-": operator.neg,
+    "!": operator.not_,
+}
+
+class ReturnSignal(Exception):
+    """Raised by a Return to unwind to the call it returns from"""
+    def __init__(self, value: Any = None):
+        super().__init__()
+        self.value = value
+
+class Cell:
+    """Storage for one variable, shared by every closure that uses it"""
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value: Any = UNSET
+
+class CompiledFunction:
+    """A FunctionDef compiled to closures.
+
+    Parameters and assigned names get cells of their own, which a call
+    saves and clears on entry and restores on return, so recursive calls
+    do not see each other's locals.
+    """
+    __slots__ = ("node", "params", "locals", "body")
+
+    def __init__(self, node: AstNode, params: List[Cell], locals_: List[Cell], body: Closure):
+        self.node = node
+        self.params = params
+        self.locals = locals_
+        self.body = body
+
+class ClosureInterpreter:
+    """Runs ASTs with Interpreter's semantics by compiling them to closures first.
+
+    Each node becomes a Python closure specialised for it: number literals
+    are converted once, operators are picked once and identifiers are bound
+    to their variable's Cell. Evaluating the tree is then one call of the
+    root closure, with no dispatch on node types.
+    """
+    def __init__(self):
+        self.cells: Dict[str, Cell] = {}
+        # Cells of the function being compiled, by name; None at module level
+        self.local_cells: Optional[Dict[str, Cell]] = None
+        self.functions: Dict[str, AstNode] = {}
+        self.compiled: Dict[str, CompiledFunction] = {}
+        self.stdlib = StdLib()
+        # Changes whenever a function is (re)defined, invalidating call sites
+        self.version = 0
+
+    @property
+    def variables(self) -> Dict[str, Any]:
+        """The defined variables and their values"""
+        return {name: cell.value for name, cell in self.cells.items() if cell.value is not UNSET}
+
+    def interpret(self, node: AstNode) -> Optional[Any]:
+        """Compile and run an AST node"""
+        return self.compile(node)()
+
+    def cell(self, name: str) -> Cell:
+        if self.local_cells is not None and name in self.local_cells:
+            return self.local_cells[name]
+        return self.global_cell(name)
+
+    def global_cell(self, name: str) -> Cell:
+        cell = self.cells.get(name)
+        if cell is None:
+            cell = self.cells[name] = Cell()
+        return cell
+
+    def compile(self, node: AstNode) -> Closure:
+        """Compile an AST node to a closure"""
+        method = getattr(self, f'compile_{node.type.lower()}', None)
+        if method is None:
+            raise NotImplementedError(f"Node type '{node.type}' not implemented")
+        return method(node)
+
+    def compile_sequence(self, nodes: Sequence[AstNode]) -> Closure:
+        """Run nodes in order, giving the last one's value"""
+        statements = tuple(self.compile(node) for node in nodes)
+        if not statements:
+            return lambda: None
+        if len(statements) == 1:
+            return statements[0]
+
+        def sequence() -> Any:
+            result = None
+            for statement in statements:
+                result = statement()
+            return result
+        return sequence
+
+    def compile_top_level(self, nodes: Sequence[AstNode]) -> Closure:
+        """Run nodes in order; a Return ends them with its value"""
+        sequence = self.compile_sequence(nodes)
+
+        def top_level() -> Any:
+            try:
+                return sequence()
+            except ReturnSignal as signal:
+                return signal.value
+        return top_level
+
+    def compile_program(self, node: AstNode) -> Closure:
+        return self.compile_top_level(node.children)
+
+    def compile_entrypoint(self, node: AstNode) -> Closure:
+        return self.compile_top_level(node.children)
+
+    def compile_block(self, node: AstNode) -> Closure:
+        return self.compile_sequence(node.children)
+
+    def compile_number(self, node: AstNode) -> Closure:
+        value = float(cast(str, node.value))
+        return lambda: value
+
+    def compile_string(self, node: AstNode) -> Closure:
+        value = str(cast(str, node.value))
+        return lambda: value
+
+    def compile_identifier(self, node: AstNode) -> Closure:
+        name = cast(str, node.value)
+        cell = self.cell(name)
+        # A local read before it is assigned falls back to the global
+        fallback = self.global_cell(name)
+
+        def identifier() -> Any:
+            value = cell.value
+            if value is UNSET:
+                value = fallback.value
+                if value is UNSET:
+                    raise NameError(f"Variable '{name}' is not defined")
+            return value
+        return identifier
+
+    def compile_binaryop(self, node: AstNode) -> Closure:
+        op = cast(str, node.value)
+        left = self.compile(node.children[0])
+        right = self.compile(node.children[1])
+
+        # Logical operators short-circuit
+        if op == "&&":
+            return lambda: right() if (value := left()) else value
+        if op == "||":
+            return lambda: value if (value := left()) else right()
+
+        if op not in BINARY_FUNCTIONS:
+            raise NotImplementedError(f"Operator '{op}' not implemented")
+        function = BINARY_FUNCTIONS[op]
+
+        if node.children[1].type == "Number":
+            constant = float(cast(str, node.children[1].value))
+
+            def binary_constant() -> Any:
+                value = left()
+                if value is None:
+                    raise ValueError("Cannot perform operation on None values")
+                return function(value, constant)
+            return binary_constant
+
+        def binary() -> Any:
+            first = left()
+            second = right()
+            if first is None or second is None:
+                raise ValueError("Cannot perform operation on None values")
+            return function(first, second)
+        return binary
+
+    def compile_unaryop(self, node: AstNode) -> Closure:
+        if node.value not in UNARY_FUNCTIONS:
+            raise NotImplementedError(f"Operator '{node.value}' not implemented")
+        function = UNARY_FUNCTIONS[cast(str, node.value)]
+        operand = self.compile(node.children[0])
+        return lambda: function(operand())
+
+    def compile_return(self, node: AstNode) -> Closure:
+        value = self.compile(node.children[0]) if node.children else lambda: None
+
+        def return_() -> Any:
+            raise ReturnSignal(value())
+        return return_
+
+    def compile_assignment(self, node: AstNode) -> Closure:
+        cell = self.cell(cast(str, node.value))
+        value = self.compile(node.children[0])
+
+        def assignment() -> Any:
+            result = cell.value = value()
+            return result
+        return assignment
+
+    def compile_if(self, node: AstNode) -> Closure:
+        condition = self.compile(node.children[0])
+        then = self.compile(node.children[1])
+        otherwise = self.compile(node.children[2]) if len(node.children) > 2 else lambda: None
+        return lambda: then() if condition() else otherwise()
+
+    def compile_while(self, node: AstNode) -> Closure:
+        condition = self.compile(node.children[0])
+        body = self.compile_sequence(node.children[1:])
+
+        def loop() -> None:
+            while condition():
+                body()
+        return loop
+
+    def compile_functiondef(self, node: AstNode) -> Closure:
+        name = cast(str, node.value)
+        local_cells: Dict[str, Cell] = {}
+        for local in list(node.params) + self.assigned_names(node.children):
+            if local not in local_cells:
+                local_cells[local] = Cell()
+        params = [local_cells[param] for param in node.params]
+
+        enclosing = self.local_cells
+        self.local_cells = local_cells
+        try:
+            body = self.compile_sequence(node.children)
+        finally:
+            self.local_cells = enclosing
+        function = CompiledFunction(node, params, list(local_cells.values()), body)
+
+        def define() -> None:
+            self.functions[name] = node
+            self.compiled[name] = function
+            self.version += 1
+        return define
+
+    def assigned_names(self, nodes: Sequence[AstNode]) -> List[str]:
+        """Names assigned by nodes, outside nested function definitions"""
+        names: List[str] = []
+        pending = list(reversed(nodes))
+        while pending:
+            node = pending.pop()
+            if node.type == "Assignment":
+                names.append(cast(str, node.value))
+            if node.type != "FunctionDef":
+                pending.extend(reversed(node.children))
+        return names
+
+    def compile_functioncall(self, node: AstNode) -> Closure:
+        name = cast(str, node.value)
+        args = tuple(self.compile(arg) for arg in node.children)
+        stdlib = self.stdlib
+        # Inline cache: (version, stdlib callable, compiled function)
+        site: List[Any] = [-1, None, None]
+
+        def call() -> Any:
+            if site[0] != self.version:
+                if hasattr(stdlib, name):
+                    site[1:] = [getattr(stdlib, name), None]
+                elif name in self.compiled:
+                    site[1:] = [None, self.compiled[name]]
+                else:
+                    raise NameError(f"Function '{name}' is not defined")
+                site[0] = self.version
+            if site[1] is not None:
+                return site[1](*[arg() for arg in args])
+            return call_function(site[2])
+
+        def call_function(function: CompiledFunction) -> Any:
+            # Arguments are evaluated with the caller's locals still bound
+            values = [arg() for arg in args]
+            saved = [cell.value for cell in function.locals]
+            for cell in function.locals:
+                cell.value = UNSET
+            for cell, value in zip(function.params, values):
+                cell.value = value
+            try:
+                return function.body()
+            except ReturnSignal as signal:
+                return signal.value
+            finally:
+                for cell, value in zip(function.locals, saved):
+                    cell.value = value
+        return call
@@ -2,35 +2,125 @@
 
 from typing import List, Tuple, Dict, Any, Optional
 from dataclasses import dataclass, field
-from .vm import Instruction, OpCode
-from .parser import parse
-from .lexer import tokenize, Token
-from .ast import AstNode
-from .error import raise_syntax_error
+from .bytecode import COMPARE_OPS, CodeObject, Instruction, OpCode, assemble
+from .ast import AstNode, node_key
+from .error import CompilerError, raise_syntax_error
+from .peephole import DEFAULT_OPTIMIZATION, optimize_code
+from .semantic import NUMBER, STRING, SemanticAnalyzer, SymbolTable, TypeInference
+
+# Bump whenever the compiler's output changes for the same source, so stale
+# .mooncache files are recompiled
+COMPILER_VERSION = 7
+
+# Node types that leave a value on the stack; as statements it is discarded
+EXPRESSIONS = frozenset(("Number", "String", "Identifier", "BinaryOp", "UnaryOp", "FunctionCall"))
+
+BINARY_OPCODES = {
+    "+": OpCode.BINARY_ADD,
+    "-": OpCode.BINARY_SUBTRACT,
+    "*": OpCode.BINARY_MULTIPLY,
+    "/": OpCode.BINARY_DIVIDE,
+    "۩": OpCode.BINARY_CONCAT,  # Islamic concatenation
+}
+
+# Opcodes for operators whose operands both have one inferred type; the VM
+# checks the types, falling back on the opcodes above
+SPECIALISED_OPCODES = {
+    ("+", NUMBER): OpCode.BINARY_ADD_FLOAT,
+    ("۩", STRING): OpCode.CONCAT_STR,
+}
+
+UNARY_OPCODES = {
+    "-": OpCode.UNARY_NEGATIVE,
+    "!": OpCode.UNARY_NOT,
+}
 
 @dataclass
 class CompilerContext:
     constants: List[Any] = field(default_factory=list)
     names: List[str] = field(default_factory=list)
     instructions: List[Instruction] = field(default_factory=list)
+    varnames: List[str] = field(default_factory=list)
+    # Table indices by entry; constants are keyed by type too, so 1.0 and True stay apart
+    constant_indices: Dict[Tuple[type, Any], int] = field(default_factory=dict)
+    name_indices: Dict[str, int] = field(default_factory=dict)
     
     def add_constant(self, value: Any) -> int:
         """Add a constant and return its index"""
-        if value in self.constants:
-            return self.constants.index(value)
-        self.constants.append(value)
-        return len(self.constants) - 1
+        key = (value.__class__, value)
+        index = self.constant_indices.get(key)
+        if index is None:
+            index = self.constant_indices[key] = len(self.constants)
+            self.constants.append(value)
+        return index
     
     def add_name(self, name: str) -> int:
         """Add a name and return its index"""
-        if name in self.names:
-            return self.names.index(name)
-        self.names.append(name)
-        return len(self.names) - 1
+        index = self.name_indices.get(name)
+        if index is None:
+            index = self.name_indices[name] = len(self.names)
+            self.names.append(name)
+        return index
+    
+    def emit(self, opcode: OpCode, arg: Any = None) -> Instruction:
+        """Append an instruction and return it, so jumps can be patched"""
+        instruction = Instruction(opcode, arg)
+        self.instructions.append(instruction)
+        return instruction
+    
+    def label(self) -> int:
+        """Index of the next instruction, as a jump target"""
+        return len(self.instructions)
+    
+    def to_code(self, name: str = "<module>", params: Tuple[str, ...] = ()) -> CodeObject:
+        """Pack the instructions and tables into a CodeObject"""
+        return assemble(self.instructions, self.constants, self.names, name, params, self.varnames)
 
 class Compiler:
-    def __init__(self):
+    def __init__(self, scope: Optional[SymbolTable] = None, analyzer: Optional[SemanticAnalyzer] = None,
+                 types: Optional[TypeInference] = None):
         self.context = CompilerContext()
+        # A function's locals, each with a slot; None for module-level code,
+        # whose variables are all globals
+        self.scope = scope
+        # Set when the tree has been analyzed, whose function scopes are then
+        # used as they are instead of being worked out again
+        self.analyzer = analyzer
+        # Set when types have been inferred for the tree, to specialise operators
+        self.types = types
+    
+    def declare(self, name: str) -> None:
+        """Give a local variable the next free slot"""
+        if name not in self.scope.symbols:
+            self.scope.define(name, "Any", slot=len(self.context.varnames))
+            self.context.varnames.append(name)
+    
+    def declare_locals(self, nodes: List[AstNode]) -> None:
+        """Declare every name assigned in a function body, outside nested functions"""
+        pending = list(reversed(nodes))
+        while pending:
+            node = pending.pop()
+            if node.type in ("Assignment", "FunctionDef"):
+                self.declare(node.value)
+            if node.type != "FunctionDef":
+                pending.extend(reversed(node.children))
+    
+    def load(self, name: str) -> None:
+        if self.scope is None:
+            # Module-level code rebinds globals too often for LOAD_GLOBAL's cache
+            self.context.emit(OpCode.LOAD_NAME, self.context.add_name(name))
+            return
+        symbol = self.scope.symbols.get(name)
+        if symbol is None:
+            self.context.emit(OpCode.LOAD_GLOBAL, self.context.add_name(name))
+        else:
+            self.context.emit(OpCode.LOAD_FAST, symbol.slot)
+    
+    def store(self, name: str) -> None:
+        if self.scope is None:
+            self.context.emit(OpCode.STORE_NAME, self.context.add_name(name))
+        else:
+            self.context.emit(OpCode.STORE_FAST, self.scope.symbols[name].slot)
     
     def compile(self, node: AstNode) -> None:
         """Compile an AST node"""
@@ -39,55 +129,177 @@ class Compiler:
             raise_syntax_error(f"Cannot compile node type: {node.type}")
         method(node)
     
+    def compile_statement(self, node: AstNode) -> None:
+        """Compile a node in statement position, discarding any value"""
+        self.compile(node)
+        if node.type in EXPRESSIONS:
+            self.context.emit(OpCode.POP_TOP)
+    
+    def compile_body(self, nodes: List[AstNode]) -> None:
+        for node in nodes:
+            self.compile_statement(node)
+    
+    def compile_result(self, nodes: List[AstNode]) -> None:
+        """Compile a function's statements, returning the value of the last one
+        run as the interpreters do: an expression or assignment gives its value,
+        an If its branch's, anything else None"""
+        self.compile_body(nodes[:-1])
+        last = nodes[-1] if nodes else None
+        if last is not None and last.type == "Block":
+            self.compile_result(last.children)
+            return
+        if last is not None and last.type == "If":
+            self.compile(last.children[0])
+            skip_then = self.context.emit(OpCode.POP_JUMP_IF_FALSE)
+            self.compile_result(last.children[1:2])
+            skip_then.arg = self.context.label()
+            self.compile_result(last.children[2:])
+            return
+        if last is not None and last.type in EXPRESSIONS:
+            self.compile(last)
+        elif last is not None and last.type == "Assignment":
+            self.compile(last)
+            self.load(last.value)
+        else:
+            if last is not None:
+                self.compile_statement(last)
+            self.context.emit(OpCode.LOAD_CONST, self.context.add_constant(None))
+        self.context.emit(OpCode.RETURN_VALUE)
+    
     def compile_program(self, node: AstNode) -> None:
         """Compile a program node"""
-        for child in node.children:
-            self.compile(child)
+        self.compile_body(node.children)
+    
+    def compile_entrypoint(self, node: AstNode) -> None:
+        """The entry point's statements run in the module frame"""
+        self.compile_body(node.children)
+    
+    def compile_block(self, node: AstNode) -> None:
+        self.compile_body(node.children)
+    
+    def compile_functiondef(self, node: AstNode) -> None:
+        """Compile the body into a nested code object bound to the function's name"""
+        scope = self.analyzer.scopes.get(node_key(node)) if self.analyzer is not None else None
+        if scope is None:
+            compiler = Compiler(SymbolTable())
+            for param in node.params:
+                compiler.declare(param)
+            compiler.declare_locals(node.children)
+        else:
+            compiler = Compiler(scope, self.analyzer, self.types)
+            compiler.context.varnames = sorted(scope.symbols, key=lambda name: scope.symbols[name].slot)
+        compiler.compile_result(node.children)
+        code = compiler.context.to_code(node.value, tuple(node.params))
+        
+        self.context.emit(OpCode.LOAD_CONST, self.context.add_constant(code))
+        self.context.emit(OpCode.MAKE_FUNCTION)
+        self.store(node.value)
+    
+    def compile_assignment(self, node: AstNode) -> None:
+        self.compile(node.children[0])
+        self.store(node.value)
+    
+    def compile_if(self, node: AstNode) -> None:
+        """Compile If(condition, Block then, [Block else])"""
+        self.compile(node.children[0])
+        skip_then = self.context.emit(OpCode.POP_JUMP_IF_FALSE)
+        self.compile(node.children[1])
+        if len(node.children) > 2:
+            skip_else = self.context.emit(OpCode.JUMP_ABSOLUTE)
+            skip_then.arg = self.context.label()
+            self.compile(node.children[2])
+            skip_else.arg = self.context.label()
+        else:
+            skip_then.arg = self.context.label()
+    
+    def compile_while(self, node: AstNode) -> None:
+        loop = self.context.label()
+        self.compile(node.children[0])
+        exit_loop = self.context.emit(OpCode.POP_JUMP_IF_FALSE)
+        self.compile_body(node.children[1:])
+        self.context.emit(OpCode.JUMP_ABSOLUTE, loop)
+        exit_loop.arg = self.context.label()
+    
+    def compile_return(self, node: AstNode) -> None:
+        if node.children:
+            self.compile(node.children[0])
+        else:
+            self.context.emit(OpCode.LOAD_CONST, self.context.add_constant(None))
+        self.context.emit(OpCode.RETURN_VALUE)
     
     def compile_number(self, node: AstNode) -> None:
         """Compile a number literal"""
         const_index = self.context.add_constant(float(node.value))
-        self.context.instructions.append(
-            Instruction(OpCode.LOAD_CONST, const_index)
-        )
+        self.context.emit(OpCode.LOAD_CONST, const_index)
     
     def compile_string(self, node: AstNode) -> None:
         """Compile a string literal"""
         const_index = self.context.add_constant(str(node.value))
-        self.context.instructions.append(
-            Instruction(OpCode.LOAD_CONST, const_index)
-        )
+        self.context.emit(OpCode.LOAD_CONST, const_index)
+    
+    def compile_identifier(self, node: AstNode) -> None:
+        self.load(node.value)
+    
+    def compile_functioncall(self, node: AstNode) -> None:
+        self.load(node.value)
+        for arg in node.children:
+            self.compile(arg)
+        self.context.emit(OpCode.CALL_FUNCTION, len(node.children))
+    
+    def compile_unaryop(self, node: AstNode) -> None:
+        if node.value not in UNARY_OPCODES:
+            raise_syntax_error(f"Unknown operator: {node.value}")
+        self.compile(node.children[0])
+        self.context.emit(UNARY_OPCODES[node.value])
     
     def compile_binaryop(self, node: AstNode) -> None:
         """Compile a binary operation"""
+        if node.value in ("&&", "||"):
+            # Short-circuit: keep the left operand if it decides the result
+            self.compile(node.children[0])
+            opcode = OpCode.JUMP_IF_FALSE_OR_POP if node.value == "&&" else OpCode.JUMP_IF_TRUE_OR_POP
+            jump = self.context.emit(opcode)
+            self.compile(node.children[1])
+            jump.arg = self.context.label()
+            return
+        
         self.compile(node.children[0])
         self.compile(node.children[1])
         
-        op_map = {
-            "+": OpCode.BINARY_ADD,
-            "-": OpCode.BINARY_SUBTRACT,
-            "*": OpCode.BINARY_MULTIPLY,
-            "/": OpCode.BINARY_DIVIDE,
-            "۩": OpCode.BINARY_ADD  # Islamic concatenation uses add
-        }
-        
-        if node.value not in op_map:
+        if node.value in COMPARE_OPS:
+            self.context.emit(OpCode.COMPARE_OP, COMPARE_OPS.index(node.value))
+        elif node.value in BINARY_OPCODES:
+            opcode = BINARY_OPCODES[node.value]
+            if self.types is not None:
+                left, right = (self.types.type_of(child) for child in node.children)
+                if left == right:
+                    opcode = SPECIALISED_OPCODES.get((node.value, left), opcode)
+            self.context.emit(opcode)
+        else:
             raise_syntax_error(f"Unknown operator: {node.value}")
-            
-        self.context.instructions.append(
-            Instruction(op_map[node.value])
-        )
     
-    def get_code(self) -> List[Instruction]:
+    def get_code(self) -> CodeObject:
         """Get the compiled bytecode"""
-        return self.context.instructions
+        return self.context.to_code()
 
-def compile_code(source: str) -> List[Instruction]:
-    """Compile source code into VM instructions"""
-    tokens = tokenize(source)
-    ast = parse(tokens)
-    
-    compiler = Compiler()
-    compiler.compile(ast)
+def compile_code(source: str, optimize: int = DEFAULT_OPTIMIZATION) -> CodeObject:
+    """Compile source code into a code object, then run the peephole optimiser"""
+    # The front-end is imported here so that loading cached bytecode never
+    # pays for it
+    from .lexer import tokenize
+    from .parser import parse
     
-    return compiler.get_code()
+    tree = parse(tokenize(source))
+    analyzer = SemanticAnalyzer()
+    try:
+        analyzer.analyze(tree)
+    except CompilerError:
+        # What the analyzer rejects is left to fail at run time, as it
+        # always was, just unspecialised
+        compiler = Compiler()
+    else:
+        types = TypeInference(analyzer)
+        types.infer(tree)
+        compiler = Compiler(analyzer=analyzer, types=types)
+    compiler.compile(tree)
+    return optimize_code(compiler.get_code(), optimize)
@@ -0,0 +1,207 @@
+# incremental.py
+
+from typing import Iterator, List, Optional, Sequence, Tuple
+from .error import CompilerError
+from .lexer import Token, TokenBuffer, TokenType, tokenize
+from .ast import AstNode
+from .parser import Parser
+
+# Tokens that open a top-level item. Blocks have no closing token, so every
+# item runs up to the next one of these and can be lexed and parsed alone.
+SEGMENT_STARTS = (TokenType.DEF, TokenType.ENTRY_POINT)
+
+# Tokens that may continue into the text that follows them
+OPEN_ENDED = frozenset((TokenType.NUMBER, TokenType.STRING, TokenType.IDENTIFIER, TokenType.IF,
+                        TokenType.ELSE, TokenType.WHILE, TokenType.RETURN, TokenType.DEF))
+
+class Segment:
+    """A top-level item of a document: its source text, tokens and AST nodes.
+
+    Token positions are relative to the segment, so segments after an edit
+    are reused without being touched.
+    """
+    __slots__ = ("text", "length", "tokens", "nodes", "error")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.length = len(text)
+        self.nodes: List[AstNode] = []
+        self.error: Optional[CompilerError] = None
+        self.tokens = TokenBuffer()
+        try:
+            self.tokens = tokenize(text)
+            self.nodes = Parser(self.tokens).parse().children
+        except CompilerError as e:
+            self.error = e
+
+class PrefixSums:
+    """Fenwick tree giving O(log n) prefix sums over per-segment sizes"""
+    def __init__(self, values: Sequence[int]):
+        self.size = len(values)
+        self.tree = [0] * (self.size + 1)
+        for index, value in enumerate(values, 1):
+            self.tree[index] += value
+            parent = index + (index & -index)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[index]
+
+    def add(self, index: int, delta: int) -> None:
+        """Add delta to the value at index"""
+        index += 1
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index: int) -> int:
+        """Sum of the values before index"""
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def find(self, offset: int) -> int:
+        """Index of the value whose running range contains offset"""
+        index = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            candidate = index + step
+            if candidate <= self.size and self.tree[candidate] <= offset:
+                index = candidate
+                offset -= self.tree[candidate]
+            step >>= 1
+        return min(index, self.size - 1)
+
+def _split(text: str, tokens: TokenBuffer) -> List[int]:
+    """Offsets in text where top-level items begin, always including 0"""
+    offsets = [0]
+    for code, start in zip(tokens.types, tokens.starts):
+        if code in SEGMENT_STARTS and start:
+            offsets.append(start)
+    return offsets
+
+class IncrementalDocument:
+    """An edited source buffer that is re-lexed and re-parsed incrementally.
+
+    An edit only re-lexes and re-parses the top-level FunctionDef/EntryPoint
+    items it touches; the AstNodes of all other items are reused as they are.
+    """
+    def __init__(self, source: str):
+        self.segments: List[Segment] = []
+        self.ast = AstNode("Program")
+        self.length = len(source)
+        self._source: Optional[str] = source
+        self._lengths = PrefixSums([])
+        self._counts = PrefixSums([])
+        self._replace(0, 0, source, tokenize(source))
+
+    @property
+    def source(self) -> str:
+        """The current document text, joined from the segments on demand"""
+        if self._source is None:
+            self._source = "".join(segment.text for segment in self.segments)
+        return self._source
+
+    def _replace(self, first: int, last: int, text: str, tokens: TokenBuffer) -> List[Segment]:
+        """Replace segments[first:last] with segments lexed from text"""
+        offsets = _split(text, tokens) if text else []
+        offsets.append(len(text))
+        segments = [Segment(text[begin:end]) for begin, end in zip(offsets, offsets[1:])]
+
+        index = self._counts.prefix(first)
+        removed = sum(len(segment.nodes) for segment in self.segments[first:last])
+        self.ast.children[index:index + removed] = [node for segment in segments for node in segment.nodes]
+        old = self.segments[first:last]
+        self.segments[first:last] = segments
+
+        if len(segments) == len(old):
+            for offset, (before, after) in enumerate(zip(old, segments)):
+                self._lengths.add(first + offset, after.length - before.length)
+                self._counts.add(first + offset, len(after.nodes) - len(before.nodes))
+        else:
+            self._lengths = PrefixSums([segment.length for segment in self.segments])
+            self._counts = PrefixSums([len(segment.nodes) for segment in self.segments])
+        return segments
+
+    def start(self, index: int) -> int:
+        """Source offset of segment index"""
+        return self._lengths.prefix(index)
+
+    def edit(self, offset: int, removed: int, inserted: str) -> int:
+        """Replace removed characters at offset with inserted text.
+
+        Returns the number of top-level segments that were re-parsed.
+        """
+        end = offset + removed
+        if offset < 0 or removed < 0 or end > self.length:
+            raise ValueError(f"Edit range {offset}:{end} outside document of length {self.length}")
+
+        segments = self.segments
+        count = len(segments)
+        first = self._lengths.find(offset) if count else 0
+        if first and self.start(first) == offset:
+            first -= 1  # The edit may glue onto the previous segment's last token
+        last = self._lengths.find(end) + 1 if count else 0
+        start = self.start(first)
+        text = "".join(segment.text for segment in segments[first:last])
+        text = text[:offset - start] + inserted + text[end - start:]
+
+        # Grow the damaged region until it starts with a top-level item and its
+        # last token cannot run on into the next segment (e.g. an identifier
+        # glued to "def", or an unterminated string)
+        while True:
+            tokens = tokenize(text)
+            if first and (not tokens or tokens.types[0] not in SEGMENT_STARTS or tokens.starts[0]):
+                first -= 1
+                text = segments[first].text + text
+            elif (last < count and tokens and tokens.ends[-1] == len(text)
+                    and tokens.types[-1] in OPEN_ENDED):
+                text += segments[last].text
+                last += 1
+            else:
+                break
+
+        self.length += len(inserted) - removed
+        self._source = None
+        return len(self._replace(first, last, text, tokens))
+
+    def _positions(self) -> Iterator[Tuple[Segment, int, int, int]]:
+        """Yield each segment with its start offset, line and column"""
+        start = 0
+        line = 1
+        column = 1
+        for segment in self.segments:
+            yield segment, start, line, column
+            text = segment.text
+            newlines = text.count("\n")
+            if newlines:
+                line += newlines
+                column = len(text) - text.rindex("\n")
+            else:
+                column += len(text)
+            start += len(text)
+
+    @property
+    def errors(self) -> List[CompilerError]:
+        """Syntax errors of all segments, with document positions"""
+        errors = []
+        for segment, _, line, column in self._positions():
+            error = segment.error
+            if error is None:
+                continue
+            if error.line and error.column:
+                error = CompilerError(error.error_type, error.message, line + error.line - 1,
+                                      error.column + (column - 1 if error.line == 1 else 0))
+            errors.append(error)
+        return errors
+
+    def tokens(self) -> Iterator[Token]:
+        """Yield the document's tokens with document positions"""
+        for segment, start, line, column in self._positions():
+            for token in segment.tokens:
+                token.start += start
+                token.end += start
+                if token.line == 1:
+                    token.column += column - 1
+                token.line += line - 1
+                yield token
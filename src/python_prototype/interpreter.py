@@ -1,27 +1,43 @@
 # interpreter.py
 
-from typing import Any, Dict, Optional, Union, cast
+import itertools
+from typing import Any, Callable, Dict, Optional, Tuple, Union, cast
 from .ast import AstNode
+from .scope import Scope
 from .stdlib import StdLib
 
+# A FunctionCall node's cache entry: (version, stdlib callable, user FunctionDef)
+CallSite = Tuple[int, Optional[Callable[..., Any]], Optional[AstNode]]
+
+# Shared by all interpreters, so a version identifies one set of definitions
+# even when several interpreters run the same tree
+_versions = itertools.count(1)
+
 class Interpreter:
     def __init__(self):
-        self.variables: Dict[str, Any] = {}
+        self.globals = Scope()
+        self.variables: Dict[str, Any] = self.globals.variables
+        # Each call gets a scope holding only the callee's parameters and
+        # locals, whose parent is the globals
+        self.scope = self.globals
+        # Set by a Return until its call is reached; statement sequences
+        # stop as soon as they see it
+        self.returning = False
         self.functions: Dict[str, AstNode] = {}
         self.stdlib = StdLib()
+        # Changes whenever a function is (re)defined, invalidating call sites
+        self.version = next(_versions)
         
     def interpret(self, node: AstNode) -> Optional[Any]:
         """Interpret an AST node"""
-        if node.type == "Program":
-            result = None
-            for child in node.children:
-                result = self.interpret(child)
-            return result
-            
-        elif node.type == "EntryPoint":
+        if node.type == "Program" or node.type == "EntryPoint":
             result = None
             for child in node.children:
                 result = self.interpret(child)
+                if self.returning:
+                    # A top-level Return ends the program with its value
+                    self.returning = False
+                    break
             return result
             
         elif node.type == "Number":
@@ -32,14 +48,22 @@ class Interpreter:
             
         elif node.type == "Identifier":
             name = cast(str, node.value)
-            if name in self.variables:
-                return self.variables[name]
-            raise NameError(f"Variable '{name}' is not defined")
+            variables = self.scope.variables
+            if name in variables:
+                return variables[name]
+            return self.scope.get(name)
             
         elif node.type == "BinaryOp":
+            op = cast(str, node.value)
             left = self.interpret(node.children[0])
+            
+            # Logical operators short-circuit
+            if op == "&&":
+                return self.interpret(node.children[1]) if left else left
+            elif op == "||":
+                return left if left else self.interpret(node.children[1])
+            
             right = self.interpret(node.children[1])
-            op = cast(str, node.value)
             
             if left is None or right is None:
                 raise ValueError("Cannot perform operation on None values")
@@ -56,46 +80,105 @@ class Interpreter:
                 return left / right
             elif op == "۩":  # Islamic concatenation
                 return str(left) + str(right)
+            elif op == "==":
+                return left == right
+            elif op == "!=":
+                return left != right
+            elif op == "<":
+                return left < right
+            elif op == "<=":
+                return left <= right
+            elif op == ">":
+                return left > right
+            elif op == ">=":
+                return left >= right
+            
+        elif node.type == "Block":
+            result = None
+            for child in node.children:
+                result = self.interpret(child)
+                if self.returning:
+                    break
+            return result
+            
+        elif node.type == "If":
+            if self.interpret(node.children[0]):
+                return self.interpret(node.children[1])
+            if len(node.children) > 2:
+                return self.interpret(node.children[2])
+            return None
+            
+        elif node.type == "While":
+            condition = node.children[0]
+            body = node.children[1:]
+            while self.interpret(condition):
+                for statement in body:
+                    result = self.interpret(statement)
+                    if self.returning:
+                        return result
+            return None
+            
+        elif node.type == "UnaryOp":
+            operand = self.interpret(node.children[0])
+            if node.value == "-":
+                return -operand
+            elif node.value == "!":
+                return not operand
                 
         elif node.type == "Assignment":
             name = cast(str, node.value)
-            value = self.interpret(node.children[1])
-            self.variables[name] = value
+            value = self.interpret(node.children[0])
+            self.scope.variables[name] = value
+            return value
+            
+        elif node.type == "Return":
+            value = self.interpret(node.children[0]) if node.children else None
+            self.returning = True
             return value
             
         elif node.type == "FunctionDef":
             name = cast(str, node.value)
             self.functions[name] = node
+            self.version = next(_versions)
             return None
             
         elif node.type == "FunctionCall":
-            name = cast(str, node.value)
-            if hasattr(self.stdlib, name):
-                func = getattr(self.stdlib, name)
-                args = [self.interpret(arg) for arg in node.children]
-                return func(*args)
-            elif name in self.functions:
-                func_node = self.functions[name]
-                return self.call_function(func_node, node.children)
-            else:
-                raise NameError(f"Function '{name}' is not defined")
+            site = node.cache
+            if site is None or site[0] != self.version:
+                site = node.cache = self.resolve_call(node)
+            func = site[1]
+            if func is not None:
+                return func(*[self.interpret(arg) for arg in node.children])
+            return self.call_function(cast(AstNode, site[2]), node.children)
         
         raise NotImplementedError(f"Node type '{node.type}' not implemented")
     
+    def resolve_call(self, node: AstNode) -> CallSite:
+        """Look up the callee of a FunctionCall, for its inline cache"""
+        name = cast(str, node.value)
+        if hasattr(self.stdlib, name):
+            return (self.version, getattr(self.stdlib, name), None)
+        elif name in self.functions:
+            return (self.version, None, self.functions[name])
+        raise NameError(f"Function '{name}' is not defined")
+    
     def call_function(self, func_node: AstNode, args: list) -> Any:
-        """Execute a function call"""
-        # Save current scope
-        old_variables = self.variables.copy()
+        """Execute a function call in a new scope.
         
-        # Bind parameters to arguments
-        for param, arg in zip(func_node.params, args):
-            self.variables[param] = self.interpret(arg)
-            
-        # Execute function body
-        result = None
-        for statement in func_node.children:
-            result = self.interpret(statement)
-            
-        # Restore scope
-        self.variables = old_variables
-        return result
+        Arguments are evaluated in the caller's scope before the new one is
+        entered. The result is the value of a Return, or else of the last
+        statement run.
+        """
+        values = [self.interpret(arg) for arg in args]
+        caller = self.scope
+        self.scope = Scope(dict(zip(func_node.params, values)), self.globals)
+        try:
+            result = None
+            for statement in func_node.children:
+                result = self.interpret(statement)
+                if self.returning:
+                    self.returning = False
+                    break
+            return result
+        finally:
+            self.scope = caller
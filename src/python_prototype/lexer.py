@@ -1,10 +1,16 @@
 # lexer.py
 
-from enum import Enum, auto
-from dataclasses import dataclass
-from typing import List, Any
+import codecs
+import re
+import sys
+from array import array
+from enum import IntEnum, auto
+from collections import deque
+from typing import Any, Deque, IO, Iterable, Iterator, List, Optional, Sequence, Tuple, Union, cast
+from .symbols import IslamicSymbols
+from .error import raise_syntax_error
 
-class TokenType(Enum):
+class TokenType(IntEnum):
     NUMBER = auto()
     STRING = auto()
     IDENTIFIER = auto()
@@ -29,84 +35,316 @@ class TokenType(Enum):
     GET_ITER = auto()
     POP_JUMP_IF_FALSE = auto()
     COMMA = auto()  # Added missing COMMA token
+    END_STATEMENT = auto()
+    EQUAL_EQUAL = auto()
+    BANG_EQUAL = auto()
+    LESS = auto()
+    LESS_EQUAL = auto()
+    GREATER = auto()
+    GREATER_EQUAL = auto()
+    AND = auto()
+    OR = auto()
 
-@dataclass
 class Token:
-    type: TokenType
-    value: Any
-
-def tokenize(code: str) -> List[Token]:
-    """Tokenizes input code into a list of tokens"""
-    keywords = {
-        'if': TokenType.IF,
-        'else': TokenType.ELSE,
-        'while': TokenType.WHILE,
-        'return': TokenType.RETURN,
-        'def': TokenType.DEF,
-    }
-    
-    tokens = []
-    i = 0
-    
-    while i < len(code):
-        char = code[i]
-        
-        if char.isspace():
-            i += 1
-            continue
-        
-        if char.isdigit():
-            num = ""
-            while i < len(code) and (code[i].isdigit() or code[i] == '.'):
-                num += code[i]
-                i += 1
-            tokens.append(Token(TokenType.NUMBER, float(num)))
-            continue
-            
-        elif char == '"' or char == "'":
-            string = ""
-            quote = char
-            i += 1
-            while i < len(code) and code[i] != quote:
-                string += code[i]
-                i += 1
-            i += 1  # Skip closing quote
-            tokens.append(Token(TokenType.STRING, string))
-            continue
-            
-        elif char.isalpha():
-            ident = ""
-            while i < len(code) and (code[i].isalnum() or code[i] == "_"):
-                ident += code[i]
-                i += 1
-            # Check if it's a keyword
-            token_type = keywords.get(ident, TokenType.IDENTIFIER)
-            tokens.append(Token(token_type, ident))
+    """A lexed token with its source span.
+    
+    Positions are 1-based line/column plus 0-based character offsets; they do
+    not take part in equality, so tokens compare by type and value.
+    """
+    __slots__ = ("type", "value", "start", "end", "line", "column")
+    
+    def __init__(self, type: TokenType, value: Any, start: int = 0, end: int = 0,
+                 line: Optional[int] = None, column: Optional[int] = None):
+        self.type = type
+        self.value = value
+        self.start = start
+        self.end = end
+        self.line = line
+        self.column = column
+    
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Token):
+            return NotImplemented
+        return self.type == other.type and self.value == other.value
+    
+    __hash__ = None  # type: ignore[assignment]
+    
+    def __repr__(self) -> str:
+        return f"Token(type={self.type!r}, value={self.value!r}, line={self.line}, column={self.column})"
+
+# TokenType members indexed by their integer code
+_TOKEN_TYPES = {member.value: member for member in TokenType}
+
+class TokenBuffer(Sequence[Token]):
+    """Struct-of-arrays token storage, returned by tokenize().
+    
+    Type codes and positions live in parallel typed arrays and identifier
+    values are interned, so a large token stream costs a few dozen bytes per
+    token. Token objects are only created when indexed or iterated.
+    """
+    def __init__(self) -> None:
+        self.types = array("B")
+        self.values: List[Any] = []
+        self.starts = array("I")
+        self.ends = array("I")
+        self.lines = array("I")
+        self.columns = array("I")
+    
+    def __len__(self) -> int:
+        return len(self.types)
+    
+    def __getitem__(self, index):  # type: ignore[override]
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return Token(_TOKEN_TYPES[self.types[index]], self.values[index], self.starts[index],
+                     self.ends[index], self.lines[index], self.columns[index])
+    
+    def __iter__(self) -> Iterator[Token]:
+        types = _TOKEN_TYPES
+        for code, value, start, end, line, column in zip(self.types, self.values, self.starts,
+                                                          self.ends, self.lines, self.columns):
+            yield Token(types[code], value, start, end, line, column)
+    
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+    
+    __hash__ = None  # type: ignore[assignment]
+    
+    def __repr__(self) -> str:
+        return f"TokenBuffer({list(self)!r})"
+
+# Keywords recognised among identifiers
+KEYWORDS = {
+    'if': TokenType.IF,
+    'else': TokenType.ELSE,
+    'while': TokenType.WHILE,
+    'return': TokenType.RETURN,
+    'def': TokenType.DEF,
+}
+
+# Single-character tokens, including the Islamic symbols
+SYMBOL_TOKENS = {
+    IslamicSymbols.BISMILLAH: TokenType.ENTRY_POINT,
+    IslamicSymbols.ASSIGNMENT: TokenType.ASSIGN,
+    IslamicSymbols.CONCATENATION: TokenType.CONCAT,
+    IslamicSymbols.END_STATEMENT: TokenType.END_STATEMENT,
+    IslamicSymbols.PRAYER: TokenType.SYMBOL,
+    IslamicSymbols.MULTIPLY: TokenType.STAR,
+    IslamicSymbols.DIVIDE: TokenType.SLASH,
+    ":": TokenType.COLON,
+    "(": TokenType.LEFT_PAREN,
+    ")": TokenType.RIGHT_PAREN,
+    "+": TokenType.PLUS,
+    "-": TokenType.MINUS,
+    "*": TokenType.STAR,
+    "/": TokenType.SLASH,
+    ",": TokenType.COMMA,
+    "<": TokenType.LESS,
+    ">": TokenType.GREATER,
+    "!": TokenType.NOT,
+}
+
+# Two-character operators, matched before the single-character symbols
+OPERATOR_TOKENS = {
+    "==": TokenType.EQUAL_EQUAL,
+    "!=": TokenType.BANG_EQUAL,
+    "<=": TokenType.LESS_EQUAL,
+    ">=": TokenType.GREATER_EQUAL,
+    "&&": TokenType.AND,
+    "||": TokenType.OR,
+}
+SYMBOL_TOKENS.update(OPERATOR_TOKENS)
+
+# Mathematical symbols are normalised to their ASCII operator
+SYMBOL_VALUES = {
+    IslamicSymbols.MULTIPLY: "*",
+    IslamicSymbols.DIVIDE: "/",
+}
+
+# Master pattern: leading whitespace is consumed by every match, and exactly
+# one group identifies the token. Characters that start no token fall
+# through to OTHER and are skipped, as the original character loop did.
+_MASTER_PATTERN = re.compile(
+    r"\s*(?:"
+    r"(?P<NUMBER>\d[\d.]*)"
+    r"|(?P<STRING>\"[^\"]*\"?|'[^']*'?)"
+    r"|(?P<IDENTIFIER>[^\W\d_]\w*)"
+    r"|(?P<SYMBOL>" + "|".join(map(re.escape, OPERATOR_TOKENS))
+    + r"|[" + re.escape("".join(key for key in SYMBOL_TOKENS if len(key) == 1)) + r"])"
+    r"|(?P<OTHER>.)"
+    r")",
+    re.DOTALL,
+)
+
+# Group numbers of the master pattern, dispatched on match.lastindex
+_NUMBER, _STRING, _IDENTIFIER, _SYMBOL, _OTHER = 1, 2, 3, 4, 5
+
+# Characters read per chunk by tokenize_stream
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# Scanner position carried across chunks: (offset of text[0], line, offset of line start)
+_Position = Tuple[int, int, int]
+
+def _scan(text: str, pos: int, final: bool, buffer: TokenBuffer,
+          position: _Position = (0, 1, 0)) -> Tuple[int, _Position]:
+    """Append the tokens of text[pos:] to buffer.
+    
+    Returns the offset scanning stopped at and the scanner position there.
+    Unless final is set, a token that runs up to the end of text may continue
+    in the next chunk, so it is held back and its offset returned instead.
+    """
+    keyword = KEYWORDS.get
+    symbols = SYMBOL_TOKENS
+    symbol_value = SYMBOL_VALUES.get
+    intern = sys.intern
+    count = text.count
+    identifier = TokenType.IDENTIFIER
+    add_type = buffer.types.append
+    add_value = buffer.values.append
+    add_start = buffer.starts.append
+    add_end = buffer.ends.append
+    add_line = buffer.lines.append
+    add_column = buffer.columns.append
+    limit = len(text)
+    base, line, line_start = position
+    line_start -= base  # Track the line start relative to text
+    last = pos
+    
+    for match in _MASTER_PATTERN.finditer(text, pos):
+        end = match.end()
+        if not final and end == limit:
+            limit = match.start()
+            break
+        kind = match.lastindex
+        if kind == _OTHER:
             continue
-            
-        elif char == "﷽":
-            tokens.append(Token(TokenType.ENTRY_POINT, char))
-        elif char == "۝":
-            tokens.append(Token(TokenType.ASSIGN, char))
-        elif char == "۩":
-            tokens.append(Token(TokenType.CONCAT, char))
-        elif char == ":":
-            tokens.append(Token(TokenType.COLON, char))
-        elif char == "(":
-            tokens.append(Token(TokenType.LEFT_PAREN, char))
-        elif char == ")":
-            tokens.append(Token(TokenType.RIGHT_PAREN, char))
-        elif char == "+":
-            tokens.append(Token(TokenType.PLUS, char))
-        elif char == "-":
-            tokens.append(Token(TokenType.MINUS, char))
-        elif char == "*":
-            tokens.append(Token(TokenType.STAR, char))
-        elif char == "/":
-            tokens.append(Token(TokenType.SLASH, char))
-        elif char == ",":
-            tokens.append(Token(TokenType.COMMA, char))
-            
-        i += 1
-        
+        start = match.start(kind)
+        newlines = count("\n", last, start)
+        if newlines:
+            line += newlines
+            line_start = text.rindex("\n", last, start) + 1
+        last = start
+        value = match[kind]
+        if kind == _IDENTIFIER:
+            add_type(keyword(value, identifier))
+            add_value(intern(value))
+        elif kind == _SYMBOL:
+            add_type(symbols[value])
+            add_value(symbol_value(value, value))
+        elif kind == _NUMBER:
+            try:
+                add_value(float(value))
+            except ValueError:
+                raise_syntax_error(f"Invalid number literal '{value}'", line, start - line_start + 1)
+            add_type(TokenType.NUMBER)
+        else:
+            # Unterminated strings run to the end of the source
+            add_type(TokenType.STRING)
+            add_value(value[1:-1 if len(value) > 1 and value[-1] == value[0] else None])
+        add_start(base + start)
+        add_end(base + end)
+        add_line(line)
+        add_column(start - line_start + 1)
+    
+    newlines = count("\n", last, limit)
+    if newlines:
+        line += newlines
+        line_start = text.rindex("\n", last, limit) + 1
+    return limit, (base + limit, line, base + line_start)
+
+def tokenize(code: str) -> TokenBuffer:
+    """Tokenizes input code into a compact sequence of tokens"""
+    tokens = TokenBuffer()
+    _scan(code, 0, True, tokens)
     return tokens
+
+def _read_chunks(source: Union[str, IO[Any], Iterable[Union[str, bytes]]],
+                 chunk_size: int) -> Iterator[str]:
+    """Yield text chunks from a string, a file object or an iterable of chunks"""
+    if isinstance(source, str):
+        yield source
+        return
+    if hasattr(source, "read"):
+        file = cast(IO[Any], source)
+        chunks: Iterable[Union[str, bytes]] = iter(lambda: file.read(chunk_size), file.read(0))
+    else:
+        chunks = cast(Iterable[Union[str, bytes]], source)
+    
+    # Byte chunks may split a multi-byte UTF-8 symbol such as ﷽
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in chunks:
+        text = decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+def tokenize_stream(source: Union[str, IO[Any], Iterable[Union[str, bytes]]],
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Token]:
+    """Lazily tokenize a file object or an iterable of str/bytes chunks.
+    
+    Only the unconsumed tail of the current chunk is kept in memory, so
+    tokens are produced with flat memory use regardless of source size.
+    """
+    buffer = ""
+    pending: List[str] = []
+    pending_size = 0
+    position: _Position = (0, 1, 0)
+    for chunk in _read_chunks(source, chunk_size):
+        pending.append(chunk)
+        pending_size += len(chunk)
+        # A held-back token (e.g. a long string literal) is only rescanned once
+        # the buffered input has doubled, keeping the total work linear
+        if pending_size < len(buffer):
+            continue
+        buffer = buffer + "".join(pending)
+        pending.clear()
+        pending_size = 0
+        tokens = TokenBuffer()
+        stop, position = _scan(buffer, 0, False, tokens, position)
+        buffer = buffer[stop:]
+        yield from tokens
+    
+    tokens = TokenBuffer()
+    _scan(buffer + "".join(pending), 0, True, tokens, position)
+    yield from tokens
+
+class TokenStream:
+    """Cursor over a token iterator with a bounded lookahead window"""
+    def __init__(self, tokens: Iterable[Token], max_lookahead: int = 2):
+        self._tokens = iter(tokens)
+        self._window: Deque[Token] = deque()
+        self._previous: Optional[Token] = None
+        self.max_lookahead = max_lookahead
+        self.position = 0  # Number of tokens consumed so far
+    
+    def peek(self, offset: int = 0) -> Optional[Token]:
+        """Return the token offset places ahead without consuming it"""
+        window = self._window
+        if offset < len(window):
+            return window[offset]
+        if offset >= self.max_lookahead:
+            raise ValueError(f"Lookahead of {offset + 1} tokens exceeds the limit of {self.max_lookahead}")
+        while len(window) <= offset:
+            token = next(self._tokens, None)
+            if token is None:
+                return None
+            window.append(token)
+        return window[offset]
+    
+    def advance(self) -> Optional[Token]:
+        """Consume and return the next token"""
+        if self.peek() is not None:
+            self._previous = self._window.popleft()
+            self.position += 1
+        return self._previous
+    
+    def previous(self) -> Optional[Token]:
+        """Return the most recently consumed token"""
+        return self._previous
+    
+    def at_end(self) -> bool:
+        return self.peek() is None
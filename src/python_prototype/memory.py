@@ -1,79 +1,737 @@
+import sys
+import time
+from array import array
+from collections.abc import Mapping
 from dataclasses import dataclass, field
-from typing import Dict, Any, Optional, Set
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set
 from .error import raise_runtime_error
 
-@dataclass
+# Blocks are rounded up to the smallest size class that holds them; each
+# class hands out slots from slabs of SLAB_SLOTS consecutive addresses
+SIZE_CLASSES = (16, 32, 64, 128, 256, 512, 1024, 2048)
+SLAB_SLOTS = 256
+# Class of blocks larger than every size class, given one slot at a time
+LARGE = len(SIZE_CLASSES)
+
+def size_class(size: int) -> int:
+    """Index in SIZE_CLASSES of the class for a block of size bytes, or LARGE"""
+    if size > SIZE_CLASSES[-1]:
+        return LARGE
+    return max(0, (size - 1).bit_length() - 4)
+
+# size_class() of every size up to the largest class, for allocate()
+SIZE_CLASS_TABLE = bytes(size_class(size) for size in range(SIZE_CLASSES[-1] + 1))
+
+class Handle:
+    """A typed reference to a block, counted while a managed container holds it"""
+    __slots__ = ("address",)
+    
+    def __init__(self, address: int):
+        self.address = address
+    
+    def __eq__(self, other: object) -> bool:
+        if other.__class__ is not Handle:
+            return NotImplemented
+        return self.address == other.address
+    
+    def __hash__(self) -> int:
+        return hash(self.address)
+    
+    def __repr__(self) -> str:
+        return f"Handle({self.address})"
+
+# Sizes of objects whose size depends only on their type; None, booleans
+# and small ints are preallocated by Python, so holding them costs nothing
+FIXED_SIZES: Dict[type, int] = {float: sys.getsizeof(0.0), bool: 0, type(None): 0, Handle: sys.getsizeof(Handle(0))}
+SMALL_INTS = range(-5, 257)
+
+def deep_size(value: Any) -> int:
+    """Bytes taken by value and every object it holds, each object counted once"""
+    size = 0
+    seen: Set[int] = set()
+    pending = [value]
+    while pending:
+        item = pending.pop()
+        fixed = FIXED_SIZES.get(item.__class__)
+        if fixed is not None:
+            size += fixed
+            continue
+        if item.__class__ is int and item in SMALL_INTS:
+            continue
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, (list, tuple, set, frozenset)):
+            pending.extend(item)
+        elif isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif item.__class__ in MANAGED:
+            pending.append(item.data)
+    return size
+
+def measure(value: Any) -> int:
+    """deep_size(value), skipping its bookkeeping for values of a fixed size"""
+    fixed = FIXED_SIZES.get(value.__class__)
+    return deep_size(value) if fixed is None else fixed
+
+class ManagedList:
+    """A list block value whose changes go through its MemoryManager's write barrier.
+    
+    Once it is allocated, each Handle stored in it counts as a reference
+    to that block, and overwriting or removing the Handle drops it again.
+    """
+    __slots__ = ("data", "memory", "address")
+    
+    def __init__(self, items: Iterable[Any] = ()):
+        self.data = list(items)
+        # Set when allocated, and cleared when freed
+        self.memory: Optional['MemoryManager'] = None
+        self.address = 0
+    
+    def __len__(self) -> int:
+        return len(self.data)
+    
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.data)
+    
+    def __getitem__(self, index: int) -> Any:
+        return self.data[index]
+    
+    def __repr__(self) -> str:
+        return f"ManagedList({self.data!r})"
+    
+    def handles(self) -> Iterator[int]:
+        """Addresses of the blocks held, once per Handle"""
+        for item in self.data:
+            if item.__class__ is Handle:
+                yield item.address
+    
+    def __setitem__(self, index: int, value: Any) -> None:
+        old = self.data[index]
+        self.data[index] = value
+        if self.memory is not None:
+            self.memory.write_barrier(self.address, old, value)
+    
+    def append(self, value: Any) -> None:
+        self.insert(len(self.data), value)
+    
+    def extend(self, values: Iterable[Any]) -> None:
+        for value in values:
+            self.append(value)
+    
+    def insert(self, index: int, value: Any) -> None:
+        data = self.data
+        before = sys.getsizeof(data)
+        data.insert(index, value)
+        if self.memory is not None:
+            self.memory.write_barrier(self.address, None, value, sys.getsizeof(data) - before)
+    
+    def pop(self, index: int = -1) -> Any:
+        data = self.data
+        before = sys.getsizeof(data)
+        value = data.pop(index)
+        if self.memory is not None:
+            self.memory.write_barrier(self.address, value, None, sys.getsizeof(data) - before)
+        return value
+    
+    def __delitem__(self, index: int) -> None:
+        self.pop(index)
+    
+    def clear(self) -> None:
+        while self.data:
+            self.pop()
+
+class ManagedDict:
+    """A dict block value whose changes go through its MemoryManager's write barrier.
+    
+    Like ManagedList, but only its values may be Handles.
+    """
+    __slots__ = ("data", "memory", "address")
+    
+    def __init__(self, items: Any = ()):
+        self.data = dict(items)
+        self.memory: Optional['MemoryManager'] = None
+        self.address = 0
+    
+    def __len__(self) -> int:
+        return len(self.data)
+    
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.data)
+    
+    def __contains__(self, key: object) -> bool:
+        return key in self.data
+    
+    def __getitem__(self, key: Any) -> Any:
+        return self.data[key]
+    
+    def __repr__(self) -> str:
+        return f"ManagedDict({self.data!r})"
+    
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self.data.get(key, default)
+    
+    def keys(self):
+        return self.data.keys()
+    
+    def values(self):
+        return self.data.values()
+    
+    def items(self):
+        return self.data.items()
+    
+    def handles(self) -> Iterator[int]:
+        """Addresses of the blocks held, once per Handle"""
+        for value in self.data.values():
+            if value.__class__ is Handle:
+                yield value.address
+    
+    def __setitem__(self, key: Any, value: Any) -> None:
+        data = self.data
+        before = sys.getsizeof(data)
+        added = key not in data
+        old = None if added else data[key]
+        data[key] = value
+        if self.memory is not None:
+            resized = sys.getsizeof(data) - before + (measure(key) if added else 0)
+            self.memory.write_barrier(self.address, old, value, resized)
+    
+    def pop(self, key: Any, *default: Any) -> Any:
+        data = self.data
+        if key not in data:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        before = sys.getsizeof(data)
+        value = data.pop(key)
+        if self.memory is not None:
+            self.memory.write_barrier(self.address, value, None, sys.getsizeof(data) - before - measure(key))
+        return value
+    
+    def __delitem__(self, key: Any) -> None:
+        self.pop(key)
+
+# Block values that hold references, as Handles
+MANAGED = (ManagedList, ManagedDict)
+
 class MemoryBlock:
-    value: Any
-    size: int
-    references: int = 0
+    """A view of one block's entries in its MemoryManager's arrays"""
+    __slots__ = ("memory", "address")
+    
+    def __init__(self, memory: 'MemoryManager', address: int):
+        self.memory = memory
+        self.address = address
+    
+    @property
+    def value(self) -> Any:
+        return self.memory.values[self.address]
+    
+    @property
+    def size(self) -> int:
+        return self.memory.sizes[self.address]
+    
+    @property
+    def references(self) -> int:
+        """References from outside the heap, which make the block a root"""
+        return self.memory.refcounts[self.address]
+    
+    @property
+    def heap_references(self) -> int:
+        """Handles to the block held by managed containers"""
+        return self.memory.heap_refs[self.address]
     
     def increment_ref(self) -> None:
-        self.references += 1
+        self.memory.refcounts[self.address] += 1
     
     def decrement_ref(self) -> None:
-        self.references -= 1
+        self.memory.release_root(self.address)
+
+class BlockTable(Mapping):
+    """The allocated blocks of a MemoryManager, by address"""
+    def __init__(self, memory: 'MemoryManager'):
+        self.memory = memory
+    
+    def __getitem__(self, address: int) -> MemoryBlock:
+        if not self.memory.is_allocated(address):
+            raise KeyError(address)
+        return MemoryBlock(self.memory, address)
+    
+    def __contains__(self, address: object) -> bool:
+        return isinstance(address, int) and self.memory.is_allocated(address)
+    
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.memory.allocated())
+    
+    def __len__(self) -> int:
+        return self.memory.count
+
+@dataclass
+class GCStats:
+    """Collection counts, pause times and throughput of a MemoryManager"""
+    minor_collections: int = 0
+    major_collections: int = 0
+    incremental_steps: int = 0
+    promoted: int = 0
+    allocated_bytes: int = 0
+    freed_bytes: int = 0
+    freed_blocks: int = 0
+    # Blocks freed when their reference counts dropped to zero
+    refcount_freed: int = 0
+    cycle_collections: int = 0
+    cycle_freed: int = 0
+    pauses: List[float] = field(default_factory=list)
+    
+    @property
+    def total_pause(self) -> float:
+        return sum(self.pauses)
+    
+    @property
+    def max_pause(self) -> float:
+        return max(self.pauses, default=0.0)
+    
+    def pause_percentile(self, percentile: float) -> float:
+        """Pause time in seconds that the given percentage of pauses stay under"""
+        if not self.pauses:
+            return 0.0
+        pauses = sorted(self.pauses)
+        return pauses[min(len(pauses) - 1, int(len(pauses) * percentile / 100))]
+    
+    @property
+    def throughput(self) -> float:
+        """Bytes reclaimed per second spent collecting"""
+        total = self.total_pause
+        return self.freed_bytes / total if total else 0.0
+
+# Plain values that may change size after they are allocated
+CONTAINERS = (list, dict, set)
+
+# Phases of an incremental major collection
+IDLE = "idle"
+MARKING = "marking"
+SWEEPING = "sweeping"
 
 class MemoryManager:
-    def __init__(self, max_memory: int = 1024 * 1024):  # 1MB default
+    """Allocates blocks and frees those no root reaches.
+    
+    Block metadata lives in parallel arrays indexed by address. Each size
+    class keeps a free list of its slots, so freed addresses are reused
+    and blocks of one class sit together. used_memory is the deep size of
+    the values, measured on allocation unless the caller gives a size.
+    
+    Roots are blocks with references > 0, and a block reaches the blocks
+    of the Handles its ManagedList or ManagedDict value holds. Their write
+    barrier keeps heap_refs, the count of those Handles, up to date; a
+    block whose counts both drop to zero is freed at the next allocation,
+    along with whatever only it held. Garbage cycles keep their counts up,
+    so blocks whose count dropped without reaching zero are candidates for
+    collect_cycles(), run once cycle_threshold of them have built up.
+    
+    Tracing collects the rest, such as blocks that were never referenced.
+    New blocks are young and are collected on their own whenever they
+    outgrow the nursery; blocks surviving promote_age minor collections
+    become old, and only major collections, run once usage passes
+    gc_threshold, scan those. With incremental=True a major collection is
+    spread over the following allocations, step_size blocks at a time.
+    
+    Handles taken out of a container, and plain list, dict or set values
+    from get(), may only be used until the next allocation; get() marks
+    plain containers to be measured again then.
+    """
+    def __init__(self, max_memory: int = 1024 * 1024, nursery_size: Optional[int] = None,
+                 promote_age: int = 2, incremental: bool = False, step_size: int = 256,
+                 cycle_threshold: int = 1000):  # 1MB default
         self.max_memory = max_memory
         self.used_memory = 0
-        self.blocks: Dict[int, MemoryBlock] = {}
-        self.next_address = 1
+        # Address 0 is never allocated
+        self.values: List[Any] = [None]
+        self.sizes = array("q", [0])
+        self.refcounts = array("q", [0])
+        self.heap_refs = array("q", [0])
+        self.slot_classes = array("b", [LARGE])
+        self.live = bytearray(1)
+        self.free_lists: List[List[int]] = [[] for _ in range(LARGE + 1)]
+        self.count = 0
+        self.blocks = BlockTable(self)
         self.gc_threshold = 0.8  # Run GC when 80% memory is used
+        # Young blocks, with the minor collections each has survived
+        self.young: Dict[int, int] = {}
+        self.young_memory = 0
+        self.nursery_size = max_memory // 8 if nursery_size is None else nursery_size
+        self.promote_age = promote_age
+        # Old containers that may hold young addresses
+        self.remembered: Set[int] = set()
+        # Blocks whose counts reached zero, and those whose count dropped
+        # but not to zero, which may be left in garbage cycles
+        self.zero_counts: List[int] = []
+        self.candidates: Set[int] = set()
+        self.cycle_threshold = cycle_threshold
+        # Containers that may have changed size since they were measured
+        self.dirty: Set[int] = set()
+        self.incremental = incremental
+        self.step_size = step_size
+        # Incremental collection state: the addresses below snapshot_end
+        # existed when it started, and cursor is how far roots and sweep
+        # have got through them; gray holds marked blocks to scan. Blocks
+        # allocated meanwhile are marked, so reused addresses survive too
+        self.phase = IDLE
+        self.snapshot_end = 0
+        self.cursor = 0
+        self.marked: Set[int] = set()
+        self.gray: List[int] = []
+        # Addresses freed while sweeping, kept from reuse until the sweep
+        # ends, as garbage not swept yet may hold Handles to them
+        self.swept: List[int] = []
+        self.stats = GCStats()
+    
+    def is_allocated(self, address: int) -> bool:
+        return 0 < address < len(self.live) and self.live[address] == 1
     
-    def allocate(self, value: Any, size: int) -> int:
+    def allocated(self) -> List[int]:
+        """Addresses of all allocated blocks"""
+        return [address for address, live in enumerate(self.live) if live]
+    
+    def allocate(self, value: Any, size: Optional[int] = None) -> int:
         """Allocate memory for a value and return its address"""
+        if size is None:
+            size = deep_size(value)
+        slot_class = SIZE_CLASS_TABLE[size] if 0 <= size <= SIZE_CLASSES[-1] else size_class(size)
+        if self.dirty:
+            self.measure_dirty()
+        if self.zero_counts:
+            self.free_unreferenced()
+        if len(self.candidates) >= self.cycle_threshold:
+            self.collect_cycles()
+        if self.phase != IDLE:
+            self.collect_step()
+        elif self.young_memory + size > self.nursery_size:
+            self.minor_collect()
+            if self.used_memory / self.max_memory > self.gc_threshold:
+                if self.incremental:
+                    self.start_major()
+                else:
+                    self.mark_and_sweep()
+        
         if self.used_memory + size > self.max_memory:
-            self.garbage_collect()
+            self.mark_and_sweep()
             if self.used_memory + size > self.max_memory:
                 raise_runtime_error("Out of memory")
         
-        address = self.next_address
-        self.blocks[address] = MemoryBlock(value, size)
+        free_list = self.free_lists[slot_class]
+        if not free_list:
+            self.add_slab(slot_class)
+        address = free_list.pop()
+        self.values[address] = value
+        self.sizes[address] = size
+        self.live[address] = 1
+        self.count += 1
         self.used_memory += size
-        self.next_address += 1
+        self.young[address] = 0
+        self.young_memory += size
+        self.stats.allocated_bytes += size
+        if self.phase != IDLE:
+            # Blocks allocated during a collection survive it, but their
+            # values may hold addresses that are not marked yet
+            self.marked.add(address)
+            if self.phase == MARKING:
+                self.gray.append(address)
+        if value.__class__ in MANAGED:
+            value.memory = self
+            value.address = address
+            for target in value.handles():
+                self.retain(address, target)
         return address
     
+    def add_slab(self, slot_class: int) -> None:
+        """Give a size class a new run of free addresses"""
+        slots = SLAB_SLOTS if slot_class < LARGE else 1
+        start = len(self.values)
+        self.values.extend([None] * slots)
+        self.sizes.extend([0] * slots)
+        self.refcounts.extend([0] * slots)
+        self.heap_refs.extend([0] * slots)
+        self.slot_classes.extend([slot_class] * slots)
+        self.live.extend(bytes(slots))
+        # Popped from the end, so the lowest address goes first
+        self.free_lists[slot_class].extend(range(start + slots - 1, start - 1, -1))
+    
     def free(self, address: int) -> None:
         """Free memory at given address"""
-        if address in self.blocks:
-            block = self.blocks[address]
-            self.used_memory -= block.size
-            del self.blocks[address]
+        live = self.live
+        if 0 < address < len(live) and live[address]:
+            size = self.sizes[address]
+            value = self.values[address]
+            self.values[address] = None
+            self.refcounts[address] = 0
+            self.heap_refs[address] = 0
+            live[address] = 0
+            if self.phase == SWEEPING:
+                self.swept.append(address)
+            else:
+                self.free_lists[self.slot_classes[address]].append(address)
+            self.count -= 1
+            self.used_memory -= size
+            if self.young.pop(address, None) is not None:
+                self.young_memory -= size
+            self.remembered.discard(address)
+            self.dirty.discard(address)
+            self.candidates.discard(address)
+            if value.__class__ in MANAGED:
+                value.memory = None
+                for target in value.handles():
+                    self.release(target)
     
     def get(self, address: int) -> Any:
         """Get value at memory address"""
-        if address not in self.blocks:
+        if not self.is_allocated(address):
             raise_runtime_error(f"Invalid memory access at address {address}")
-        return self.blocks[address].value
+        value = self.values[address]
+        if isinstance(value, CONTAINERS):
+            self.dirty.add(address)
+        return value
     
-    def mark_and_sweep(self) -> None:
-        """Perform mark and sweep garbage collection"""
-        marked: Set[int] = set()
+    def write_barrier(self, owner: int, old: Any, new: Any, resized: int = 0) -> None:
+        """Account for the managed container at owner replacing old with new,
+        having grown by resized bytes besides them"""
+        if new.__class__ is Handle:
+            self.retain(owner, new.address)
+        if old.__class__ is Handle:
+            self.release(old.address)
+        change = resized + measure(new) - measure(old)
+        if change:
+            self.sizes[owner] += change
+            self.used_memory += change
+            if owner in self.young:
+                self.young_memory += change
+    
+    def retain(self, owner: int, target: int) -> None:
+        """Count a Handle to target stored in the container at owner"""
+        if not self.is_allocated(target):
+            raise_runtime_error(f"Invalid memory access at address {target}")
+        self.heap_refs[target] += 1
+        if target in self.young and owner not in self.young:
+            self.remembered.add(owner)
+    
+    def release(self, target: int) -> None:
+        """Drop a Handle to target that a managed container held"""
+        if not self.is_allocated(target):
+            # Freed in the same collection as the container
+            return
+        if self.phase == MARKING and target not in self.marked:
+            # What was reachable when marking started survives it, even
+            # if its only Handle moves to a block already scanned
+            self.marked.add(target)
+            self.gray.append(target)
+        count = self.heap_refs[target] = self.heap_refs[target] - 1
+        self.dropped(target, count + self.refcounts[target])
+    
+    def release_root(self, address: int) -> None:
+        """Drop a reference from outside the heap"""
+        count = self.refcounts[address] = self.refcounts[address] - 1
+        self.dropped(address, count + self.heap_refs[address])
+    
+    def dropped(self, address: int, count: int) -> None:
+        if count == 0:
+            self.zero_counts.append(address)
+        elif self.values[address].__class__ in MANAGED:
+            self.candidates.add(address)
+    
+    def free_unreferenced(self) -> None:
+        """Free the blocks whose counts dropped to zero, and what only they held"""
+        # free() appends to zero_counts as it releases what a block held
+        pending = self.zero_counts
+        live = self.live
+        refcounts = self.refcounts
+        heap_refs = self.heap_refs
+        stats = self.stats
+        while pending:
+            address = pending.pop()
+            if live[address] and refcounts[address] == 0 and heap_refs[address] == 0:
+                stats.freed_bytes += self.sizes[address]
+                stats.freed_blocks += 1
+                stats.refcount_freed += 1
+                self.free(address)
+    
+    def collect_cycles(self) -> None:
+        """Free the garbage cycles among the blocks the candidates reach.
         
-        def mark(address: int) -> None:
-            if address not in marked:
-                marked.add(address)
-                block = self.blocks[address]
-                # Mark any references in the value
-                if isinstance(block.value, (list, dict, set)):
-                    for item in block.value:
-                        if isinstance(item, int) and item in self.blocks:
-                            mark(item)
+        Trial deletion: each block's count less the Handles to it held
+        within that subgraph is what holds it from outside. Blocks with
+        none, that no block with some reaches either, are garbage.
+        """
+        start = time.perf_counter()
+        refcounts = self.refcounts
+        heap_refs = self.heap_refs
+        outside = {address: refcounts[address] + heap_refs[address]
+                   for address in self.candidates if self.is_allocated(address)}
+        self.candidates = set()
+        stack = list(outside)
+        while stack:
+            for child in self.references(stack.pop()):
+                if child not in outside:
+                    outside[child] = refcounts[child] + heap_refs[child]
+                    stack.append(child)
+        for address in outside:
+            for child in self.references(address):
+                outside[child] -= 1
         
-        # Mark phase
-        for address in self.blocks:
-            if self.blocks[address].references > 0:
-                mark(address)
+        stack = [address for address, count in outside.items() if count > 0]
+        reached = set(stack)
+        while stack:
+            for child in self.references(stack.pop()):
+                if child not in reached:
+                    reached.add(child)
+                    stack.append(child)
+        garbage = [address for address in outside if address not in reached]
+        self.reclaim(garbage)
+        self.stats.cycle_freed += len(garbage)
+        self.stats.cycle_collections += 1
+        self.stats.pauses.append(time.perf_counter() - start)
+    
+    def measure_dirty(self) -> None:
+        """Bring the sizes of containers handed out by get() up to date"""
+        sizes = self.sizes
+        for address in self.dirty:
+            size = deep_size(self.values[address])
+            change = size - sizes[address]
+            sizes[address] = size
+            self.used_memory += change
+            if address in self.young:
+                self.young_memory += change
+        self.dirty.clear()
+    
+    def references(self, address: int) -> Iterator[int]:
+        """Addresses of the blocks a block's value holds, once per Handle"""
+        value = self.values[address]
+        if value.__class__ in MANAGED:
+            live = self.live
+            for target in value.handles():
+                if live[target]:
+                    yield target
+    
+    def shade(self, addresses: Iterator[int]) -> List[int]:
+        """Mark addresses for the incremental collection, returning the newly marked"""
+        marked = self.marked
+        new = [address for address in addresses if address not in marked]
+        marked.update(new)
+        return new
+    
+    def minor_collect(self) -> None:
+        """Collect the young generation, promoting blocks that have survived long enough"""
+        start = time.perf_counter()
+        refcounts = self.refcounts
+        young = self.young
+        marked = {address for address in young if refcounts[address] > 0}
+        # Old blocks are assumed live; only the young addresses they hold matter
+        stack = list(marked) + list(self.remembered)
+        while stack:
+            for child in self.references(stack.pop()):
+                if child in young and child not in marked:
+                    marked.add(child)
+                    stack.append(child)
+        
+        # Everything left in the young generation is garbage; the
+        # generation is rebuilt from the survivors
+        dead = [address for address in young if address not in marked]
+        self.young = {}
+        self.reclaim(dead)
+        
+        promoted = []
+        survivors = {}
+        for address in marked:
+            age = young[address] + 1
+            if age >= self.promote_age:
+                promoted.append(address)
+            else:
+                survivors[address] = age
+        self.young = young = survivors
+        self.young_memory = sum(self.sizes[address] for address in survivors)
+        self.remembered.update(promoted)
+        self.remembered = {address for address in self.remembered
+                           if any(child in young for child in self.references(address))}
         
-        # Sweep phase
-        addresses = list(self.blocks.keys())
+        self.stats.promoted += len(promoted)
+        self.stats.minor_collections += 1
+        self.stats.pauses.append(time.perf_counter() - start)
+    
+    def start_major(self) -> None:
+        """Begin an incremental major collection of the blocks that exist now"""
+        self.phase = MARKING
+        self.snapshot_end = len(self.live)
+        self.cursor = 1
+        self.marked = set()
+        self.gray = []
+    
+    def collect_step(self) -> None:
+        """Do step_size blocks' worth of the incremental major collection"""
+        start = time.perf_counter()
+        budget = self.step_size
+        end = self.snapshot_end
+        if self.phase == MARKING:
+            # Every root is marked before any block is scanned
+            refcounts = self.refcounts
+            while budget > 0 and self.cursor < end:
+                address = self.cursor
+                self.cursor += 1
+                budget -= 1
+                if refcounts[address] > 0 and address not in self.marked:
+                    self.marked.add(address)
+                    self.gray.append(address)
+            while budget > 0 and self.gray:
+                budget -= 1
+                self.gray.extend(self.shade(self.references(self.gray.pop())))
+            if self.cursor == end and not self.gray:
+                self.phase = SWEEPING
+                self.cursor = 1
+        else:
+            stop = min(self.cursor + budget, end)
+            live = self.live
+            self.reclaim([address for address in range(self.cursor, stop)
+                          if live[address] and address not in self.marked])
+            self.cursor = stop
+            if stop == end:
+                self.finish_major()
+        self.stats.incremental_steps += 1
+        self.stats.pauses.append(time.perf_counter() - start)
+    
+    def finish_major(self) -> None:
+        for address in self.swept:
+            self.free_lists[self.slot_classes[address]].append(address)
+        self.swept = []
+        self.phase = IDLE
+        self.marked = set()
+        self.gray = []
+        self.stats.major_collections += 1
+    
+    def reclaim(self, addresses: List[int]) -> None:
         for address in addresses:
-            if address not in marked:
-                self.free(address)
+            self.stats.freed_bytes += self.sizes[address]
+            self.free(address)
+        self.stats.freed_blocks += len(addresses)
+    
+    def mark_and_sweep(self) -> None:
+        """Perform a full mark and sweep garbage collection in one pause"""
+        start = time.perf_counter()
+        marked = {address for address, count in enumerate(self.refcounts) if count > 0}
+        # An explicit stack, so long chains of references cannot overflow
+        stack = list(marked)
+        while stack:
+            for child in self.references(stack.pop()):
+                if child not in marked:
+                    marked.add(child)
+                    stack.append(child)
+        
+        self.reclaim([address for address, live in enumerate(self.live) if live and address not in marked])
+        # Any incremental collection in progress is superseded, and no
+        # garbage cycle is left
+        self.finish_major()
+        self.candidates = set()
+        self.stats.pauses.append(time.perf_counter() - start)
     
     def garbage_collect(self) -> None:
         """Run garbage collection if needed"""
+        if self.dirty:
+            self.measure_dirty()
         if self.used_memory / self.max_memory > self.gc_threshold:
-            self.mark_and_sweep() 
\ No newline at end of file
+            self.mark_and_sweep()
\ No newline at end of file
@@ -1,6 +1,9 @@
-from typing import List, Optional, Dict
+import time
+from typing import Any, Callable, ClassVar, FrozenSet, List, Optional, Dict, Set, Tuple
 from dataclasses import dataclass
-from .ast import AstNode
+from .ast import AstNode, NodeView
+from .closures import BINARY_FUNCTIONS, UNARY_FUNCTIONS
+from .stdlib import StdLib
 from .symbols import OperatorPrecedence, BINARY_OPS
 
 @dataclass
@@ -8,33 +11,705 @@ class OptimizationPass:
     """Base class for optimization passes"""
     name: str
     enabled: bool = True
+    # Types of the nodes the pass may rewrite; None for every type
+    node_types: ClassVar[Optional[FrozenSet[str]]] = None
 
     def optimize(self, node: AstNode) -> AstNode:
+        """Return node, or a new node to replace it with; passes look only
+        at a node and its children, and never change either in place"""
         raise NotImplementedError
 
+@dataclass
+class PassStats:
+    """How often an optimization pass ran and rewrote a node, and the time it took"""
+    calls: int = 0
+    rewrites: int = 0
+    seconds: float = 0.0
+
+# Literal node types, and what their values evaluate to
+LITERALS = {"Number": float, "String": str}
+
+# StdLib functions the interpreter finds by name whose result depends only
+# on their arguments
+PURE_FUNCTIONS: Dict[str, Callable[..., Any]] = {"len": StdLib.len}
+
+# Node types evaluated for their value alone, with no effect on variables
+EXPRESSIONS = frozenset(("Number", "String", "Identifier", "BinaryOp", "UnaryOp", "FunctionCall"))
+
+UNKNOWN = object()
+
+def constant_value(node: AstNode) -> Any:
+    """The value node always evaluates to, or UNKNOWN"""
+    convert = LITERALS.get(node.type)
+    if convert is not None:
+        return convert(node.value)
+    if node.type == "FunctionCall" and node.value in PURE_FUNCTIONS:
+        if all(child.type in LITERALS for child in node.children):
+            try:
+                return PURE_FUNCTIONS[node.value](*[constant_value(child) for child in node.children])
+            except (TypeError, ValueError):
+                pass
+    return UNKNOWN
+
+def literal(value: Any) -> Optional[AstNode]:
+    """A literal node evaluating to value, or None if there is none: Number
+    literals evaluate to floats, so ints and booleans have no literal"""
+    if value.__class__ is float:
+        return AstNode("Number", str(value))
+    if value.__class__ is str:
+        return AstNode("String", value)
+    return None
+
+def fold(node: AstNode) -> AstNode:
+    """node with constant operands evaluated, or node itself"""
+    if node.type == "BinaryOp":
+        left = constant_value(node.children[0])
+        if node.value in ("&&", "||"):
+            # The left operand decides which operand is the result
+            if left is UNKNOWN:
+                return node
+            return node.children[1] if bool(left) == (node.value == "&&") else node.children[0]
+        function = BINARY_FUNCTIONS.get(node.value)
+        right = constant_value(node.children[1])
+        if function is None or left is UNKNOWN or right is UNKNOWN:
+            return node
+        try:
+            result = literal(function(left, right))
+        except (TypeError, ValueError, ArithmeticError):
+            # Left to fail when the program runs
+            return node
+        return node if result is None else result
+    if node.type == "UnaryOp":
+        function = UNARY_FUNCTIONS.get(node.value)
+        operand = constant_value(node.children[0])
+        if function is None or operand is UNKNOWN:
+            return node
+        try:
+            result = literal(function(operand))
+        except TypeError:
+            return node
+        return node if result is None else result
+    if node.type == "FunctionCall":
+        result = constant_value(node)
+        if result is not UNKNOWN:
+            return literal(result) or node
+    return node
+
+def with_children(node: AstNode, children: List[AstNode]) -> AstNode:
+    """node, or a copy of it if children differ from its own. Copies are
+    made from what arena NodeViews have too"""
+    if len(children) == len(node.children):
+        for new, old in zip(children, node.children):
+            if new is not old:
+                break
+        else:
+            return node
+    return AstNode(node.type, node.value, children, node.params, node.name)
+
+def transform(node: AstNode, rewrite: Callable[[AstNode], AstNode]) -> AstNode:
+    """Apply rewrite to node and its descendants bottom-up, copying the
+    nodes whose children change rather than changing them"""
+    results: List[AstNode] = []
+    stack = [(node, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if node.children and not expanded:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children))
+            continue
+        if node.children:
+            count = len(node.children)
+            node = with_children(node, results[-count:])
+            del results[-count:]
+        results.append(rewrite(node))
+    return results[0]
+
+def copy_leaf(node: AstNode) -> AstNode:
+    """A copy of node if it is a leaf; copies of inner nodes are made by
+    transform when their children are replaced"""
+    if node.children:
+        return node
+    return AstNode(node.type, node.value, [], node.params, node.name)
+
+def assigned_names(nodes: List[AstNode]) -> Set[str]:
+    """Names assigned by nodes, outside nested function definitions"""
+    names: Set[str] = set()
+    pending = list(nodes)
+    while pending:
+        node = pending.pop()
+        if node.type == "Assignment":
+            names.add(node.value)
+        if node.type != "FunctionDef":
+            pending.extend(node.children)
+    return names
+
+def truth(node: AstNode) -> Optional[bool]:
+    """Whether a literal condition holds, or None if node is no literal"""
+    convert = LITERALS.get(node.type)
+    return None if convert is None else bool(convert(node.value))
+
 class ConstantFolding(OptimizationPass):
     """Fold constant expressions at compile time"""
+    node_types = frozenset(("BinaryOp", "UnaryOp", "FunctionCall"))
+    
     def __init__(self):
         super().__init__("constant_folding")
     
     def optimize(self, node: AstNode) -> AstNode:
-        if node.type == "BinaryOp" and all(child.type == "Number" for child in node.children):
-            left = float(node.children[0].value)
-            right = float(node.children[1].value)
-            
-            if node.value == "+":
-                return AstNode("Number", str(left + right))
-            elif node.value == "-":
-                return AstNode("Number", str(left - right))
-            elif node.value == "*":
-                return AstNode("Number", str(left * right))
-            elif node.value == "/" and right != 0:
-                return AstNode("Number", str(left / right))
-                
+        return fold(node)
+
+class ConstantPropagation(OptimizationPass):
+    """Replace variables known to hold a constant with it, folding as it goes.
+    
+    Runs over the statements of the Program, including its EntryPoint, and
+    of each FunctionDef. A function starts knowing nothing, as its names
+    may fall back to globals, set by whatever ran before the call. Calls
+    keep what is known, since functions only assign their own locals.
+    After an If only what both branches agree on is known, and a While
+    forgets every name its body assigns.
+    """
+    node_types = frozenset(("Program", "FunctionDef"))
+    
+    def __init__(self):
+        super().__init__("constant_propagation")
+    
+    def optimize(self, node: AstNode) -> AstNode:
+        return with_children(node, self.statements(node.children, {}))
+    
+    def statements(self, nodes: List[AstNode], known: Dict[str, AstNode]) -> List[AstNode]:
+        return [self.statement(node, known) for node in nodes]
+    
+    def statement(self, node: AstNode, known: Dict[str, AstNode]) -> AstNode:
+        """node with known variables replaced, updating known to after it"""
+        if node.type in EXPRESSIONS:
+            return self.expression(node, known)
+        if node.type == "Assignment":
+            value = self.expression(node.children[0], known)
+            if value.type in LITERALS:
+                known[node.value] = value
+            else:
+                known.pop(node.value, None)
+            return with_children(node, [value])
+        if node.type in ("Block", "EntryPoint"):
+            return with_children(node, self.statements(node.children, known))
+        if node.type == "Return":
+            return with_children(node, [self.expression(child, known) for child in node.children])
+        if node.type == "If":
+            condition = self.expression(node.children[0], known)
+            branches = []
+            outcomes = []
+            for branch in node.children[1:]:
+                outcome = dict(known)
+                branches.append(self.statement(branch, outcome))
+                outcomes.append(outcome)
+            if len(outcomes) == 1:
+                # A false condition runs nothing
+                outcomes.append(dict(known))
+            taken = truth(condition)
+            if taken is None:
+                after = {name: value for name, value in outcomes[0].items()
+                         if (other := outcomes[1].get(name)) is not None
+                         and (other.type, other.value) == (value.type, value.value)}
+            else:
+                after = outcomes[0] if taken else outcomes[1]
+            known.clear()
+            known.update(after)
+            return with_children(node, [condition] + branches)
+        if node.type == "While":
+            for name in assigned_names(node.children[1:]):
+                known.pop(name, None)
+            condition = self.expression(node.children[0], known)
+            body = self.statements(node.children[1:], dict(known))
+            return with_children(node, [condition] + body)
+        if node.type == "FunctionDef":
+            # Optimized as a node of its own
+            return node
+        known.clear()
+        return node
+    
+    def expression(self, node: AstNode, known: Dict[str, AstNode]) -> AstNode:
+        if not known:
+            return transform(node, fold)
+        
+        def rewrite(node: AstNode) -> AstNode:
+            if node.type == "Identifier" and node.value in known:
+                # A fresh node at each use, so no node appears twice
+                return copy_leaf(known[node.value])
+            return fold(node)
+        return transform(node, rewrite)
+
+def size(node: AstNode) -> int:
+    """Number of nodes in the tree under node"""
+    count = 0
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        count += 1
+        pending.extend(node.children)
+    return count
+
+def contains_call(node: AstNode) -> bool:
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        if node.type == "FunctionCall":
+            return True
+        pending.extend(node.children)
+    return False
+
+def evaluation_order(node: AstNode) -> List[Tuple[AstNode, bool]]:
+    """The nodes under node in the order their evaluation finishes, each
+    with whether it is only evaluated depending on a && or || operand"""
+    order: List[Tuple[AstNode, bool]] = []
+    stack = [(node, False, False)]
+    while stack:
+        node, conditional, expanded = stack.pop()
+        if expanded or not node.children:
+            order.append((node, conditional))
+            continue
+        stack.append((node, conditional, True))
+        logical = node.type == "BinaryOp" and node.value in ("&&", "||")
+        for position in range(len(node.children) - 1, -1, -1):
+            stack.append((node.children[position], conditional or (logical and position > 0), False))
+    return order
+
+@dataclass
+class InlineCandidate:
+    """A function whose body is one expression, ready to substitute at calls"""
+    params: List[str]
+    body: AstNode
+    order: List[Tuple[AstNode, bool]]
+    size: int
+    # Whether the body reads variables other than its parameters
+    reads_globals: bool
+    # Whether the body makes calls, which may have effects
+    calls: bool
+
+class FunctionInlining(OptimizationPass):
+    """Replace calls of small functions with their body.
+    
+    A function is inlined if its body is a single expression, or a Return
+    of one, of at most budget nodes that does not call the function
+    itself. Arguments are substituted for the parameters, so the caller
+    needs no variables of its own for them; since evaluating an
+    expression never assigns a variable, an argument has the same value
+    wherever it is evaluated. Every argument other than a literal must
+    still be evaluated at least once, and where calls are involved,
+    exactly once and before anything else in the body. Only which of
+    several failures is reported first may differ.
+    
+    Calls are resolved the way the interpreter resolves them when they
+    run: a definition is only used at calls in statements after it, and
+    names defined twice or shadowed by the standard library are never
+    inlined.
+    """
+    node_types = frozenset(("Program",))
+    
+    def __init__(self, budget: int = 16):
+        super().__init__("function_inlining")
+        self.budget = budget
+    
+    def optimize(self, node: AstNode) -> AstNode:
+        definitions: Dict[str, int] = {}
+        for child in node.children:
+            if child.type == "FunctionDef":
+                definitions[child.value] = definitions.get(child.value, 0) + 1
+        candidates: Dict[str, InlineCandidate] = {}
+        children = []
+        for child in node.children:
+            inside = child.type == "FunctionDef"
+            if candidates:
+                child = transform(child, lambda call: self.inline(call, candidates, inside))
+            if inside and definitions[child.value] == 1 and not hasattr(StdLib, child.value):
+                candidate = self.candidate(child)
+                if candidate is not None:
+                    candidates[child.value] = candidate
+            children.append(child)
+        return with_children(node, children)
+    
+    def candidate(self, function: AstNode) -> Optional[InlineCandidate]:
+        """function as an InlineCandidate, or None if it cannot be inlined"""
+        if len(function.children) != 1 or len(set(function.params)) != len(function.params):
+            return None
+        body = function.children[0]
+        if body.type == "Return" and len(body.children) == 1:
+            body = body.children[0]
+        elif body.type not in EXPRESSIONS:
+            return None
+        order = evaluation_order(body)
+        if len(order) > self.budget:
+            return None
+        if any(node.type == "FunctionCall" and node.value == function.value for node, _ in order):
+            return None
+        reads_globals = any(node.type == "Identifier" and node.value not in function.params for node, _ in order)
+        calls = any(node.type == "FunctionCall" for node, _ in order)
+        return InlineCandidate(function.params, body, order, len(order), reads_globals, calls)
+    
+    def inline(self, call: AstNode, candidates: Dict[str, InlineCandidate], inside: bool) -> AstNode:
+        """call replaced with the body of the function it calls, if it is safe"""
+        if call.type != "FunctionCall":
+            return call
+        candidate = candidates.get(call.value)
+        if candidate is None or len(call.children) != len(candidate.params):
+            return call
+        # Inside a function, a body's globals could be read as the caller's locals
+        if inside and candidate.reads_globals:
+            return call
+        arguments = dict(zip(candidate.params, call.children))
+        uses: Dict[str, List[bool]] = {name: [] for name in candidate.params}
+        for node, conditional in candidate.order:
+            if node.type == "Identifier" and node.value in uses:
+                uses[node.value].append(conditional)
+        growth = 0
+        # Whether effects could be reordered along with the arguments
+        ordered = candidate.calls
+        for name, argument in arguments.items():
+            if argument.type in LITERALS:
+                continue
+            # An argument that could fail must still be evaluated every time
+            if all(uses[name]):
+                return call
+            growth += (len(uses[name]) - 1) * size(argument)
+            ordered = ordered or contains_call(argument)
+        if candidate.size + growth > self.budget:
+            return call
+        if ordered and not self.evaluated_first(candidate, arguments, uses):
+            return call
+        
+        def substitute(node: AstNode) -> AstNode:
+            if node.type == "Identifier" and node.value in arguments:
+                # Copied, so that no node appears twice in the tree
+                return transform(arguments[node.value], copy_leaf)
+            return copy_leaf(node)
+        return transform(candidate.body, substitute)
+    
+    def evaluated_first(self, candidate: InlineCandidate, arguments: Dict[str, AstNode],
+                        uses: Dict[str, List[bool]]) -> bool:
+        """Whether the body evaluates each non-literal argument exactly once,
+        in order, before anything else that could fail or have an effect"""
+        expected = [name for name, argument in arguments.items() if argument.type not in LITERALS]
+        if any(len(uses[name]) != 1 for name in expected):
+            return False
+        events = [node for node, _ in candidate.order
+                  if node.type not in LITERALS
+                  and not (node.type == "Identifier" and arguments.get(node.value, node).type in LITERALS)]
+        return [node.value if node.type == "Identifier" else None for node in events[:len(expected)]] == expected
+
+# Every integer up to this magnitude is a float exactly, as are sums and
+# products of such integers that stay within it
+EXACT_INTEGERS = 2.0 ** 53
+
+# Comparisons, and the same comparison with its operands swapped
+MIRRORED = {"<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+def substitute(node: AstNode, replacements: Dict[int, AstNode]) -> AstNode:
+    """node with the nodes whose ids are in replacements replaced, outermost
+    first, copying their ancestors rather than changing them"""
+    results: List[AstNode] = []
+    stack = [(node, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if not expanded:
+            replacement = replacements.get(id(node))
+            if replacement is not None:
+                results.append(replacement)
+            elif node.children:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(node.children))
+            else:
+                results.append(node)
+            continue
+        count = len(node.children)
+        node = with_children(node, results[-count:])
+        del results[-count:]
+        results.append(node)
+    return results[0]
+
+def reaching_literals(names: Set[str], before: List[AstNode]) -> Dict[str, AstNode]:
+    """The literals that the statements before leave in those of names that
+    they leave holding one"""
+    found: Dict[str, AstNode] = {}
+    pending = set(names)
+    for statement in reversed(before):
+        if not pending:
+            break
+        if statement.type == "Assignment":
+            if statement.value in pending:
+                pending.discard(statement.value)
+                if statement.children[0].type in LITERALS:
+                    found[statement.value] = statement.children[0]
+        else:
+            pending -= assigned_names([statement])
+    return found
+
+def value_facts(node: AstNode, numeric: Set[str]) -> Tuple[bool, bool]:
+    """Whether node always evaluates to a number, and whether its evaluation
+    can never fail, given the names sure to hold numbers"""
+    facts: Dict[int, Tuple[bool, bool]] = {}
+    for current, _ in evaluation_order(node):
+        children = [facts[id(child)] for child in current.children]
+        if current.type in LITERALS:
+            result = (current.type == "Number", True)
+        elif current.type == "Identifier":
+            result = (current.value in numeric,) * 2
+        elif current.type == "UnaryOp" and current.value == "-":
+            result = (children[0][0],) * 2
+        elif current.type == "UnaryOp" and current.value == "!":
+            result = (False, children[0][1])
+        elif current.type == "BinaryOp":
+            (left_numeric, left_safe), (right_numeric, right_safe) = children
+            if current.value in ("+", "-", "*"):
+                result = (left_numeric and right_numeric,) * 2
+            elif current.value == "/":
+                divisor = current.children[1]
+                result = (left_numeric and divisor.type == "Number" and float(divisor.value) != 0,) * 2
+            elif current.value in MIRRORED:
+                result = (False, left_numeric and right_numeric)
+            elif current.value in ("۩", "==", "!="):
+                result = (False, left_safe and right_safe)
+            elif current.value in ("&&", "||"):
+                result = (left_numeric and right_numeric, left_safe and right_safe)
+            else:
+                result = (False, False)
+        else:
+            result = (False, False)
+        facts[id(current)] = result
+    return facts[id(node)]
+
+class LoopOptimization(OptimizationPass):
+    """Optimize While loops in the Program and in each FunctionDef.
+    
+    Invariant expressions, which make no calls and read no variable the
+    loop assigns, are computed once before the loop instead of on every
+    iteration. Only those an iteration evaluates before anything that
+    could have an effect are hoisted, so only which of several failures
+    is reported first may differ; if one comes from the body rather than
+    the condition, the loop is put under an If on its condition, so that
+    nothing is evaluated when the loop never runs.
+    
+    A multiplication of the loop's counter by a positive integer, found
+    at least twice, is replaced by a variable stepped alongside the
+    counter. This is only done where the counter is an integer stepped by
+    an integer towards a literal bound, so the sums are exact.
+    
+    Inside a function, assignments in loops to locals the function never
+    reads are dropped if their value cannot fail to evaluate.
+    
+    Variables introduced are named with a "#", which no identifier can
+    contain.
+    """
+    node_types = frozenset(("Program", "FunctionDef"))
+    
+    def __init__(self):
+        super().__init__("loop_optimization")
+        self.temporaries = 0
+    
+    def optimize(self, node: AstNode) -> AstNode:
+        # Names read in the function, whose locals no longer exist once it returns
+        reads = None
+        if node.type == "FunctionDef":
+            reads = {child.value for child, _ in evaluation_order(node) if child.type == "Identifier"}
+        return with_children(node, self.statements(node.children, reads))
+    
+    def statements(self, nodes: List[AstNode], reads: Optional[Set[str]]) -> List[AstNode]:
+        result: List[AstNode] = []
+        for node in nodes:
+            node = self.nested(node, reads)
+            if node.type == "While":
+                result.extend(self.loop(node, result, reads))
+            else:
+                result.append(node)
+        return result
+    
+    def nested(self, node: AstNode, reads: Optional[Set[str]]) -> AstNode:
+        """node with the loops among the statements nested in it optimized"""
+        if node.type in ("Block", "EntryPoint"):
+            return with_children(node, self.statements(node.children, reads))
+        if node.type == "If":
+            return with_children(node, node.children[:1] + [self.nested(branch, reads) for branch in node.children[1:]])
+        if node.type == "While":
+            return with_children(node, node.children[:1] + self.statements(node.children[1:], reads))
         return node
+    
+    def temporary(self, kind: str, reads: Optional[Set[str]]) -> str:
+        self.temporaries += 1
+        name = f"{kind}#{self.temporaries}"
+        if reads is not None:
+            reads.add(name)
+        return name
+    
+    def loop(self, loop: AstNode, before: List[AstNode], reads: Optional[Set[str]]) -> List[AstNode]:
+        """The statements to run in place of loop, given the statements before it"""
+        body = loop.children[1:]
+        assigned = assigned_names(body)
+        replacements: Dict[int, AstNode] = {}
+        # Statements to add after the body statement at each index
+        updates: Dict[int, List[AstNode]] = {}
+        hoisted: List[AstNode] = []
+        
+        # Strength reduction
+        induction = self.induction(loop, before)
+        if induction is not None:
+            name, start, step, index, bound = induction
+            products: Dict[float, List[AstNode]] = {}
+            for node, _ in evaluation_order(loop):
+                if node.type == "BinaryOp" and node.value == "*":
+                    left, right = node.children
+                    if right.type == "Identifier":
+                        left, right = right, left
+                    if left.type == "Identifier" and left.value == name and right.type == "Number":
+                        factor = float(right.value)
+                        if factor > 0 and factor.is_integer() and bound * factor <= EXACT_INTEGERS:
+                            products.setdefault(factor, []).append(node)
+            for factor, nodes in products.items():
+                if len(nodes) < 2:
+                    continue
+                stride = self.temporary("stride", reads)
+                hoisted.append(AstNode("Assignment", stride, [AstNode("Number", str(start * factor))], name=stride))
+                updates.setdefault(index, []).append(AstNode("Assignment", stride, [AstNode(
+                    "BinaryOp", "+", [AstNode("Identifier", stride), AstNode("Number", str(step * factor))])], name=stride))
+                for node in nodes:
+                    replacements[id(node)] = AstNode("Identifier", stride)
+        
+        # Invariant code motion
+        shapes: Dict[int, int] = {}
+        interned: Dict[Tuple[Any, ...], int] = {}
+        invariant: Set[int] = set()
+        variable: Set[int] = set()
+        maximal: Set[int] = set()
+        for node, _ in evaluation_order(loop):
+            key = (node.type, node.value) + tuple(shapes[id(child)] for child in node.children)
+            shapes[id(node)] = interned.setdefault(key, len(interned))
+            if node.type in LITERALS:
+                invariant.add(id(node))
+            elif node.type == "Identifier":
+                if node.value not in assigned:
+                    invariant.add(id(node))
+                    variable.add(id(node))
+            elif node.type in ("BinaryOp", "UnaryOp") and all(id(child) in invariant for child in node.children):
+                invariant.add(id(node))
+                if any(id(child) in variable for child in node.children):
+                    variable.add(id(node))
+                continue
+            for child in node.children:
+                if id(child) in variable and child.type in ("BinaryOp", "UnaryOp"):
+                    maximal.add(id(child))
+        hoist: Dict[int, str] = {}
+        guard = False
+        for node, conditional, in_condition in self.prefix(loop):
+            shape = shapes[id(node)]
+            if id(node) in maximal and not conditional and shape not in hoist:
+                hoist[shape] = self.temporary("invariant", reads)
+                hoisted.append(AstNode("Assignment", hoist[shape], [node], name=hoist[shape]))
+                guard = guard or not in_condition
+        if hoist:
+            for node, _ in evaluation_order(loop):
+                if node.type in ("BinaryOp", "UnaryOp") and shapes[id(node)] in hoist and id(node) not in replacements:
+                    replacements[id(node)] = AstNode("Identifier", hoist[shapes[id(node)]])
+        
+        # Dead assignments
+        dead: Set[int] = set()
+        if reads is not None:
+            numeric = self.numeric_names(loop, assigned, before)
+            for index, statement in enumerate(body):
+                if (statement.type == "Assignment" and statement.value not in reads
+                        and value_facts(statement.children[0], numeric)[1]):
+                    dead.add(index)
+        
+        if not replacements and not dead:
+            return [loop]
+        condition = substitute(loop.children[0], replacements)
+        statements: List[AstNode] = []
+        for index, statement in enumerate(body):
+            if index not in dead:
+                statements.append(substitute(statement, replacements))
+            statements.extend(updates.get(index, ()))
+        result = with_children(loop, [condition] + statements)
+        if guard:
+            # A copy, as no node may appear twice in the tree
+            return [AstNode("If", None, [transform(loop.children[0], copy_leaf), AstNode("Block", None, hoisted + [result])])]
+        return hoisted + [result]
+    
+    def prefix(self, loop: AstNode) -> List[Tuple[AstNode, bool, bool]]:
+        """The nodes an iteration of loop evaluates before anything that could
+        have an effect, each with whether it is only evaluated depending on a
+        && or || operand, and whether it is in the condition"""
+        events: List[Tuple[AstNode, bool, bool]] = []
+        for position, statement in enumerate(loop.children):
+            if position == 0 or statement.type in EXPRESSIONS:
+                expression = statement
+            elif statement.type in ("Assignment", "If", "While", "Return") and statement.children:
+                expression = statement.children[0]
+            else:
+                break
+            for node, conditional in evaluation_order(expression):
+                if node.type == "FunctionCall":
+                    return events
+                events.append((node, conditional, position == 0))
+            # Assignments take effect, and branches, loops and returns may
+            if position > 0 and statement.type not in EXPRESSIONS:
+                break
+        return events
+    
+    def induction(self, loop: AstNode, before: List[AstNode]) -> Optional[Tuple[str, float, float, int, float]]:
+        """The counter of loop, compared with a literal bound in its condition and
+        stepped by an integer once per iteration, as its name, start, step,
+        the index of the body statement stepping it and a bound on its
+        magnitude; or None if loop has no such counter"""
+        condition = loop.children[0]
+        if condition.type != "BinaryOp" or condition.value not in MIRRORED:
+            return None
+        (left, right), comparison = condition.children, condition.value
+        if left.type == "Number":
+            left, right, comparison = right, left, MIRRORED[comparison]
+        if left.type != "Identifier" or right.type != "Number":
+            return None
+        name, limit = left.value, float(right.value)
+        assignments = [node for node, _ in evaluation_order(loop) if node.type == "Assignment" and node.value == name]
+        if len(assignments) != 1:
+            return None
+        body = loop.children[1:]
+        index = next((index for index, statement in enumerate(body) if statement is assignments[0]), None)
+        value = assignments[0].children[0]
+        if index is None or value.type != "BinaryOp" or value.value not in ("+", "-"):
+            return None
+        operands = value.children
+        if value.value == "+" and operands[0].type == "Number":
+            operands = operands[::-1]
+        if operands[0].type != "Identifier" or operands[0].value != name or operands[1].type != "Number":
+            return None
+        step = float(operands[1].value) * (1 if value.value == "+" else -1)
+        start = reaching_literals({name}, before).get(name)
+        if start is None or start.type != "Number":
+            return None
+        initial = float(start.value)
+        # The counter must approach the bound, so it stays between the two
+        if not (initial.is_integer() and step.is_integer() and (comparison in ("<", "<=")) == (step > 0)):
+            return None
+        bound = max(abs(initial), abs(limit) + abs(step))
+        if not bound <= EXACT_INTEGERS:
+            return None
+        return name, initial, step, index, bound
+    
+    def numeric_names(self, loop: AstNode, assigned: Set[str], before: List[AstNode]) -> Set[str]:
+        """Names sure to hold a number throughout loop"""
+        order = evaluation_order(loop)
+        names = {node.value for node, _ in order if node.type == "Identifier"} | assigned
+        numeric = {name for name, value in reaching_literals(names, before).items() if value.type == "Number"}
+        assignments = [node for node, _ in order if node.type == "Assignment"]
+        changed = True
+        while changed:
+            changed = False
+            for assignment in assignments:
+                if assignment.value in numeric and not value_facts(assignment.children[0], numeric)[0]:
+                    numeric.discard(assignment.value)
+                    changed = True
+        return numeric
 
 class DeadCodeElimination(OptimizationPass):
     """Eliminate unreachable code"""
+    node_types = frozenset(("If", "While"))
+    
     def __init__(self):
         super().__init__("dead_code_elimination")
     
@@ -46,11 +721,21 @@ class DeadCodeElimination(OptimizationPass):
                     return node.children[1]  # Return then branch
                 elif condition.value == "false" and len(node.children) > 2:
                     return node.children[2]  # Return else branch
-                
+            taken = truth(condition)
+            if taken is not None:
+                if taken:
+                    return node.children[1]
+                return node.children[2] if len(node.children) > 2 else AstNode("Block")
+        elif node.type == "While" and truth(node.children[0]) is False:
+            # Never entered; a While's value is None, as an empty Block's is
+            return AstNode("Block")
+        
         return node
 
 class ExpressionSimplification(OptimizationPass):
     """Simplify expressions like x * 1, x + 0"""
+    node_types = frozenset(("BinaryOp",))
+    
     def __init__(self):
         super().__init__("expression_simplification")
     
@@ -73,32 +758,107 @@ class ExpressionSimplification(OptimizationPass):
         return node
 
 class Optimizer:
-    """Main optimizer class that runs all optimization passes"""
-    def __init__(self):
+    """Main optimizer class that runs all optimization passes.
+    
+    Passes are applied together in one post-order traversal, so each node
+    is rewritten only once its children are final, until no pass changes
+    it. A node returned in its place goes back on the worklist, and only
+    its descendants that are not final yet are visited with it; the
+    ancestors, still pending, then see the change. With timed=True the
+    time each pass takes is recorded in stats as well.
+    """
+    def __init__(self, timed: bool = False):
         self.passes: List[OptimizationPass] = [
+            FunctionInlining(),
+            ConstantPropagation(),
+            LoopOptimization(),
             ConstantFolding(),
             DeadCodeElimination(),
             ExpressionSimplification()
         ]
+        self.timed = timed
+        self.stats: Dict[str, PassStats] = {}
+        self.visited = 0
     
     def optimize(self, node: AstNode) -> AstNode:
         """Run all optimization passes on the AST"""
-        modified = True
-        while modified:
-            modified = False
-            for pass_ in self.passes:
-                if pass_.enabled:
-                    new_node = self._optimize_tree(node, pass_)
-                    if new_node != node:
-                        node = new_node
-                        modified = True
-        return node
-    
-    def _optimize_tree(self, node: AstNode, pass_: OptimizationPass) -> AstNode:
-        """Recursively optimize a node and its children"""
-        # First optimize children
-        if node.children:
-            node.children = [self._optimize_tree(child, pass_) for child in node.children]
+        if isinstance(node, NodeView):
+            # Views are made afresh on every access, so neither the worklist
+            # nor the passes could tell them apart or put replacements back;
+            # arena trees are optimized as AstNodes and, if changed, stored
+            # in the arena again
+            arena = node.arena
+            rewrites = self.rewrites()
+            optimized = self.optimize(node.to_node())
+            if self.rewrites() == rewrites:
+                return node
+            return arena.view(arena.adopt(optimized))
+        enabled = [(pass_, self.stats.setdefault(pass_.name, PassStats())) for pass_ in self.passes if pass_.enabled]
+        # The enabled passes for each node type, found as types turn up
+        by_type: Dict[str, List[Tuple[OptimizationPass, PassStats]]] = {}
+        
+        def passes_for(node_type: str) -> List[Tuple[OptimizationPass, PassStats]]:
+            passes = by_type[node_type] = [(pass_, stats) for pass_, stats in enabled
+                                           if pass_.node_types is None or node_type in pass_.node_types]
+            return passes
         
-        # Then optimize this node
-        return pass_.optimize(node) 
\ No newline at end of file
+        timed = self.timed
+        clock = time.perf_counter
+        # Ids of final nodes; replaced nodes are kept so their ids are not reused
+        final: Set[int] = set()
+        replaced: List[AstNode] = []
+        root = [node]
+        visited = 0
+        # (node, list holding it, its index there); an index is stored
+        # inverted once the node's children are on the stack. Leaves no
+        # pass rewrites are never pushed
+        stack: List[Tuple[AstNode, List[AstNode], int]] = [(node, root, 0)]
+        push = stack.append
+        pop = stack.pop
+        while stack:
+            node, siblings, index = pop()
+            if index < 0:
+                index = ~index
+            elif node.children:
+                push((node, siblings, ~index))
+                children = node.children
+                for position in range(len(children) - 1, -1, -1):
+                    child = children[position]
+                    if not child.children:
+                        passes = by_type.get(child.type)
+                        if passes is None:
+                            passes = passes_for(child.type)
+                        if not passes:
+                            continue
+                    if id(child) not in final:
+                        push((child, children, position))
+                continue
+            
+            passes = by_type.get(node.type)
+            if passes is None:
+                passes = passes_for(node.type)
+            visited += 1
+            for pass_, stats in passes:
+                stats.calls += 1
+                if timed:
+                    start = clock()
+                    new_node = pass_.optimize(node)
+                    stats.seconds += clock() - start
+                else:
+                    new_node = pass_.optimize(node)
+                if new_node is not node:
+                    stats.rewrites += 1
+                    break
+            else:
+                final.add(id(node))
+                continue
+            replaced.append(node)
+            siblings[index] = new_node
+            if id(new_node) not in final:
+                push((new_node, siblings, index))
+        self.visited += visited
+        return root[0]
+    
+    def rewrites(self) -> int:
+        """Nodes rewritten so far, by all passes"""
+        return sum(stats.rewrites for stats in self.stats.values())
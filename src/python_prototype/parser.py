@@ -1,43 +1,76 @@
 # parser.py
 
-from dataclasses import dataclass
-from typing import List, Optional, NoReturn
-from .lexer import Token, TokenType
-from .ast import AstNode
+from typing import Iterable, List, Optional, NoReturn, Sequence, Tuple, Union
+from .lexer import Token, TokenType, TokenStream
+from .symbols import BINARY_OPS
+from .ast import AstArena, AstNode, NodeView, NAMED_TYPES
 from .error import raise_syntax_error, CompilerError
 
-@dataclass
-class AstNode:
-    type: str
-    value: Optional[str] = None
-    children: List['AstNode'] = None
-    
-    def __init__(self, type: str, value: Optional[str] = None):
-        self.type = type
-        self.value = value
-        self.children = []
+# Tokens that continue an expression as a binary operator. Assignment (۝) is a
+# statement in this grammar, so only operators binding tighter than it count.
+BINARY_TOKENS = frozenset((
+    TokenType.OR, TokenType.AND, TokenType.EQUAL_EQUAL, TokenType.BANG_EQUAL,
+    TokenType.LESS, TokenType.LESS_EQUAL, TokenType.GREATER, TokenType.GREATER_EQUAL,
+    TokenType.PLUS, TokenType.MINUS, TokenType.STAR, TokenType.SLASH, TokenType.CONCAT,
+))
+
+Node = Union[AstNode, NodeView]
 
 class Parser:
-    def __init__(self, tokens: List[Token]):
-        self.tokens = tokens
-        self.current = 0
+    def __init__(self, tokens: Iterable[Token], arena: Optional[AstArena] = None):
+        # Tokens may be a list or a lazy iterator such as tokenize_stream();
+        # either way the parser only ever looks a bounded distance ahead.
+        # Statement terminators (۞) are optional, so they never reach the grammar
+        self.tokens = TokenStream(token for token in tokens if token.type != TokenType.END_STATEMENT)
+        # With an arena, nodes are stored as arena rows and returned as views
+        self.arena = arena
     
-    def parse(self) -> AstNode:
+    def node(self, type: str, value: Optional[str] = None, children: Sequence[Node] = (),
+             start: Optional[int] = None, params: Optional[List[str]] = None) -> Node:
+        """Create a node ending at the last consumed token.
+        
+        start defaults to the start of the first child, or of the last
+        consumed token for leaves.
+        """
+        arena = self.arena
+        if arena is None:
+            node = AstNode(type, value, list(children))
+            if params is not None:
+                node.params = params
+            if type in NAMED_TYPES:
+                node.name = value
+            return node
+        
+        previous = self.previous()
+        end = previous.end if previous else 0
+        if start is None:
+            start = arena.starts[children[0].handle] if children else (previous.start if previous else 0)
+        handle = arena.add(type, value, [child.handle for child in children], start, end)
+        if params is not None:
+            arena.params[handle] = params
+        return NodeView(arena, handle)
+    
+    def start(self) -> int:
+        """Source offset of the last consumed token"""
+        return self.previous().start
+    
+    def parse(self) -> Node:
         """Parse the entire program"""
-        root = AstNode("Program")
+        children = []
         
         while not self.is_at_end():
             if self.match(TokenType.ENTRY_POINT):
-                root.children.append(self.parse_entry_point())
+                children.append(self.parse_entry_point())
             elif self.match(TokenType.DEF):
-                root.children.append(self.parse_function_def())
+                children.append(self.parse_function_def())
             else:
-                root.children.append(self.parse_statement())
+                children.append(self.parse_statement())
         
-        return root
+        return self.node("Program", children=children, start=0)
     
-    def parse_function_def(self) -> AstNode:
+    def parse_function_def(self) -> Node:
         """Parse a function definition"""
+        start = self.start()
         name = self.consume(TokenType.IDENTIFIER, "Expected function name").value
         self.consume(TokenType.LEFT_PAREN, "Expected '(' after function name")
         
@@ -51,31 +84,26 @@ class Parser:
         self.consume(TokenType.COLON, "Expected ':' after function declaration")
         
         body = []
-        while not self.check(TokenType.DEF) and not self.check(TokenType.ENTRY_POINT) and not self.is_at_end():
+        while not self.at_block_end():
             body.append(self.parse_statement())
         
-        func_node = AstNode("FunctionDef", name)
-        func_node.params = params
-        func_node.children = body
-        return func_node
+        return self.node("FunctionDef", name, body, start, params)
     
-    def parse_entry_point(self) -> AstNode:
+    def parse_entry_point(self) -> Node:
         """Parse the main entry point (﷽)"""
-        node = AstNode("EntryPoint")
+        start = self.start()
         self.consume(TokenType.COLON, "Expected ':' after entry point")
         
-        while not self.is_at_end() and not self.check(TokenType.ENTRY_POINT):
-            node.children.append(self.parse_statement())
+        body = []
+        while not self.at_block_end():
+            body.append(self.parse_statement())
         
-        return node
+        return self.node("EntryPoint", children=body, start=start)
     
-    def parse_statement(self) -> AstNode:
+    def parse_statement(self) -> Node:
         """Parse a single statement"""
-        if self.match(TokenType.IDENTIFIER):
-            if self.match(TokenType.ASSIGN):
-                return self.parse_assignment()
-            else:
-                return self.parse_expression()
+        if self.check(TokenType.IDENTIFIER) and self.check_next(TokenType.ASSIGN):
+            return self.parse_assignment()
         elif self.match(TokenType.IF):
             return self.parse_if_statement()
         elif self.match(TokenType.WHILE):
@@ -85,95 +113,132 @@ class Parser:
         else:
             return self.parse_expression()
     
-    def parse_expression(self) -> AstNode:
+    def parse_expression(self) -> Node:
         """Parse an expression"""
         return self.parse_binary()
     
-    def parse_binary(self) -> AstNode:
-        """Parse binary operations"""
-        left = self.parse_unary()
+    def parse_binary(self) -> Node:
+        """Parse binary operations by precedence climbing over symbols.BINARY_OPS.
+        
+        Operands and pending operators are kept on explicit stacks, so long
+        operator chains never recurse. All operators are left-associative.
+        """
+        operands = [self.parse_unary()]
+        operators: List[Tuple[str, int]] = []
         
-        while self.match(TokenType.PLUS, TokenType.MINUS, TokenType.STAR, TokenType.SLASH):
-            operator = self.previous().value
-            right = self.parse_unary()
-            node = AstNode("BinaryOp", operator)
-            node.children = [left, right]
-            left = node
+        while True:
+            token = self.peek()
+            if token is None or token.type not in BINARY_TOKENS:
+                break
+            precedence = BINARY_OPS[token.value]
+            while operators and operators[-1][1] >= precedence:
+                self._reduce(operands, operators.pop()[0])
+            self.advance()
+            operators.append((token.value, precedence))
+            operands.append(self.parse_unary())
         
-        return left
+        while operators:
+            self._reduce(operands, operators.pop()[0])
+        return operands[0]
     
-    def parse_unary(self) -> AstNode:
+    def _reduce(self, operands: List[Node], operator: str) -> None:
+        """Replace the top two operands with a BinaryOp node"""
+        right = operands.pop()
+        operands.append(self.node("BinaryOp", operator, [operands.pop(), right]))
+    
+    def parse_unary(self) -> Node:
         """Parse unary operations"""
-        if self.match(TokenType.MINUS, TokenType.NOT):
-            operator = self.previous().value
-            right = self.parse_unary()
-            node = AstNode("UnaryOp", operator)
-            node.children = [right]
-            return node
+        operators = []
+        while self.match(TokenType.MINUS, TokenType.NOT):
+            operators.append((self.previous().value, self.start()))
+        
+        node = self.parse_call()
+        for operator, start in reversed(operators):
+            node = self.node("UnaryOp", operator, [node], start)
+        return node
+    
+    def parse_call(self) -> Node:
+        """Parse a function call, or a primary expression"""
+        token = self.peek()
+        start = token.start if token else 0
+        node = self.parse_primary()
         
-        return self.parse_primary()
+        while self.match(TokenType.LEFT_PAREN):
+            if node.type != "Identifier":
+                raise self.error("Only named functions can be called")
+            args = []
+            if not self.check(TokenType.RIGHT_PAREN):
+                args.append(self.parse_expression())
+                while self.match(TokenType.COMMA):
+                    args.append(self.parse_expression())
+            self.consume(TokenType.RIGHT_PAREN, "Expected ')' after arguments")
+            node = self.node("FunctionCall", node.value, args, start)
+        
+        return node
     
-    def parse_primary(self) -> AstNode:
+    def parse_primary(self) -> Node:
         """Parse primary expressions"""
         if self.match(TokenType.NUMBER):
-            return AstNode("Number", str(self.previous().value))
+            return self.node("Number", str(self.previous().value))
         elif self.match(TokenType.STRING):
-            return AstNode("String", self.previous().value)
+            return self.node("String", self.previous().value)
         elif self.match(TokenType.IDENTIFIER):
-            return AstNode("Identifier", self.previous().value)
+            return self.node("Identifier", self.previous().value)
+        elif self.match(TokenType.LEFT_PAREN):
+            node = self.parse_expression()
+            self.consume(TokenType.RIGHT_PAREN, "Expected ')' after expression")
+            return node
         
         raise self.error("Expected expression")
     
-    def parse_assignment(self) -> AstNode:
+    def parse_assignment(self) -> Node:
         """Parse an assignment statement"""
-        name = self.previous().value
+        name = self.consume(TokenType.IDENTIFIER, "Expected variable name").value
+        start = self.start()
         self.consume(TokenType.ASSIGN, "Expected '۝' after variable name")
         value = self.parse_expression()
         
-        node = AstNode("Assignment")
-        node.name = str(name)  # Ensure name is str
-        node.children = [value]
-        return node
+        return self.node("Assignment", str(name), [value], start)
     
-    def parse_if_statement(self) -> AstNode:
+    def parse_if_statement(self) -> Node:
         """Parse an if statement"""
+        start = self.start()
         condition = self.parse_expression()
         self.consume(TokenType.COLON, "Expected ':' after if condition")
         
         then_branch = []
-        while not self.check(TokenType.ELSE) and not self.is_at_end():
+        while not self.check(TokenType.ELSE) and not self.at_block_end():
             then_branch.append(self.parse_statement())
+        children = [condition, self.node("Block", children=then_branch)]
         
-        else_branch = []
         if self.match(TokenType.ELSE):
             self.consume(TokenType.COLON, "Expected ':' after else")
-            while not self.is_at_end():
+            else_branch = []
+            while not self.at_block_end():
                 else_branch.append(self.parse_statement())
+            children.append(self.node("Block", children=else_branch))
         
-        node = AstNode("If")
-        node.children = [condition, *then_branch, *else_branch]
-        return node
+        # Branches are Blocks so the else statements stay distinguishable
+        return self.node("If", children=children, start=start)
     
-    def parse_while_loop(self) -> AstNode:
+    def parse_while_loop(self) -> Node:
         """Parse a while loop"""
+        start = self.start()
         condition = self.parse_expression()
         self.consume(TokenType.COLON, "Expected ':' after while condition")
         
         body = []
-        while not self.is_at_end():
+        while not self.at_block_end():
             body.append(self.parse_statement())
         
-        node = AstNode("While")
-        node.children = [condition, *body]
-        return node
+        return self.node("While", children=[condition, *body], start=start)
     
-    def parse_return(self) -> AstNode:
+    def parse_return(self) -> Node:
         """Parse a return statement"""
-        value = self.parse_expression() if not self.check(TokenType.COLON) else None
-        node = AstNode("Return")
-        if value:
-            node.children = [value]
-        return node
+        start = self.start()
+        ends_statement = self.check(TokenType.COLON) or self.check(TokenType.ELSE) or self.at_block_end()
+        value = None if ends_statement else self.parse_expression()
+        return self.node("Return", children=[value] if value else [], start=start)
     
     # Helper methods
     def match(self, *types: TokenType) -> bool:
@@ -184,23 +249,28 @@ class Parser:
         return False
     
     def check(self, type: TokenType) -> bool:
-        if self.is_at_end():
-            return False
-        return self.peek().type == type
+        token = self.tokens.peek()
+        return token is not None and token.type == type
+    
+    def check_next(self, type: TokenType) -> bool:
+        token = self.tokens.peek(1)
+        return token is not None and token.type == type
     
     def advance(self) -> Token:
-        if not self.is_at_end():
-            self.current += 1
-        return self.previous()
+        return self.tokens.advance()
     
     def is_at_end(self) -> bool:
-        return self.current >= len(self.tokens)
+        return self.tokens.at_end()
+    
+    def at_block_end(self) -> bool:
+        """Blocks have no closing token, so every body runs to the next top-level item"""
+        return self.is_at_end() or self.check(TokenType.DEF) or self.check(TokenType.ENTRY_POINT)
     
     def peek(self) -> Token:
-        return self.tokens[self.current]
+        return self.tokens.peek()
     
     def previous(self) -> Token:
-        return self.tokens[self.current - 1]
+        return self.tokens.previous()
     
     def consume(self, type: TokenType, message: str) -> Token:
         if self.check(type):
@@ -209,10 +279,18 @@ class Parser:
     
     def error(self, message: str) -> NoReturn:
         """Raise a syntax error with the current token information"""
-        raise_syntax_error(message)
+        token = self.peek() or self.previous()
+        if token is None:
+            raise_syntax_error(message)
+        else:
+            raise_syntax_error(message, token.line, token.column)
         raise CompilerError(message)  # Ensure NoReturn
 
-def parse(tokens: List[Token]) -> AstNode:
-    """Parse a list of tokens into an AST"""
-    parser = Parser(tokens)
+def parse(tokens: Iterable[Token], arena: Optional[AstArena] = None) -> Node:
+    """Parse a list or stream of tokens into an AST.
+    
+    Given an arena, the tree is stored there and the root is returned as a
+    NodeView.
+    """
+    parser = Parser(tokens, arena)
     return parser.parse()
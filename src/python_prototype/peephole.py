@@ -0,0 +1,252 @@
+# peephole.py
+
+from dataclasses import dataclass
+from typing import List, Optional, Set
+from .bytecode import (COMPARE_JUMPS, FAST_CONST_OPS, JUMPS, NAME_CONST_OPS, PACK_MASK, CodeObject, Instruction,
+                       OpCode, assemble, jump_target, pack, retarget, to_instructions, unpack)
+
+# Optimisation levels: 0 leaves bytecode alone, 1 threads jumps and removes
+# dead code, 2 also drops dead stores and fuses superinstructions
+NO_OPTIMIZATION = 0
+BASIC_OPTIMIZATION = 1
+FULL_OPTIMIZATION = 2
+DEFAULT_OPTIMIZATION = BASIC_OPTIMIZATION
+
+# Instructions after which control never falls through
+TERMINATORS = frozenset((OpCode.JUMP_ABSOLUTE, OpCode.RETURN_VALUE))
+
+# Store opcodes, and the opcodes that read what they store, by variable kind
+STORES = {OpCode.STORE_NAME: "global", OpCode.STORE_FAST: "local"}
+LOADS = {
+    OpCode.LOAD_NAME: "global", OpCode.LOAD_GLOBAL: "global", OpCode.LOAD_FAST: "local",
+    OpCode.LOAD_NAME_LOAD_CONST_ADD: "global", OpCode.INCR_NAME: "global",
+    OpCode.LOAD_FAST_LOAD_CONST_ADD: "local", OpCode.INCR_FAST: "local",
+}
+
+# Superinstructions for load, LOAD_CONST, BINARY_ADD (and a store back to the
+# same variable), keyed by the load opcode. They stand in for BINARY_ADD_FLOAT
+# too, adding whatever their operands are
+ADD_CONST_FUSIONS = {
+    OpCode.LOAD_NAME: (OpCode.STORE_NAME, OpCode.LOAD_NAME_LOAD_CONST_ADD, OpCode.INCR_NAME),
+    OpCode.LOAD_GLOBAL: (OpCode.STORE_NAME, OpCode.LOAD_NAME_LOAD_CONST_ADD, OpCode.INCR_NAME),
+    OpCode.LOAD_FAST: (OpCode.STORE_FAST, OpCode.LOAD_FAST_LOAD_CONST_ADD, OpCode.INCR_FAST),
+}
+
+ADDS = frozenset((OpCode.BINARY_ADD, OpCode.BINARY_ADD_FLOAT))
+
+@dataclass
+class PeepholeStats:
+    """What the peephole optimiser did, summed over all code objects"""
+    instructions_before: int = 0
+    instructions_after: int = 0
+    threaded_jumps: int = 0
+    dead_instructions: int = 0
+    dead_stores: int = 0
+    superinstructions: int = 0
+
+    @property
+    def removed(self) -> int:
+        return self.instructions_before - self.instructions_after
+
+def _is_jump(opcode: int) -> bool:
+    return opcode in JUMPS or opcode in COMPARE_JUMPS
+
+def _variable(instruction: Instruction) -> int:
+    """The name index or local slot an instruction loads or stores"""
+    if instruction.opcode in NAME_CONST_OPS or instruction.opcode in FAST_CONST_OPS:
+        return unpack(instruction.arg)[0]
+    return instruction.arg
+
+class PeepholeOptimizer:
+    """Rewrites compiled CodeObjects with bytecode-level optimisations.
+
+    Works on Instruction lists whose jumps target instruction indices;
+    passes mark instructions as None and _compact() removes them, moving
+    jumps aimed at a removed instruction on to the next surviving one.
+    """
+    def __init__(self, level: int = DEFAULT_OPTIMIZATION):
+        self.level = level
+        self.stats = PeepholeStats()
+
+    def optimize(self, code: CodeObject) -> CodeObject:
+        """Return an optimised copy of code and of the functions nested in it"""
+        consts = [self.optimize(const) if isinstance(const, CodeObject) else const for const in code.consts]
+        instructions = to_instructions(code)
+        self.stats.instructions_before += len(instructions)
+        if self.level >= BASIC_OPTIMIZATION:
+            # Each pass can expose work for the others
+            changed = True
+            while changed:
+                changed = self._thread_jumps(instructions)
+                instructions, removed = self._compact(self._remove_dead_code(instructions))
+                changed = changed or removed
+                if self.level >= FULL_OPTIMIZATION:
+                    dead_stores = self.stats.dead_stores
+                    instructions, _ = self._compact(self._remove_dead_stores(instructions))
+                    changed = changed or self.stats.dead_stores != dead_stores
+        if self.level >= FULL_OPTIMIZATION:
+            instructions, _ = self._compact(self._fuse(instructions))
+        self.stats.instructions_after += len(instructions)
+        return assemble(instructions, consts, code.names, code.name, code.params, code.varnames)
+
+    def _thread_jumps(self, instructions: List[Instruction]) -> bool:
+        """Point jumps at the final target of any chain of unconditional jumps"""
+        changed = False
+        for instruction in instructions:
+            if not _is_jump(instruction.opcode):
+                continue
+            target = jump_target(instruction.opcode, instruction.arg)
+            seen: Set[int] = set()
+            while (target < len(instructions) and target not in seen
+                   and instructions[target].opcode == OpCode.JUMP_ABSOLUTE):
+                seen.add(target)
+                target = instructions[target].arg
+            if target != jump_target(instruction.opcode, instruction.arg):
+                instruction.arg = retarget(instruction.opcode, instruction.arg, target)
+                self.stats.threaded_jumps += 1
+                changed = True
+            if (instruction.opcode == OpCode.JUMP_ABSOLUTE and target < len(instructions)
+                    and instructions[target].opcode == OpCode.RETURN_VALUE):
+                # Returning from here leaves the same stack as jumping to the return
+                instruction.opcode = OpCode.RETURN_VALUE
+                instruction.arg = None
+                self.stats.threaded_jumps += 1
+                changed = True
+        return changed
+
+    def _remove_dead_code(self, instructions: List[Instruction]) -> List[Optional[Instruction]]:
+        """Drop unreachable instructions, no-op jumps and discarded constants"""
+        reachable = [False] * len(instructions)
+        pending = [0] if instructions else []
+        while pending:
+            index = pending.pop()
+            while index < len(instructions) and not reachable[index]:
+                reachable[index] = True
+                instruction = instructions[index]
+                if _is_jump(instruction.opcode):
+                    pending.append(jump_target(instruction.opcode, instruction.arg))
+                if instruction.opcode in TERMINATORS:
+                    break
+                index += 1
+
+        result: List[Optional[Instruction]] = []
+        for index, instruction in enumerate(instructions):
+            if not reachable[index]:
+                self.stats.dead_instructions += 1
+                result.append(None)
+            elif instruction.opcode == OpCode.JUMP_ABSOLUTE and instruction.arg == index + 1:
+                self.stats.dead_instructions += 1
+                result.append(None)
+            elif instruction.opcode == OpCode.POP_JUMP_IF_FALSE and instruction.arg == index + 1:
+                result.append(Instruction(OpCode.POP_TOP))
+            else:
+                result.append(instruction)
+
+        targets = self._targets(instructions)
+        for index in range(len(result) - 1):
+            first, second = result[index], result[index + 1]
+            if (first is not None and second is not None and first.opcode == OpCode.LOAD_CONST
+                    and second.opcode == OpCode.POP_TOP and index + 1 not in targets):
+                result[index] = result[index + 1] = None
+                self.stats.dead_instructions += 2
+        return result
+
+    def _remove_dead_stores(self, instructions: List[Instruction]) -> List[Optional[Instruction]]:
+        """Turn a store overwritten later in the same basic block into POP_TOP.
+
+        Globals may be read by any called function, so a call between two
+        stores to a global keeps the first one alive.
+        """
+        targets = self._targets(instructions)
+        result: List[Optional[Instruction]] = list(instructions)
+        for index, instruction in enumerate(instructions):
+            kind = STORES.get(instruction.opcode)
+            if kind is None:
+                continue
+            variable = instruction.arg
+            for later in range(index + 1, len(instructions)):
+                following = instructions[later]
+                opcode = following.opcode
+                if later in targets or _is_jump(opcode) or opcode in TERMINATORS:
+                    break
+                if LOADS.get(opcode) == kind and _variable(following) == variable:
+                    break
+                if opcode == OpCode.CALL_FUNCTION and kind == "global":
+                    break
+                if opcode == instruction.opcode and following.arg == variable:
+                    result[index] = Instruction(OpCode.POP_TOP)
+                    self.stats.dead_stores += 1
+                    break
+        return result
+
+    def _fuse(self, instructions: List[Instruction]) -> List[Optional[Instruction]]:
+        """Replace common sequences with superinstructions"""
+        targets = self._targets(instructions)
+        result: List[Optional[Instruction]] = list(instructions)
+        index = 0
+        while index < len(instructions):
+            window = instructions[index:index + 4]
+            opcodes = [instruction.opcode for instruction in window]
+            inside = any(index + offset in targets for offset in range(1, len(window)))
+
+            fusion = ADD_CONST_FUSIONS.get(opcodes[0])
+            if (fusion is not None and len(window) > 2 and opcodes[1] == OpCode.LOAD_CONST and opcodes[2] in ADDS
+                    and window[0].arg <= PACK_MASK and window[1].arg <= PACK_MASK):
+                store, add_const, increment = fusion
+                packed = pack(window[0].arg, window[1].arg)
+                if len(window) == 4 and opcodes[3] == store and window[3].arg == window[0].arg and not inside:
+                    # x ۝ x + c
+                    result[index] = Instruction(increment, packed)
+                    result[index + 1:index + 4] = [None, None, None]
+                    self.stats.superinstructions += 1
+                    index += 4
+                    continue
+                if not any(index + offset in targets for offset in (1, 2)):
+                    result[index] = Instruction(add_const, packed)
+                    result[index + 1:index + 3] = [None, None]
+                    self.stats.superinstructions += 1
+                    index += 3
+                    continue
+
+            if (opcodes[:2] == [OpCode.COMPARE_OP, OpCode.POP_JUMP_IF_FALSE]
+                    and index + 1 not in targets):
+                arg = retarget(OpCode.COMPARE_JUMP_IF_FALSE, window[0].arg, window[1].arg)
+                result[index] = Instruction(OpCode.COMPARE_JUMP_IF_FALSE, arg)
+                result[index + 1] = None
+                self.stats.superinstructions += 1
+                index += 2
+                continue
+            index += 1
+        return result
+
+    def _targets(self, instructions: List[Instruction]) -> Set[int]:
+        return {jump_target(instruction.opcode, instruction.arg)
+                for instruction in instructions if _is_jump(instruction.opcode)}
+
+    def _compact(self, instructions: List[Optional[Instruction]]):
+        """Remove None entries, remapping jump targets; returns (instructions, changed)"""
+        if None not in instructions:
+            return instructions, False
+        new_index: List[int] = []
+        count = 0
+        for instruction in instructions:
+            new_index.append(count)
+            if instruction is not None:
+                count += 1
+        new_index.append(count)
+
+        result = []
+        for instruction in instructions:
+            if instruction is None:
+                continue
+            if _is_jump(instruction.opcode):
+                target = new_index[jump_target(instruction.opcode, instruction.arg)]
+                instruction = Instruction(instruction.opcode, retarget(instruction.opcode, instruction.arg, target))
+            result.append(instruction)
+        return result, True
+
+def optimize_code(code: CodeObject, level: int = DEFAULT_OPTIMIZATION) -> CodeObject:
+    """Run the peephole optimiser at the given level"""
+    if level <= NO_OPTIMIZATION:
+        return code
+    return PeepholeOptimizer(level).optimize(code)
@@ -0,0 +1,559 @@
+# regvm.py
+
+import operator
+from enum import IntEnum
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+from .ast import AstNode
+from .builtins import BUILTIN_FUNCTIONS
+from .bytecode import COMPARE_OPS
+from .compiler import EXPRESSIONS
+from .error import raise_syntax_error
+from .vm import RETURNED, UNBOUND
+
+class RegisterOp(IntEnum):
+    """Three-address instructions (opcode, a, b, c) over a frame's registers.
+
+    Jump targets are always operand c.
+    """
+    MOVE = 1            # r[a] = r[b]
+    LOAD_NAME = 2       # r[a] = global or builtin names[b]
+    STORE_NAME = 3      # globals[names[b]] = r[a]
+    ADD = 4             # r[a] = r[b] + r[c]
+    SUBTRACT = 5
+    MULTIPLY = 6
+    DIVIDE = 7
+    CONCAT = 8
+    NEGATIVE = 9        # r[a] = -r[b]
+    NOT = 10
+    EQ = 11             # r[a] = r[b] == r[c], and so on in COMPARE_OPS order
+    NE = 12
+    LT = 13
+    LE = 14
+    GT = 15
+    GE = 16
+    JUMP = 17           # goto c
+    JUMP_IF_FALSE = 18  # if not r[a]: goto c
+    JUMP_IF_TRUE = 19
+    JUMP_UNLESS_EQ = 20 # if not r[a] == r[b]: goto c, and so on in COMPARE_OPS order
+    JUMP_UNLESS_NE = 21
+    JUMP_UNLESS_LT = 22
+    JUMP_UNLESS_LE = 23
+    JUMP_UNLESS_GT = 24
+    JUMP_UNLESS_GE = 25
+    MAKE_FUNCTION = 26  # r[a] = function from the code in r[b]
+    CALL = 27           # r[a] = r[b](r[b + 1], ..., r[b + c])
+    RETURN = 28         # return r[a]
+    CHECK_BOUND = 29    # if r[a] is unbound: raise UnboundLocalError for names[b]
+
+BINARY_OPS = {
+    "+": RegisterOp.ADD,
+    "-": RegisterOp.SUBTRACT,
+    "*": RegisterOp.MULTIPLY,
+    "/": RegisterOp.DIVIDE,
+    "۩": RegisterOp.CONCAT,
+}
+
+UNARY_OPS = {
+    "-": RegisterOp.NEGATIVE,
+    "!": RegisterOp.NOT,
+}
+
+COMPARE_FUNCTIONS = (operator.eq, operator.ne, operator.lt, operator.le, operator.gt, operator.ge)
+
+RegisterInstruction = Tuple[int, int, int, int]
+
+class RegisterCode:
+    """A compiled function for the register VM.
+
+    Registers hold the parameters and locals, then temporaries, then the
+    constants; initial is the register file a new frame starts from, with
+    the named registers unbound.
+    """
+    __slots__ = ("name", "instructions", "initial", "names", "params")
+
+    def __init__(self, name: str, instructions: Sequence[RegisterInstruction], initial: List[Any],
+                 names: List[str], params: Tuple[str, ...] = ()):
+        self.name = name
+        self.instructions = tuple(instructions)
+        self.initial = initial
+        self.names = names
+        self.params = params
+
+    def __len__(self) -> int:
+        return len(self.instructions)
+
+    def __repr__(self) -> str:
+        return f"<register code {self.name}>"
+
+class RegisterCompiler:
+    """Lowers an AST to RegisterCode.
+
+    Parameters and assigned names get fixed registers, so reading them costs
+    nothing where they are surely bound; elsewhere a function checks the
+    register first, and module code reads the name from the globals.
+    Expressions are evaluated into stack-allocated temporaries, or straight
+    into the register they are assigned to. Module-level names are also
+    written through to the globals, where functions look them up.
+    """
+    def __init__(self, name: str = "<module>", params: Tuple[str, ...] = (), module: bool = True):
+        self.name = name
+        self.params = params
+        self.module = module
+        self.instructions: List[List[Any]] = []
+        self.constants: List[Any] = []
+        self.constant_index: Dict[Tuple[type, Any], int] = {}
+        self.names: List[str] = []
+        self.name_index: Dict[str, int] = {}
+        self.locals: Dict[str, int] = {param: index for index, param in enumerate(params)}
+        # Names bound on every path to the code being compiled
+        self.bound: Set[str] = set(params)
+        self.temps = self.registers = len(self.locals)
+
+    def emit(self, opcode: RegisterOp, a: int = 0, b: int = 0, c: Any = 0) -> List[Any]:
+        """Append an instruction and return it, so jumps can be patched"""
+        instruction = [opcode, a, b, c]
+        self.instructions.append(instruction)
+        return instruction
+
+    def label(self) -> int:
+        return len(self.instructions)
+
+    def constant(self, value: Any) -> int:
+        """Register operand for a constant, resolved by to_code()"""
+        key = (type(value), value)
+        if key not in self.constant_index:
+            self.constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return -1 - self.constant_index[key]
+
+    def name_operand(self, name: str) -> int:
+        if name not in self.name_index:
+            self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return self.name_index[name]
+
+    def temp(self) -> int:
+        register = self.temps
+        self.temps += 1
+        self.registers = max(self.registers, self.temps)
+        return register
+
+    def declare(self, nodes: Sequence[AstNode]) -> None:
+        """Give every name assigned in this scope a register"""
+        pending = list(nodes)
+        while pending:
+            node = pending.pop()
+            if node.type in ("Assignment", "FunctionDef"):
+                self.locals.setdefault(node.value, len(self.locals))
+            if node.type != "FunctionDef":
+                pending.extend(node.children)
+        self.temps = self.registers = len(self.locals)
+
+    def to_code(self) -> RegisterCode:
+        """Place the constants after the other registers and freeze the instructions"""
+        base = self.registers
+        instructions = [tuple(base - 1 - operand if operand < 0 else operand for operand in instruction)
+                        for instruction in self.instructions]
+        named = len(self.locals)
+        initial = [UNBOUND] * named + [None] * (base - named) + self.constants
+        return RegisterCode(self.name, instructions, initial, self.names, self.params)
+
+    def compile_module(self, node: AstNode) -> RegisterCode:
+        self.declare([node])
+        self.statement(node)
+        return self.to_code()
+
+    def compile_function(self, body: Sequence[AstNode]) -> RegisterCode:
+        self.declare(body)
+        self.result(body)
+        return self.to_code()
+
+    def statement(self, node: AstNode) -> None:
+        if node.type in EXPRESSIONS:
+            self.expression(node)
+        else:
+            method = getattr(self, f'statement_{node.type.lower()}', None)
+            if method is None:
+                raise_syntax_error(f"Cannot compile node type: {node.type}")
+            method(node)
+        # Temporaries never outlive a statement
+        self.temps = len(self.locals)
+
+    def body(self, nodes: Sequence[AstNode]) -> None:
+        for node in nodes:
+            self.statement(node)
+
+    def result(self, nodes: Sequence[AstNode]) -> None:
+        """Run a function's statements, returning the value of the last one run
+        as the interpreters do: an expression or assignment gives its value, an
+        If its branch's, anything else None"""
+        self.body(nodes[:-1])
+        last = nodes[-1] if nodes else None
+        if last is not None and last.type == "Block":
+            self.result(last.children)
+            return
+        if last is not None and last.type == "If":
+            skip_then = self.condition(last.children[0])
+            before = self.bound
+            self.bound = set(before)
+            self.result(last.children[1:2])
+            skip_then[3] = self.label()
+            self.bound = set(before)
+            self.result(last.children[2:])
+            return
+        if last is not None and last.type in EXPRESSIONS:
+            register = self.expression(last)
+        elif last is not None and last.type == "Assignment":
+            self.statement(last)
+            register = self.locals[last.value]
+        else:
+            if last is not None:
+                self.statement(last)
+            register = self.constant(None)
+        self.emit(RegisterOp.RETURN, register)
+        self.temps = len(self.locals)
+
+    def statement_program(self, node: AstNode) -> None:
+        self.body(node.children)
+
+    def statement_entrypoint(self, node: AstNode) -> None:
+        self.body(node.children)
+
+    def statement_block(self, node: AstNode) -> None:
+        self.body(node.children)
+
+    def statement_functiondef(self, node: AstNode) -> None:
+        code = RegisterCompiler(node.value, tuple(node.params), module=False).compile_function(node.children)
+        register = self.locals[node.value]
+        self.emit(RegisterOp.MAKE_FUNCTION, register, self.constant(code))
+        self.store(node.value, register)
+        self.bound.add(node.value)
+
+    def statement_assignment(self, node: AstNode) -> None:
+        register = self.locals[node.value]
+        self.expression(node.children[0], register)
+        self.store(node.value, register)
+        self.bound.add(node.value)
+
+    def store(self, name: str, register: int) -> None:
+        if self.module:
+            self.emit(RegisterOp.STORE_NAME, register, self.name_operand(name))
+
+    def statement_if(self, node: AstNode) -> None:
+        skip_then = self.condition(node.children[0])
+        before = self.bound
+        self.bound = set(before)
+        self.statement(node.children[1])
+        bound_then, self.bound = self.bound, set(before)
+        if len(node.children) > 2:
+            skip_else = self.emit(RegisterOp.JUMP)
+            skip_then[3] = self.label()
+            self.statement(node.children[2])
+            skip_else[3] = self.label()
+        else:
+            skip_then[3] = self.label()
+        self.bound &= bound_then
+
+    def statement_while(self, node: AstNode) -> None:
+        loop = self.label()
+        exit_loop = self.condition(node.children[0])
+        # The body may not run at all
+        before = self.bound
+        self.bound = set(before)
+        self.body(node.children[1:])
+        self.bound = before
+        self.emit(RegisterOp.JUMP, c=loop)
+        exit_loop[3] = self.label()
+
+    def statement_return(self, node: AstNode) -> None:
+        register = self.expression(node.children[0]) if node.children else self.constant(None)
+        self.emit(RegisterOp.RETURN, register)
+
+    def condition(self, node: AstNode) -> List[Any]:
+        """Emit a jump taken when node is false, for the caller to patch"""
+        if node.type == "BinaryOp" and node.value in COMPARE_OPS:
+            left, right = self.operands(node)
+            return self.emit(RegisterOp.JUMP_UNLESS_EQ + COMPARE_OPS.index(node.value), left, right)
+        return self.emit(RegisterOp.JUMP_IF_FALSE, self.expression(node))
+
+    def expression(self, node: AstNode, target: Optional[int] = None) -> int:
+        """Evaluate node and return the register holding its value, target if given"""
+        method = getattr(self, f'expression_{node.type.lower()}', None)
+        if method is None:
+            raise_syntax_error(f"Cannot compile node type: {node.type}")
+        return method(node, target)
+
+    def move(self, register: int, target: Optional[int]) -> int:
+        if target is None or target == register:
+            return register
+        self.emit(RegisterOp.MOVE, target, register)
+        return target
+
+    def operands(self, node: AstNode) -> Tuple[int, int]:
+        """Evaluate both operands; their temporaries are free again afterwards"""
+        mark = self.temps
+        left = self.expression(node.children[0])
+        right = self.expression(node.children[1])
+        self.temps = mark
+        return left, right
+
+    def expression_number(self, node: AstNode, target: Optional[int]) -> int:
+        return self.move(self.constant(float(node.value)), target)
+
+    def expression_string(self, node: AstNode, target: Optional[int]) -> int:
+        return self.move(self.constant(str(node.value)), target)
+
+    def expression_identifier(self, node: AstNode, target: Optional[int]) -> int:
+        if node.value in self.locals:
+            local = self.locals[node.value]
+            if node.value in self.bound:
+                return self.move(local, target)
+            if not self.module:
+                self.emit(RegisterOp.CHECK_BOUND, local, self.name_operand(node.value))
+                return self.move(local, target)
+        register = self.temp() if target is None else target
+        self.emit(RegisterOp.LOAD_NAME, register, self.name_operand(node.value))
+        return register
+
+    def expression_functioncall(self, node: AstNode, target: Optional[int]) -> int:
+        # The function and its arguments go in consecutive temporaries
+        base = self.temp()
+        for _ in node.children:
+            self.temp()
+        self.expression_identifier(node, base)
+        for index, arg in enumerate(node.children, 1):
+            self.expression(arg, base + index)
+        self.temps = base
+        register = self.temp() if target is None else target
+        self.emit(RegisterOp.CALL, register, base, len(node.children))
+        return register
+
+    def expression_unaryop(self, node: AstNode, target: Optional[int]) -> int:
+        if node.value not in UNARY_OPS:
+            raise_syntax_error(f"Unknown operator: {node.value}")
+        mark = self.temps
+        operand = self.expression(node.children[0])
+        self.temps = mark
+        register = self.temp() if target is None else target
+        self.emit(UNARY_OPS[node.value], register, operand)
+        return register
+
+    def expression_binaryop(self, node: AstNode, target: Optional[int]) -> int:
+        if node.value in ("&&", "||"):
+            # The right operand may read target, so build the result elsewhere
+            register = self.temp()
+            self.expression(node.children[0], register)
+            opcode = RegisterOp.JUMP_IF_FALSE if node.value == "&&" else RegisterOp.JUMP_IF_TRUE
+            jump = self.emit(opcode, register)
+            self.expression(node.children[1], register)
+            jump[3] = self.label()
+            return self.move(register, target)
+
+        if node.value in COMPARE_OPS:
+            opcode = RegisterOp.EQ + COMPARE_OPS.index(node.value)
+        elif node.value in BINARY_OPS:
+            opcode = BINARY_OPS[node.value]
+        else:
+            raise_syntax_error(f"Unknown operator: {node.value}")
+        left, right = self.operands(node)
+        register = self.temp() if target is None else target
+        self.emit(opcode, register, left, right)
+        return register
+
+def compile_registers(source: str) -> RegisterCode:
+    """Compile source code for the register VM"""
+    from .lexer import tokenize
+    from .parser import parse
+
+    return RegisterCompiler().compile_module(parse(tokenize(source)))
+
+class RegisterFunction:
+    """A function created by MAKE_FUNCTION"""
+    __slots__ = ("code", "globals")
+
+    def __init__(self, code: RegisterCode, globals_: Dict[str, Any]):
+        self.code = code
+        self.globals = globals_
+
+    def __repr__(self) -> str:
+        return f"<function {self.code.name}>"
+
+class RegisterVirtualMachine:
+    """Executes RegisterCode; each frame owns a preallocated register file"""
+    def __init__(self):
+        self.globals: Dict[str, Any] = {}
+        self._run = self._make_dispatch()
+
+    def execute(self, code: RegisterCode) -> Any:
+        return self._run(code, list(code.initial), self.globals)
+
+    def call(self, function: RegisterFunction, args: List[Any]) -> Any:
+        code = function.code
+        params = code.params
+        if len(args) != len(params):
+            raise TypeError(f"{code.name}() takes {len(params)} arguments but {len(args)} were given")
+        registers = list(code.initial)
+        registers[:len(args)] = args
+        return self._run(code, registers, function.globals)
+
+    def _make_dispatch(self) -> Callable[[RegisterCode, List[Any], Dict[str, Any]], Any]:
+        """Build the dispatch loop and its opcode handler table.
+
+        As in VirtualMachine, handlers are closures over cells holding the
+        running frame's state. Each takes the next instruction's index and
+        the three operands, and returns the index to continue at.
+        """
+        builtins = BUILTIN_FUNCTIONS
+        call = self.call
+        # The running frame, swapped by run_frame
+        regs: List[Any] = []
+        names: List[str] = []
+        globals_: Dict[str, Any] = {}
+        result: Any = None
+
+        def move(pc: int, a: int, b: int, c: int) -> int:
+            regs[a] = regs[b]
+            return pc
+
+        def load_name(pc: int, a: int, b: int, c: int) -> int:
+            name = names[b]
+            if name in globals_:
+                regs[a] = globals_[name]
+            elif name in builtins:
+                regs[a] = builtins[name]
+            else:
+                raise NameError(f"name '{name}' is not defined")
+            return pc
+
+        def store_name(pc: int, a: int, b: int, c: int) -> int:
+            globals_[names[b]] = regs[a]
+            return pc
+
+        def add(pc: int, a: int, b: int, c: int) -> int:
+            regs[a] = regs[b] + regs[c]
+            return pc
+
+        def subtract(pc: int, a: int, b: int, c: int) -> int:
+            regs[a] = regs[b] - regs[c]
+            return pc
+
+        def multiply(pc: int, a: int, b: int, c: int) -> int:
+            regs[a] = regs[b] * regs[c]
+            return pc
+
+        def divide(pc: int, a: int, b: int, c: int) -> int:
+            regs[a] = regs[b] / regs[c]
+            return pc
+
+        def concat(pc: int, a: int, b: int, c: int) -> int:
+            regs[a] = str(regs[b]) + str(regs[c])
+            return pc
+
+        def negative(pc: int, a: int, b: int, c: int) -> int:
+            regs[a] = -regs[b]
+            return pc
+
+        def not_(pc: int, a: int, b: int, c: int) -> int:
+            regs[a] = not regs[b]
+            return pc
+
+        def compare(function: Callable[[Any, Any], Any]) -> Callable[[int, int, int, int], int]:
+            def handler(pc: int, a: int, b: int, c: int) -> int:
+                regs[a] = function(regs[b], regs[c])
+                return pc
+            return handler
+
+        def jump_unless(function: Callable[[Any, Any], Any]) -> Callable[[int, int, int, int], int]:
+            def handler(pc: int, a: int, b: int, c: int) -> int:
+                return pc if function(regs[a], regs[b]) else c
+            return handler
+
+        def jump(pc: int, a: int, b: int, c: int) -> int:
+            return c
+
+        def jump_if_false(pc: int, a: int, b: int, c: int) -> int:
+            return pc if regs[a] else c
+
+        def jump_if_true(pc: int, a: int, b: int, c: int) -> int:
+            return c if regs[a] else pc
+
+        def make_function(pc: int, a: int, b: int, c: int) -> int:
+            regs[a] = RegisterFunction(regs[b], globals_)
+            return pc
+
+        def call_function(pc: int, a: int, b: int, c: int) -> int:
+            function = regs[b]
+            args = regs[b + 1:b + 1 + c]
+            if function.__class__ is RegisterFunction:
+                regs[a] = call(function, args)
+            else:
+                regs[a] = function(*args)
+            return pc
+
+        def check_bound(pc: int, a: int, b: int, c: int) -> int:
+            if regs[a] is UNBOUND:
+                raise UnboundLocalError(f"local variable '{names[b]}' referenced before assignment")
+            return pc
+
+        def return_(pc: int, a: int, b: int, c: int) -> int:
+            nonlocal result
+            result = regs[a]
+            return RETURNED
+
+        def unknown(pc: int, a: int, b: int, c: int) -> int:
+            raise RuntimeError(f"Unknown register opcode at {pc - 1}")
+
+        table: Dict[RegisterOp, Callable[[int, int, int, int], int]] = {
+            RegisterOp.MOVE: move,
+            RegisterOp.LOAD_NAME: load_name,
+            RegisterOp.STORE_NAME: store_name,
+            RegisterOp.ADD: add,
+            RegisterOp.SUBTRACT: subtract,
+            RegisterOp.MULTIPLY: multiply,
+            RegisterOp.DIVIDE: divide,
+            RegisterOp.CONCAT: concat,
+            RegisterOp.NEGATIVE: negative,
+            RegisterOp.NOT: not_,
+            RegisterOp.JUMP: jump,
+            RegisterOp.JUMP_IF_FALSE: jump_if_false,
+            RegisterOp.JUMP_IF_TRUE: jump_if_true,
+            RegisterOp.MAKE_FUNCTION: make_function,
+            RegisterOp.CALL: call_function,
+            RegisterOp.RETURN: return_,
+            RegisterOp.CHECK_BOUND: check_bound,
+        }
+        for index, function in enumerate(COMPARE_FUNCTIONS):
+            table[RegisterOp(RegisterOp.EQ + index)] = compare(function)
+            table[RegisterOp(RegisterOp.JUMP_UNLESS_EQ + index)] = jump_unless(function)
+        handlers: Tuple[Callable[[int, int, int, int], int], ...] = tuple(
+            table.get(opcode, unknown) for opcode in range(max(RegisterOp) + 1))
+
+        def run_frame(code: RegisterCode, registers: List[Any], frame_globals: Dict[str, Any]) -> Any:
+            nonlocal regs, names, globals_
+            saved = regs, names, globals_
+            regs = registers
+            names = code.names
+            globals_ = frame_globals
+            try:
+                instructions = code.instructions
+                end = len(instructions)
+                pc = 0
+                while pc < end:
+                    opcode, a, b, c = instructions[pc]
+                    pc = handlers[opcode](pc + 1, a, b, c)
+                return result if pc == RETURNED else None
+            finally:
+                regs, names, globals_ = saved
+
+        return run_frame
+
+def disassemble(code: RegisterCode) -> str:
+    """Human-readable listing of code and the functions nested in it"""
+    lines = [f"Disassembly of {code.name}({', '.join(code.params)}):"]
+    for index, (opcode, a, b, c) in enumerate(code.instructions):
+        lines.append(f"{index:6}  {RegisterOp(opcode).name:<16} {a:5} {b:5} {c:5}")
+    for value in code.initial:
+        if isinstance(value, RegisterCode):
+            lines.append("")
+            lines.append(disassemble(value))
+    return "\n".join(lines)
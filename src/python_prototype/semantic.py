@@ -1,6 +1,7 @@
-from typing import Dict, Set, Optional, List
+import time
+from typing import Dict, Hashable, List, Optional, Set, Tuple
 from dataclasses import dataclass, field
-from .ast import AstNode
+from .ast import AstNode, node_key
 from .error import raise_type_error, raise_name_error
 
 @dataclass
@@ -9,17 +10,19 @@ class Symbol:
     type: str
     is_mutable: bool = True
     is_initialized: bool = False
+    slot: Optional[int] = None  # Local variable slot assigned by the compiler
 
 @dataclass
 class SymbolTable:
     symbols: Dict[str, Symbol] = field(default_factory=dict)
     parent: Optional['SymbolTable'] = None
     
-    def define(self, name: str, type_: str, is_mutable: bool = True) -> None:
+    def define(self, name: str, type_: str, is_mutable: bool = True, slot: Optional[int] = None) -> Symbol:
         """Define a new symbol in the current scope"""
         if name in self.symbols:
             raise_name_error(f"Symbol '{name}' already defined in current scope")
-        self.symbols[name] = Symbol(name, type_, is_mutable)
+        symbol = self.symbols[name] = Symbol(name, type_, is_mutable, slot=slot)
+        return symbol
     
     def lookup(self, name: str) -> Optional[Symbol]:
         """Look up a symbol in this scope or parent scopes"""
@@ -30,69 +33,308 @@ class SymbolTable:
         return None
 
 class SemanticAnalyzer:
-    """Performs semantic analysis on the AST"""
+    """Performs semantic analysis on the AST.
+    
+    The tree is walked once, without recursion. Identifiers, Assignments
+    and FunctionDefs are resolved to their Symbols in resolutions, by
+    node_key, and each function's scope is kept in scopes, its locals
+    numbered with the slots the compiler gives them. A function's locals are
+    its parameters and every name assigned anywhere in its body; other names it
+    reads are globals, which may be assigned after the function, so reads
+    not resolved where they occur wait for the end of their function or of
+    the tree. Calls are resolved at run time and left alone. The seconds
+    each phase took are added up in timings.
+    """
     def __init__(self):
         self.current_scope = SymbolTable()
+        self.globals = self.current_scope
         self.loop_depth = 0
         self.function_depth = 0
+        self.resolutions: Dict[Hashable, Symbol] = {}
+        self.scopes: Dict[Hashable, SymbolTable] = {}
+        self.timings: Dict[str, float] = {"traverse": 0.0, "resolve": 0.0}
+        self.visited = 0
+        # Identifiers not yet resolved, for the globals and each function
+        # being analyzed
+        self.unresolved: List[List[AstNode]] = [[]]
+        # Scopes and loop depths of the code around each function being analyzed
+        self.enclosing: List[Tuple[SymbolTable, int]] = []
+        # Kept so that the AstNode ids keying resolutions and scopes stay theirs
+        self.trees: List[AstNode] = []
+    
+    def symbol(self, node: AstNode) -> Optional[Symbol]:
+        """The Symbol node was resolved to, if any"""
+        return self.resolutions.get(node_key(node))
     
     def analyze(self, node: AstNode) -> None:
-        """Analyze an AST node"""
-        if node.type == "Program":
-            for child in node.children:
-                self.analyze(child)
-                
-        elif node.type == "FunctionDef":
-            self.function_depth += 1
-            # Create new scope for function
-            old_scope = self.current_scope
-            self.current_scope = SymbolTable(parent=old_scope)
-            
-            # Add parameters to function scope
-            for param in node.params:
-                self.current_scope.define(param, "Any")  # Parameters are always mutable
-            
-            # Analyze function body
-            for child in node.children:
-                self.analyze(child)
+        """Analyze an AST, visiting each node exactly once"""
+        clock = time.perf_counter
+        start = clock()
+        self.trees.append(node)
+        resolutions = self.resolutions
+        # A node is pushed again to be left once its children are done
+        stack: List[Tuple[AstNode, bool]] = [(node, False)]
+        while stack:
+            node, leaving = stack.pop()
+            if leaving:
+                if node.type == "While":
+                    self.loop_depth -= 1
+                else:
+                    self.leave_function()
+                continue
             
-            self.current_scope = old_scope
-            self.function_depth -= 1
-            
-        elif node.type == "Assignment":
-            # Check if variable exists and is mutable
-            symbol = self.current_scope.lookup(node.value)
-            if symbol and not symbol.is_mutable:
-                raise_type_error(f"Cannot assign to immutable variable '{node.value}'")
-            
-            # Analyze right-hand side
-            self.analyze(node.children[0])
-            
-            # Define new variable if it doesn't exist
-            if not symbol:
-                self.current_scope.define(node.value, "Any")
+            self.visited += 1
+            kind = node.type
+            if kind == "Identifier":
+                symbol = self.current_scope.symbols.get(node.value)
+                if symbol is None:
+                    self.unresolved[-1].append(node)
+                else:
+                    resolutions[node_key(node)] = symbol
+                    
+            elif kind == "Assignment":
+                self.define(node, "Any")
                 
-        elif node.type == "While":
-            self.loop_depth += 1
-            self.analyze(node.children[0])  # Condition
-            for child in node.children[1:]:  # Body
-                self.analyze(child)
-            self.loop_depth -= 1
-            
-        elif node.type == "Break" or node.type == "Continue":
-            if self.loop_depth == 0:
-                raise_type_error(f"'{node.type.lower()}' outside loop")
+            elif kind == "FunctionDef":
+                self.define(node, "Function")
+                self.enter_function(node)
+                stack.append((node, True))
                 
-        elif node.type == "Return":
-            if self.function_depth == 0:
-                raise_type_error("'return' outside function")
-            if node.children:
-                self.analyze(node.children[0])
+            elif kind == "While":
+                self.loop_depth += 1
+                stack.append((node, True))
                 
-        elif node.type == "Identifier":
-            if not self.current_scope.lookup(node.value):
+            elif kind == "Break" or kind == "Continue":
+                if self.loop_depth == 0:
+                    raise_type_error(f"'{kind.lower()}' outside loop")
+                    
+            elif kind == "Return":
+                if self.function_depth == 0:
+                    raise_type_error("'return' outside function")
+                    
+            children = node.children
+            for index in range(len(children) - 1, -1, -1):
+                stack.append((children[index], False))
+        
+        resolve = clock()
+        # Whatever is still unresolved must be a global assigned somewhere
+        globals_ = self.globals.symbols
+        for node in self.unresolved[0]:
+            symbol = globals_.get(node.value)
+            if symbol is None:
                 raise_name_error(f"Undefined variable '{node.value}'")
-                
-        # Recursively analyze child nodes
-        for child in node.children:
-            self.analyze(child) 
\ No newline at end of file
+            resolutions[node_key(node)] = symbol
+        self.unresolved[0] = []
+        end = clock()
+        self.timings["traverse"] += resolve - start
+        self.timings["resolve"] += end - resolve
+    
+    def define(self, node: AstNode, type_: str) -> None:
+        """Resolve an Assignment or FunctionDef, defining its name in the current scope if new"""
+        scope = self.current_scope
+        symbol = scope.symbols.get(node.value)
+        if symbol is None:
+            # Only function locals have slots; globals are found by name
+            slot = len(scope.symbols) if self.function_depth else None
+            symbol = scope.define(node.value, type_, slot=slot)
+        elif not symbol.is_mutable:
+            raise_type_error(f"Cannot assign to immutable variable '{node.value}'")
+        symbol.is_initialized = True
+        self.resolutions[node_key(node)] = symbol
+    
+    def enter_function(self, node: AstNode) -> None:
+        """Open a scope for a function, holding its parameters"""
+        self.enclosing.append((self.current_scope, self.loop_depth))
+        # Functions see only their own locals and the globals, even when nested
+        scope = self.current_scope = self.scopes[node_key(node)] = SymbolTable(parent=self.globals)
+        for param in node.params:
+            scope.define(param, "Any", slot=len(scope.symbols)).is_initialized = True
+        self.function_depth += 1
+        self.loop_depth = 0
+        self.unresolved.append([])
+    
+    def leave_function(self) -> None:
+        """Resolve the reads of the function's locals, leaving globals for later"""
+        locals_ = self.current_scope.symbols
+        for node in self.unresolved.pop():
+            symbol = locals_.get(node.value)
+            if symbol is None:
+                self.unresolved[0].append(node)
+            else:
+                self.resolutions[node_key(node)] = symbol
+        self.current_scope, self.loop_depth = self.enclosing.pop()
+        self.function_depth -= 1
+
+# Value types told apart by TypeInference; ANY stands for values of any or
+# of several types. Numbers are floats: len and int give ints, which are ANY
+NUMBER = "Number"
+STRING = "String"
+BOOLEAN = "Boolean"
+LIST = "List"
+ANY = "Any"
+
+LITERAL_TYPES = {"Number": NUMBER, "String": STRING}
+
+# What builtins called by their own names return
+BUILTIN_TYPES = {"float": NUMBER, "str": STRING, "bool": BOOLEAN, "list": LIST}
+
+COMPARISONS = frozenset(("==", "!=", "<", "<=", ">", ">="))
+
+def join(first: Optional[str], second: Optional[str]) -> Optional[str]:
+    """The type of values of either type; None is the type of no values yet"""
+    if first is None:
+        return second
+    if second is None or first == second:
+        return first
+    return ANY
+
+class TypeInference:
+    """Infers the types of the variables and expressions of an analyzed tree.
+    
+    Types flow from literals, operators and builtin calls through
+    assignments into variables, and from the arguments of calls into the
+    parameters of the functions called, for as long as any type changes.
+    A variable's type is what all the values assigned to it have in common,
+    so it holds once the variable is assigned. Types are only as good as
+    the program is closed: values from the host, or from calls to a
+    function used as a value, are not seen, so code relying on a type must
+    check it. Variable types are set on the Symbols, and expression types
+    are kept in types by node_key.
+    """
+    def __init__(self, analyzer: SemanticAnalyzer):
+        self.analyzer = analyzer
+        self.types: Dict[Hashable, Optional[str]] = {}
+        # Inferred variable types by Symbol id; None until a value flows in
+        self.variables: Dict[int, Optional[str]] = {}
+        # The types of what FunctionCalls return, by node_key
+        self.calls: Dict[Hashable, str] = {}
+        self.rounds = 0
+    
+    def infer(self, tree: AstNode) -> None:
+        """Infer types for a tree the analyzer has analyzed"""
+        resolutions = self.analyzer.resolutions
+        scopes = self.analyzer.scopes
+        globals_ = self.analyzer.globals.symbols
+        variables = self.variables
+        # Values flowing into each variable, as (Symbol, expression)
+        flows: List[Tuple[Symbol, AstNode]] = []
+        # Functions defined at the top level, and calls to them
+        functions: Dict[str, List[AstNode]] = {}
+        calls: List[AstNode] = []
+        read: Set[int] = set()
+        # Nodes with the locals of the function they are in, if any
+        pending: List[Tuple[AstNode, Optional[SymbolTable]]] = [(tree, None)]
+        while pending:
+            node, scope = pending.pop()
+            kind = node.type
+            if kind == "Assignment":
+                symbol = resolutions.get(node_key(node))
+                if symbol is not None:
+                    flows.append((symbol, node.children[0]))
+            elif kind == "FunctionDef":
+                # The name holds a function, whatever else is assigned to it
+                symbol = resolutions.get(node_key(node))
+                if symbol is not None:
+                    variables[id(symbol)] = ANY
+                if scope is None:
+                    functions.setdefault(node.value, []).append(node)
+                scope = scopes.get(node_key(node))
+            elif kind == "Identifier":
+                symbol = resolutions.get(node_key(node))
+                if symbol is not None:
+                    read.add(id(symbol))
+            elif kind == "FunctionCall":
+                # Calls look up their callee among the locals, the globals, then the builtins
+                if scope is not None and node.value in scope.symbols:
+                    self.calls[node_key(node)] = ANY
+                elif node.value in globals_:
+                    self.calls[node_key(node)] = ANY
+                    calls.append(node)
+                else:
+                    self.calls[node_key(node)] = BUILTIN_TYPES.get(node.value, ANY)
+            for child in node.children:
+                pending.append((child, scope))
+        
+        # Parameters of functions without a scope are never typed, so are ANY
+        for call in calls:
+            for function in functions.get(call.value, ()):
+                scope = scopes.get(node_key(function))
+                if scope is not None and len(function.params) == len(call.children):
+                    flows.extend(zip((scope.symbols[param] for param in function.params), call.children))
+        for symbol, _ in flows:
+            variables.setdefault(id(symbol), None)
+        for definitions in functions.values():
+            for function in definitions:
+                # Used as a value, a function may be called from anywhere
+                symbol = resolutions.get(node_key(function))
+                scope = scopes.get(node_key(function))
+                if scope is not None and (symbol is None or id(symbol) in read):
+                    for param in function.params:
+                        variables[id(scope.symbols[param])] = ANY
+        
+        changed = True
+        while changed:
+            changed = False
+            self.rounds += 1
+            types: Dict[Hashable, Optional[str]] = {}
+            for symbol, value in flows:
+                key = id(symbol)
+                type_ = join(variables[key], self.evaluate(value, types))
+                if type_ != variables[key]:
+                    variables[key] = type_
+                    changed = True
+        
+        for symbol, _ in flows:
+            symbol.type = variables[id(symbol)] or ANY
+    
+    def type_of(self, node: AstNode) -> str:
+        """The inferred type of an expression"""
+        return self.evaluate(node, self.types) or ANY
+    
+    def evaluate(self, root: AstNode, types: Dict[Hashable, Optional[str]]) -> Optional[str]:
+        """The type of an expression given the variable types so far, also
+        recording its subexpressions' types in types"""
+        if node_key(root) in types:
+            return types[node_key(root)]
+        stack = [(root, False)]
+        while stack:
+            node, ready = stack.pop()
+            key = node_key(node)
+            if key in types:
+                continue
+            kind = node.type
+            if kind in LITERAL_TYPES:
+                types[key] = LITERAL_TYPES[kind]
+                continue
+            if kind == "Identifier":
+                symbol = self.analyzer.resolutions.get(key)
+                types[key] = self.variables.get(id(symbol), ANY) if symbol is not None else ANY
+                continue
+            if kind not in ("BinaryOp", "UnaryOp"):
+                types[key] = self.calls.get(key, ANY)
+                # Arguments are typed as expressions of their own
+                stack.extend((child, False) for child in node.children)
+                continue
+            if not ready:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
+                continue
+            
+            operands = [types[node_key(child)] for child in node.children]
+            op = node.value
+            if kind == "UnaryOp":
+                type_ = BOOLEAN if op == "!" else operands[0] if operands[0] in (None, NUMBER) else ANY
+            elif op in COMPARISONS:
+                type_ = BOOLEAN
+            elif op == "۩":
+                type_ = STRING
+            elif op in ("&&", "||"):
+                type_ = join(operands[0], operands[1])
+            elif None in operands:
+                type_ = None
+            elif operands[0] == operands[1] == NUMBER or op == "+" and operands[0] == operands[1] == STRING:
+                type_ = operands[0]
+            else:
+                type_ = ANY
+            types[key] = type_
+        return types[node_key(root)]
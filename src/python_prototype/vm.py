@@ -1,45 +1,109 @@
 # vm.py
 
-from enum import Enum, auto
-from typing import List, Any, Dict, Optional
-
-class OpCode(Enum):
-    LOAD_CONST = auto()
-    ADD = auto()
-    RETURN_VALUE = auto()
-    ROT_THREE = auto()
-    MAKE_FUNCTION = auto()
-    GET_ITER = auto()
-    POP_JUMP_IF_FALSE = auto()
-    STORE_NAME = auto()
-    LOAD_NAME = auto()
-    CALL_FUNCTION = auto()
-    BINARY_ADD = auto()
-    BINARY_SUBTRACT = auto()
-    BINARY_MULTIPLY = auto()
-    BINARY_DIVIDE = auto()
-    COMPARE_OP = auto()
-    # Add other opcodes as needed
+import itertools
+import operator
+from typing import Callable, List, Any, Dict, NoReturn, Optional, Sequence, Tuple, Union
+from .bytecode import (ARG_BITS, COMPARE_BITS, COMPARE_OPS, PACK_BITS, PACK_MASK, CodeObject, Instruction,
+                       OpCode, from_instructions)
+from .builtins import BUILTIN_FUNCTIONS, BuiltinFunction
 
-class Frame:
-    def __init__(self, code: List['Instruction'], globals_: Dict[str, Any]):
+COMPARE_FUNCTIONS = tuple({
+    "==": operator.eq, "!=": operator.ne, "<": operator.lt,
+    "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+}[op] for op in COMPARE_OPS)
+
+COMPARE_MASK = (1 << COMPARE_BITS) - 1
+
+# Handlers return the next instruction's word index; RETURN_VALUE returns this
+# to leave the dispatch loop
+RETURNED = 1 << 62
+
+# Value of a local slot that has not been assigned yet
+UNBOUND = object()
+
+# How a CALL_FUNCTION site calls the callee it has cached
+PYTHON_CALL = 0
+BUILTIN_CALL = 1
+OTHER_CALL = 2
+
+# Shared by all Globals, so a version identifies one state of one namespace
+_versions = itertools.count(1)
+
+class Globals(dict):
+    """A dict of global variables whose version changes on every rebinding.
+
+    LOAD_GLOBAL caches a name's value along with the version it was read at,
+    and trusts the cache for as long as the version is unchanged.
+    """
+    __slots__ = ("version",)
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.version = next(_versions)
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        dict.__setitem__(self, name, value)
+        self.version = next(_versions)
+
+    def __delitem__(self, name: str) -> None:
+        dict.__delitem__(self, name)
+        self.version = next(_versions)
+
+    def clear(self) -> None:
+        dict.clear(self)
+        self.version = next(_versions)
+
+    def pop(self, *args: Any) -> Any:
+        value = dict.pop(self, *args)
+        self.version = next(_versions)
+        return value
+
+    def popitem(self) -> Tuple[str, Any]:
+        item = dict.popitem(self)
+        self.version = next(_versions)
+        return item
+
+    def setdefault(self, name: str, default: Any = None) -> Any:
+        value = dict.setdefault(self, name, default)
+        self.version = next(_versions)
+        return value
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        dict.update(self, *args, **kwargs)
+        self.version = next(_versions)
+
+class Function:
+    """A function created by MAKE_FUNCTION"""
+    __slots__ = ("code", "globals")
+
+    def __init__(self, code: CodeObject, globals_: Globals):
         self.code = code
         self.globals = globals_
-        self.locals: Dict[str, Any] = {}
-        self.stack: List[Any] = []
-        self.ip = 0  # Instruction pointer
 
-class Instruction:
-    def __init__(self, opcode: OpCode, arg: Any = None):
-        self.opcode = opcode
-        self.arg = arg
+    def __repr__(self) -> str:
+        return f"<function {self.code.name}>"
+
+class Frame:
+    """An activation record. Frames share the VM's value stack from base up.
+
+    fast holds the local variable slots numbered by code.varnames; module-level
+    code has none and keeps its variables in the globals.
+    """
+    __slots__ = ("code", "globals", "fast", "base")
+
+    def __init__(self, code: CodeObject, globals_: Globals, fast: Optional[List[Any]] = None, base: int = 0):
+        self.code = code
+        self.globals = globals_
+        self.fast: List[Any] = [UNBOUND] * len(code.varnames) if fast is None else fast
+        self.base = base
 
 class VirtualMachine:
     def __init__(self):
         self.frames: List[Frame] = []
         self.current_frame: Optional[Frame] = None
-        self.globals: Dict[str, Any] = {}
+        self.globals = Globals()
         self.stack: List[Any] = []
+        self._run = self._make_dispatch()
 
     def push_frame(self, frame: Frame) -> None:
         self.frames.append(frame)
@@ -52,40 +116,345 @@ class VirtualMachine:
             return old_frame
         return None
 
-    def execute(self, instructions: List[Instruction]) -> Any:
-        frame = Frame(instructions, self.globals)
+    def execute(self, code: Union[CodeObject, Sequence[Instruction]]) -> Any:
+        """Run module-level code, given as a CodeObject or a list of Instructions.
+
+        Values the code leaves behind stay on vm.stack.
+        """
+        if not isinstance(code, CodeObject):
+            code = from_instructions(code)
+        return self.run(Frame(code, self.globals, base=len(self.stack)))
+
+    def call(self, function: Function, args: List[Any]) -> Any:
+        params = function.code.params
+        if len(args) != len(params):
+            raise TypeError(f"{function.code.name}() takes {len(params)} arguments but {len(args)} were given")
+        fast = [UNBOUND] * len(function.code.varnames)
+        fast[:len(args)] = args
+        return self.enter(function, fast)
+
+    def enter(self, function: Function, fast: List[Any]) -> Any:
+        """Run function in a new frame whose local slots are already filled in"""
+        base = len(self.stack)
+        try:
+            return self.run(Frame(function.code, function.globals, fast, base))
+        finally:
+            del self.stack[base:]
+
+    def run(self, frame: Frame) -> Any:
         self.push_frame(frame)
+        try:
+            return self._run(frame)
+        finally:
+            self.pop_frame()
 
-        while frame.ip < len(frame.code):
-            instruction = frame.code[frame.ip]
-            frame.ip += 1
-
-            if instruction.opcode == OpCode.LOAD_CONST:
-                frame.stack.append(instruction.arg)
-            elif instruction.opcode == OpCode.STORE_NAME:
-                frame.locals[instruction.arg] = frame.stack.pop()
-            elif instruction.opcode == OpCode.LOAD_NAME:
-                name = instruction.arg
-                if name in frame.locals:
-                    frame.stack.append(frame.locals[name])
-                elif name in frame.globals:
-                    frame.stack.append(frame.globals[name])
-                else:
-                    raise NameError(f"name '{name}' is not defined")
-            elif instruction.opcode == OpCode.BINARY_ADD:
-                right = frame.stack.pop()
-                left = frame.stack.pop()
-                frame.stack.append(left + right)
-            elif instruction.opcode == OpCode.MAKE_FUNCTION:
-                code = frame.stack.pop()
-                frame.stack.append(lambda: self.execute(code))
-            elif instruction.opcode == OpCode.GET_ITER:
-                frame.stack.append(iter(frame.stack.pop()))
-            elif instruction.opcode == OpCode.POP_JUMP_IF_FALSE:
-                if not frame.stack.pop():
-                    frame.ip = instruction.arg
-            elif instruction.opcode == OpCode.RETURN_VALUE:
-                return frame.stack.pop() if frame.stack else None
-
-        self.pop_frame()
-        return None
+    def _make_dispatch(self) -> Callable[[Frame], Any]:
+        """Build the dispatch loop and its opcode handler table.
+
+        Handlers are closures over the shared stack's bound methods and over
+        cells holding the running frame's code, tables and namespaces, so an
+        instruction costs one table index and one call. Each handler takes the
+        next word index and its oparg, and returns the word index to continue at.
+        """
+        stack = self.stack
+        push = stack.append
+        pop = stack.pop
+        builtins = BUILTIN_FUNCTIONS
+        compares = COMPARE_FUNCTIONS
+        enter = self.enter
+        # The running frame, swapped by run_frame
+        code: Any = None
+        consts: List[Any] = []
+        names: List[str] = []
+        fast: List[Any] = []
+        globals_ = Globals()
+        global_versions: List[int] = []
+        global_values: List[Any] = []
+        call_sites: List[Any] = []
+
+        def extended_arg(ip: int, arg: int) -> int:
+            return handlers[code[ip]](ip + 2, code[ip + 1] | arg << ARG_BITS)
+
+        def load_const(ip: int, arg: int) -> int:
+            push(consts[arg])
+            return ip
+
+        def store_name(ip: int, arg: int) -> int:
+            globals_[names[arg]] = pop()
+            return ip
+
+        def lookup(name: str) -> Any:
+            if name in globals_:
+                return globals_[name]
+            if name in builtins:
+                return builtins[name]
+            raise NameError(f"name '{name}' is not defined")
+
+        def load_name(ip: int, arg: int) -> int:
+            push(lookup(names[arg]))
+            return ip
+
+        def load_global(ip: int, arg: int) -> int:
+            version = globals_.version
+            if global_versions[arg] != version:
+                global_values[arg] = lookup(names[arg])
+                global_versions[arg] = version
+            push(global_values[arg])
+            return ip
+
+        def unbound(slot: int) -> NoReturn:
+            name = self.current_frame.code.varnames[slot]
+            raise UnboundLocalError(f"local variable '{name}' referenced before assignment")
+
+        def load_fast(ip: int, arg: int) -> int:
+            value = fast[arg]
+            if value is UNBOUND:
+                unbound(arg)
+            push(value)
+            return ip
+
+        def store_fast(ip: int, arg: int) -> int:
+            fast[arg] = pop()
+            return ip
+
+        def load_name_load_const_add(ip: int, arg: int) -> int:
+            push(lookup(names[arg >> PACK_BITS]) + consts[arg & PACK_MASK])
+            return ip
+
+        def incr_name(ip: int, arg: int) -> int:
+            name = names[arg >> PACK_BITS]
+            globals_[name] = lookup(name) + consts[arg & PACK_MASK]
+            return ip
+
+        def load_fast_load_const_add(ip: int, arg: int) -> int:
+            value = fast[arg >> PACK_BITS]
+            if value is UNBOUND:
+                unbound(arg >> PACK_BITS)
+            push(value + consts[arg & PACK_MASK])
+            return ip
+
+        def incr_fast(ip: int, arg: int) -> int:
+            slot = arg >> PACK_BITS
+            value = fast[slot]
+            if value is UNBOUND:
+                unbound(slot)
+            fast[slot] = value + consts[arg & PACK_MASK]
+            return ip
+
+        def binary_add(ip: int, arg: int) -> int:
+            right = pop()
+            stack[-1] = stack[-1] + right
+            return ip
+
+        def binary_add_float(ip: int, arg: int) -> int:
+            right = pop()
+            left = stack[-1]
+            if left.__class__ is float and right.__class__ is float:
+                stack[-1] = left + right
+                return ip
+            # Deoptimise: the inferred types were wrong here, so stop checking them
+            code[ip - 2] = OpCode.BINARY_ADD
+            stack[-1] = left + right
+            return ip
+
+        def binary_subtract(ip: int, arg: int) -> int:
+            right = pop()
+            stack[-1] = stack[-1] - right
+            return ip
+
+        def binary_multiply(ip: int, arg: int) -> int:
+            right = pop()
+            stack[-1] = stack[-1] * right
+            return ip
+
+        def binary_divide(ip: int, arg: int) -> int:
+            right = pop()
+            stack[-1] = stack[-1] / right
+            return ip
+
+        def binary_concat(ip: int, arg: int) -> int:
+            right = pop()
+            stack[-1] = str(stack[-1]) + str(right)
+            return ip
+
+        def concat_str(ip: int, arg: int) -> int:
+            right = pop()
+            left = stack[-1]
+            if left.__class__ is str and right.__class__ is str:
+                stack[-1] = left + right
+                return ip
+            code[ip - 2] = OpCode.BINARY_CONCAT
+            stack[-1] = str(left) + str(right)
+            return ip
+
+        def compare_op(ip: int, arg: int) -> int:
+            right = pop()
+            stack[-1] = compares[arg](stack[-1], right)
+            return ip
+
+        def unary_negative(ip: int, arg: int) -> int:
+            stack[-1] = -stack[-1]
+            return ip
+
+        def unary_not(ip: int, arg: int) -> int:
+            stack[-1] = not stack[-1]
+            return ip
+
+        def pop_top(ip: int, arg: int) -> int:
+            pop()
+            return ip
+
+        def rot_three(ip: int, arg: int) -> int:
+            """Move the third item up to the top of the stack"""
+            stack.append(stack.pop(-3))
+            return ip
+
+        def compare_jump_if_false(ip: int, arg: int) -> int:
+            right = pop()
+            if compares[arg & COMPARE_MASK](pop(), right):
+                return ip
+            return arg >> COMPARE_BITS << 1
+
+        def jump_absolute(ip: int, arg: int) -> int:
+            return arg << 1
+
+        def pop_jump_if_false(ip: int, arg: int) -> int:
+            return ip if pop() else arg << 1
+
+        def jump_if_false_or_pop(ip: int, arg: int) -> int:
+            if stack[-1]:
+                pop()
+                return ip
+            return arg << 1
+
+        def jump_if_true_or_pop(ip: int, arg: int) -> int:
+            if stack[-1]:
+                return arg << 1
+            pop()
+            return ip
+
+        def make_function(ip: int, arg: int) -> int:
+            push(Function(pop(), globals_))
+            return ip
+
+        def specialise(function: Any, argc: int) -> Tuple[Any, int, Any]:
+            """Work out how to call function with argc arguments, for a call-site cache"""
+            if function.__class__ is Function:
+                code = function.code
+                if argc != len(code.params):
+                    raise TypeError(f"{code.name}() takes {len(code.params)} arguments but {argc} were given")
+                # The arguments are followed by the remaining, unbound, local slots
+                return function, PYTHON_CALL, [UNBOUND] * (len(code.varnames) - argc)
+            if function.__class__ is BuiltinFunction:
+                return function, BUILTIN_CALL, function.func
+            return function, OTHER_CALL, function
+
+        def call_function(ip: int, arg: int) -> int:
+            start = len(stack) - arg
+            function = stack[start - 1]
+            # Monomorphic cache: valid while the site keeps calling the same object
+            slot = (ip >> 1) - 1
+            site = call_sites[slot]
+            if site is None or site[0] is not function:
+                site = call_sites[slot] = specialise(function, arg)
+            if site[1] == PYTHON_CALL:
+                fast = stack[start:] + site[2]
+                del stack[start - 1:]
+                push(enter(function, fast))
+            else:
+                args = stack[start:]
+                del stack[start - 1:]
+                push(site[2](*args))
+            return ip
+
+        def get_iter(ip: int, arg: int) -> int:
+            push(iter(pop()))
+            return ip
+
+        def return_value(ip: int, arg: int) -> int:
+            return RETURNED
+
+        def unknown(ip: int, arg: int) -> int:
+            raise RuntimeError(f"Unknown opcode {code[ip - 2]}")
+
+        table: Dict[OpCode, Callable[[int, int], int]] = {
+            OpCode.EXTENDED_ARG: extended_arg,
+            OpCode.LOAD_CONST: load_const,
+            OpCode.STORE_NAME: store_name,
+            OpCode.LOAD_NAME: load_name,
+            OpCode.ADD: binary_add,
+            OpCode.BINARY_ADD: binary_add,
+            OpCode.BINARY_SUBTRACT: binary_subtract,
+            OpCode.BINARY_MULTIPLY: binary_multiply,
+            OpCode.BINARY_DIVIDE: binary_divide,
+            OpCode.BINARY_CONCAT: binary_concat,
+            OpCode.COMPARE_OP: compare_op,
+            OpCode.UNARY_NEGATIVE: unary_negative,
+            OpCode.UNARY_NOT: unary_not,
+            OpCode.POP_TOP: pop_top,
+            OpCode.ROT_THREE: rot_three,
+            OpCode.JUMP_ABSOLUTE: jump_absolute,
+            OpCode.POP_JUMP_IF_FALSE: pop_jump_if_false,
+            OpCode.JUMP_IF_FALSE_OR_POP: jump_if_false_or_pop,
+            OpCode.JUMP_IF_TRUE_OR_POP: jump_if_true_or_pop,
+            OpCode.MAKE_FUNCTION: make_function,
+            OpCode.CALL_FUNCTION: call_function,
+            OpCode.GET_ITER: get_iter,
+            OpCode.RETURN_VALUE: return_value,
+            OpCode.LOAD_NAME_LOAD_CONST_ADD: load_name_load_const_add,
+            OpCode.INCR_NAME: incr_name,
+            OpCode.COMPARE_JUMP_IF_FALSE: compare_jump_if_false,
+            OpCode.LOAD_FAST: load_fast,
+            OpCode.STORE_FAST: store_fast,
+            OpCode.LOAD_GLOBAL: load_global,
+            OpCode.LOAD_FAST_LOAD_CONST_ADD: load_fast_load_const_add,
+            OpCode.INCR_FAST: incr_fast,
+            OpCode.BINARY_ADD_FLOAT: binary_add_float,
+            OpCode.CONCAT_STR: concat_str,
+        }
+        handlers: Tuple[Callable[[int, int], int], ...] = tuple(
+            table.get(opcode, unknown) for opcode in range(max(OpCode) + 1))
+
+        def run_frame(frame: Frame) -> Any:
+            nonlocal code, consts, names, fast, globals_, global_versions, global_values, call_sites
+            saved = code, consts, names, fast, globals_, global_versions, global_values, call_sites
+            code_object = frame.code
+            code = code_object.code
+            consts = code_object.consts
+            names = code_object.names
+            fast = frame.fast
+            globals_ = frame.globals
+            global_versions = code_object.global_versions
+            global_values = code_object.global_values
+            call_sites = code_object.call_sites
+            try:
+                words = code
+                end = len(words)
+                ip = 0
+                while ip < end:
+                    ip = handlers[words[ip]](ip + 2, words[ip + 1])
+                if ip == RETURNED and len(stack) > frame.base:
+                    return pop()
+                return None
+            finally:
+                code, consts, names, fast, globals_, global_versions, global_values, call_sites = saved
+
+        return run_frame
+
+# Backends run_source can execute on
+STACK_BACKEND = "stack"
+REGISTER_BACKEND = "register"
+
+def run_source(source: str, backend: str = STACK_BACKEND) -> Dict[str, Any]:
+    """Compile and run a program on the chosen backend, returning its globals"""
+    if backend == STACK_BACKEND:
+        from .compiler import compile_code
+        vm = VirtualMachine()
+        vm.execute(compile_code(source))
+        return vm.globals
+    if backend == REGISTER_BACKEND:
+        from .regvm import RegisterVirtualMachine, compile_registers
+        register_vm = RegisterVirtualMachine()
+        register_vm.execute(compile_registers(source))
+        return register_vm.globals
+    raise ValueError(f"Unknown backend: {backend!r}")
@@ -0,0 +1,69 @@
+import unittest
+from src.python_prototype.bytecode import (CodeObject, Instruction, OpCode, assemble,
+                                           disassemble, from_instructions)
+from src.python_prototype.compiler import compile_code
+from src.python_prototype.vm import VirtualMachine
+
+PROGRAM = """
+def zakat(amount, nisab):
+    if amount < nisab:
+        return 0
+    else:
+        return amount * 0.025
+﷽:
+    total ۝ 0
+    n ۝ 0
+    while n < 4:
+        total ۝ total + zakat(1000 * n, 1500)
+        n ۝ n + 1
+"""
+
+class TestBytecode(unittest.TestCase):
+    def test_code_object_layout(self):
+        code = from_instructions([
+            Instruction(OpCode.LOAD_CONST, "Salam"),
+            Instruction(OpCode.STORE_NAME, "greeting"),
+            Instruction(OpCode.LOAD_NAME, "greeting"),
+            Instruction(OpCode.RETURN_VALUE),
+        ])
+        self.assertEqual((code.code.typecode, code.code.itemsize), ('H', 2))
+        self.assertEqual(list(code.code), [OpCode.LOAD_CONST, 0, OpCode.STORE_NAME, 0,
+                                           OpCode.LOAD_NAME, 0, OpCode.RETURN_VALUE, 0])
+        self.assertEqual((code.consts, code.names), (["Salam"], ["greeting"]))
+
+    def test_extended_arg(self):
+        consts = list(range(70_000))
+        code = assemble([Instruction(OpCode.JUMP_ABSOLUTE, 2),
+                         Instruction(OpCode.LOAD_CONST, 69_999),
+                         Instruction(OpCode.RETURN_VALUE)], consts, [])
+        self.assertEqual(len(code), 4)
+        self.assertEqual(list(code.decode()), [(0, OpCode.JUMP_ABSOLUTE, 3),
+                                               (1, OpCode.LOAD_CONST, 69_999),
+                                               (3, OpCode.RETURN_VALUE, 0)])
+        self.assertEqual(VirtualMachine().execute(code), None)
+        code = assemble([Instruction(OpCode.LOAD_CONST, 69_999), Instruction(OpCode.RETURN_VALUE)], consts, [])
+        self.assertEqual(VirtualMachine().execute(code), 69_999)
+
+    def test_compiled_control_flow_and_functions(self):
+        code = compile_code(PROGRAM)
+        vm = VirtualMachine()
+        vm.execute(code)
+        self.assertEqual(vm.globals["total"], 125.0)
+        function = next(const for const in code.consts if isinstance(const, CodeObject))
+        self.assertEqual((function.name, function.params), ("zakat", ("amount", "nisab")))
+
+    def test_serialise_and_disassemble(self):
+        code = compile_code(PROGRAM)
+        loaded = CodeObject.loads(code.dumps())
+        self.assertEqual(disassemble(loaded), disassemble(code))
+        vm = VirtualMachine()
+        vm.execute(loaded)
+        self.assertEqual(vm.globals["total"], 125.0)
+        listing = disassemble(code)
+        self.assertIn("Disassembly of zakat(amount, nisab):", listing)
+        self.assertIn("COMPARE_OP", listing)
+        self.assertIn("(<)", listing)
+        self.assertIn("(<code zakat>)", listing)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+from src.python_prototype import cache
+from src.python_prototype.cache import BytecodeCache, compile_file
+from src.python_prototype.compiler import compile_code
+
+SOURCE = '1 + 2 * 3\n"Salam" ۩ "Alaikum"\n'
+
+def listing(code):
+    return code.code.tobytes(), code.consts, code.names
+
+class TestBytecodeCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache = BytecodeCache(self.directory.name)
+
+    def test_warm_load_matches_compilation(self):
+        cold = self.cache.compile(SOURCE)
+        warm = self.cache.compile(SOURCE)
+        self.assertEqual((self.cache.misses, self.cache.hits), (1, 1))
+        expected = compile_code(SOURCE)
+        for code in (cold, warm):
+            self.assertEqual(listing(code), listing(expected))
+
+    def test_changed_source_misses(self):
+        self.cache.compile(SOURCE)
+        self.cache.compile(SOURCE + "4\n")
+        self.assertEqual((self.cache.misses, self.cache.hits), (2, 0))
+
+    def test_stale_or_corrupt_entries_are_recompiled(self):
+        self.cache.compile(SOURCE)
+        path = self.cache.path(SOURCE)
+        with open(path, "rb") as file:
+            data = file.read()
+        version = slice(len(cache.MAGIC), len(cache.MAGIC) + len(cache.BYTECODE_VERSION))
+        for damaged in (data[:version.start] + b"\0" * 8 + data[version.stop:], data[:-3], b"junk"):
+            with open(path, "wb") as file:
+                file.write(damaged)
+            self.assertIsNone(self.cache.load(SOURCE))
+            self.assertEqual(listing(self.cache.compile(SOURCE)), listing(compile_code(SOURCE)))
+        self.assertEqual(self.cache.hits, 0)
+        self.assertIsNotNone(self.cache.load(SOURCE))
+
+    def test_compile_file_caches_beside_script(self):
+        script = os.path.join(self.directory.name, "zakat.moon")
+        with open(script, "w", encoding="utf-8") as file:
+            file.write(SOURCE)
+        compile_file(script)
+        entries = os.listdir(os.path.join(self.directory.name, cache.CACHE_DIRECTORY))
+        self.assertEqual(entries, [cache.source_hash(SOURCE).hex() + cache.CACHE_SUFFIX])
+        self.assertEqual(listing(compile_file(script)), listing(compile_code(SOURCE)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+from src.python_prototype.closures import ClosureInterpreter
+from src.python_prototype.interpreter import Interpreter
+from src.python_prototype.lexer import tokenize
+from src.python_prototype.parser import parse
+
+PROGRAM = """
+def fib(n):
+    if n < 2:
+        result ۝ n
+    else:
+        result ۝ fib(n - 1) + fib(n - 2)
+    result
+def shadow(x):
+    n ۝ x * 2
+    n
+﷽:
+    n ۝ 10
+    doubled ۝ shadow(4)
+    total ۝ 0
+    while n > 0 && total < 1000:
+        total ۝ total + fib(n) / 2
+        n ۝ n - 1
+    label ۝ "total: " ۩ total
+    flag ۝ !(total == 0) || -1
+"""
+
+# A local read before its assignment sees the global; callees never see
+# their caller's locals
+FRAMES = """
+def count(n):
+    if n == 0:
+        return seen
+    else:
+        seen ۝ n
+        return count(n - 1) + seen
+def caller(seen):
+    return count(3)
+﷽:
+    seen ۝ 100
+    first ۝ caller(1)
+    return first
+"""
+
+class TestClosureInterpreter(unittest.TestCase):
+    def test_matches_interpreter(self):
+        tree = parse(tokenize(PROGRAM))
+        expected = Interpreter()
+        expected.interpret(tree)
+        interpreter = ClosureInterpreter()
+        interpreter.interpret(tree)
+        self.assertEqual(interpreter.variables, expected.variables)
+        # Calls restore the caller's variables, including names the callee assigned
+        self.assertEqual((interpreter.variables["doubled"], interpreter.variables["total"]), (8.0, 71.5))
+        self.assertNotIn("result", interpreter.variables)
+
+    def test_errors(self):
+        interpreter = ClosureInterpreter()
+        with self.assertRaises(NameError):
+            interpreter.interpret(parse(tokenize("x ۝ missing + 1")))
+        with self.assertRaises(NameError):
+            interpreter.interpret(parse(tokenize("x ۝ missing(1)")))
+        with self.assertRaises(ZeroDivisionError):
+            interpreter.interpret(parse(tokenize("x ۝ 1 / 0")))
+
+    def test_redefinition(self):
+        interpreter = ClosureInterpreter()
+        call = interpreter.compile(parse(tokenize("﷽:\n    f(1)")))
+        interpreter.interpret(parse(tokenize("def f(x):\n    x + 1")))
+        self.assertEqual(call(), 2.0)
+        interpreter.interpret(parse(tokenize("def f(x):\n    x + 10")))
+        self.assertEqual(call(), 11.0)
+
+    def test_return_and_frames_match_interpreter(self):
+        tree = parse(tokenize(FRAMES))
+        expected = Interpreter()
+        interpreter = ClosureInterpreter()
+        self.assertEqual(interpreter.interpret(tree), expected.interpret(tree))
+        self.assertEqual(interpreter.variables, expected.variables)
+
+if __name__ == '__main__':
+    unittest.main()
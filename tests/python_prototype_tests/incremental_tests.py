@@ -0,0 +1,49 @@
+import unittest
+from src.python_prototype.incremental import IncrementalDocument
+from src.python_prototype.lexer import tokenize
+from src.python_prototype.parser import parse
+
+SOURCE = """def first(x):
+    return x + 1
+def second(y):
+    return y * 2
+﷽:
+    "Salam"
+"""
+
+class TestIncrementalDocument(unittest.TestCase):
+    def assert_matches_full_parse(self, document):
+        self.assertEqual(document.ast, parse(tokenize(document.source)))
+        self.assertEqual(list(document.tokens()), tokenize(document.source))
+
+    def test_edit_reuses_untouched_items(self):
+        document = IncrementalDocument(SOURCE)
+        first, second, entry = document.ast.children
+        offset = SOURCE.index("* 2") + 2
+        self.assertEqual(document.edit(offset, 1, "3"), 1)
+        self.assertIs(document.ast.children[0], first)
+        self.assertIsNot(document.ast.children[1], second)
+        self.assertIs(document.ast.children[2], entry)
+        self.assertEqual(document.ast.children[1].children[0].children[0].children[1].value, "3.0")
+        self.assert_matches_full_parse(document)
+
+    def test_edit_splits_and_merges_items(self):
+        document = IncrementalDocument(SOURCE)
+        offset = SOURCE.index("def second")
+        inserted = "def third(z):\n    return z\n"
+        document.edit(offset, 0, inserted)
+        self.assertEqual([child.value for child in document.ast.children], ["first", "third", "second", None])
+        self.assert_matches_full_parse(document)
+        document.edit(offset, len(inserted), "")
+        self.assertEqual([child.value for child in document.ast.children], ["first", "second", None])
+        self.assert_matches_full_parse(document)
+
+    def test_errors_use_document_positions(self):
+        document = IncrementalDocument(SOURCE)
+        document.edit(SOURCE.index("y * 2"), 1, ")")
+        [error] = document.errors
+        self.assertEqual((error.line, error.column), (4, 12))
+        self.assertEqual(len(document.ast.children), 2)
+
+if __name__ == '__main__':
+    unittest.main()
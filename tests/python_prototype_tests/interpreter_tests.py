@@ -0,0 +1,80 @@
+import unittest
+from src.python_prototype.interpreter import Interpreter
+from src.python_prototype.lexer import tokenize
+from src.python_prototype.parser import parse
+from src.python_prototype.ast import AstArena
+
+PROGRAM = """
+def double(x):
+    x * 2
+﷽:
+    n ۝ 0
+    total ۝ 0
+    while n < 5:
+        n ۝ n + 1
+        if len("Salam") == 5:
+            total ۝ total + double(n)
+        else:
+            total ۝ 0
+"""
+
+FRAMES = """
+def fib(n):
+    if n < 2:
+        return n
+    else:
+        return fib(n - 1) + fib(n - 2)
+def peek():
+    return inner
+def outer(inner):
+    seen ۝ limit
+    peek()
+﷽:
+    inner ۝ "global"
+    limit ۝ 3
+    results ۝ fib(10) ۩ outer("local")
+    return results
+"""
+
+class TestInterpreter(unittest.TestCase):
+    def test_loops_and_cached_calls(self):
+        for arena in (None, AstArena()):
+            interpreter = Interpreter()
+            interpreter.interpret(parse(tokenize(PROGRAM), arena))
+            self.assertEqual(interpreter.variables["total"], 30.0)
+
+    def test_redefinition_invalidates_call_sites(self):
+        interpreter = Interpreter()
+        call = parse(tokenize("﷽:\n    f(1)")).children[0].children[0]
+        interpreter.interpret(parse(tokenize("def f(x):\n    x + 1")))
+        self.assertEqual(interpreter.interpret(call), 2.0)
+        self.assertEqual(call.cache[1:], (None, interpreter.functions["f"]))
+        interpreter.interpret(parse(tokenize("def f(x):\n    x + 10")))
+        self.assertEqual(interpreter.interpret(call), 11.0)
+        # A second interpreter sharing the tree does not see the first one's entry
+        other = Interpreter()
+        other.interpret(parse(tokenize("def f(x):\n    x + 100")))
+        self.assertEqual(other.interpret(call), 101.0)
+
+    def test_call_scopes(self):
+        interpreter = Interpreter()
+        result = interpreter.interpret(parse(tokenize(FRAMES)))
+        # peek sees the global inner, not outer's parameter
+        self.assertEqual(result, "55.0global")
+        self.assertEqual(interpreter.variables["results"], result)
+        self.assertNotIn("seen", interpreter.variables)
+        self.assertNotIn("n", interpreter.variables)
+        self.assertIs(interpreter.scope, interpreter.globals)
+
+    def test_call_scopes_hold_only_locals(self):
+        interpreter = Interpreter()
+        for index in range(1000):
+            interpreter.variables[f"g{index}"] = float(index)
+        scopes = []
+        interpreter.stdlib.record = lambda: scopes.append(interpreter.scope.variables.copy())
+        interpreter.interpret(parse(tokenize("def f(x):\n    y ۝ x + g999\n    record()\n    return y\n﷽:\n    z ۝ f(1)")))
+        self.assertEqual(interpreter.variables["z"], 1000.0)
+        self.assertEqual(scopes, [{"x": 1.0, "y": 1000.0}])
+
+if __name__ == '__main__':
+    unittest.main()
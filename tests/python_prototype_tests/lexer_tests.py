@@ -1,5 +1,6 @@
 import unittest
-from src.python_prototype.lexer import tokenize, Token, TokenType
+import io
+from src.python_prototype.lexer import tokenize, tokenize_stream, Token, TokenType
 
 class TestLexer(unittest.TestCase):
     def test_tokenize_numbers(self):
@@ -65,5 +66,39 @@ class TestLexer(unittest.TestCase):
         self.assertEqual(tokens[6].type, TokenType.STRING)
         self.assertEqual(tokens[6].value, "Bismillah")
 
+    def test_tokenize_islamic_math_symbols(self):
+        tokens = tokenize("a × b ÷ c ۞ ☪")
+        expected = [
+            Token(TokenType.IDENTIFIER, "a"),
+            Token(TokenType.STAR, "*"),
+            Token(TokenType.IDENTIFIER, "b"),
+            Token(TokenType.SLASH, "/"),
+            Token(TokenType.IDENTIFIER, "c"),
+            Token(TokenType.END_STATEMENT, "۞"),
+            Token(TokenType.SYMBOL, "☪")
+        ]
+        self.assertEqual(tokens, expected)
+
+    def test_tokenize_long_and_unterminated_strings(self):
+        literal = "بسم الله " * 10000
+        tokens = tokenize(f'x ۝ "{literal}" ۩ \'open')
+        self.assertEqual(tokens[2], Token(TokenType.STRING, literal))
+        self.assertEqual(tokens[4], Token(TokenType.STRING, "open"))
+
+    def test_tokenize_stream_chunk_boundaries(self):
+        code = 'def zakat(amount): return amount × 0.025\n﷽: print("السلام" ۩ zakat(1000.5))'
+        data = code.encode("utf-8")
+        for size in (1, 2, 3, 5, 64):
+            byte_chunks = [data[i:i + size] for i in range(0, len(data), size)]
+            self.assertEqual(list(tokenize_stream(byte_chunks)), tokenize(code))
+            self.assertEqual(list(tokenize_stream(io.StringIO(code), size)), tokenize(code))
+
+    def test_token_positions(self):
+        tokens = tokenize('﷽:\n    total ۝ 2.5\n  "Salam"')
+        positions = [(token.line, token.column, token.start, token.end) for token in tokens]
+        self.assertEqual(positions, [(1, 1, 0, 1), (1, 2, 1, 2), (2, 5, 7, 12),
+                                     (2, 11, 13, 14), (2, 13, 15, 18), (3, 3, 21, 28)])
+        self.assertEqual(tokens.types[2], TokenType.IDENTIFIER)
+
 if __name__ == '__main__':
     unittest.main()
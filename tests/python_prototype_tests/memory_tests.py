@@ -0,0 +1,195 @@
+import tracemalloc
+import unittest
+from src.python_prototype.error import CompilerError
+from src.python_prototype.memory import IDLE, SLAB_SLOTS, Handle, ManagedDict, ManagedList, MemoryManager, deep_size
+
+def sample_values() -> list:
+    """Floats, strings and containers of them, as a program might store"""
+    values = []
+    for index in range(500):
+        values.append(index + 0.5)
+        values.append(f"name-{index}" * 3)
+        values.append([float(item) for item in range(index % 50)])
+        values.append({f"key{item}": item * 1.5 for item in range(index % 20)})
+        values.append([f"x{item}" for item in range(10)] + [100_000 + index])
+    return values
+
+class TestMemoryManager(unittest.TestCase):
+    def chain(self, memory: MemoryManager, length: int) -> int:
+        """Allocate a rooted list of lists length deep, returning the root"""
+        address = memory.allocate(ManagedList(), 1)
+        for _ in range(length):
+            address = memory.allocate(ManagedList([Handle(address)]), 1)
+        memory.blocks[address].increment_ref()
+        return address
+
+    def test_long_chains_do_not_recurse(self):
+        memory = MemoryManager(max_memory=10 ** 9, nursery_size=10 ** 9)
+        root = self.chain(memory, 50_000)
+        garbage = memory.allocate([], 1)
+        memory.mark_and_sweep()
+        self.assertEqual(len(memory.blocks), 50_001)
+        self.assertNotIn(garbage, memory.blocks)
+        memory.blocks[root].decrement_ref()
+        memory.mark_and_sweep()
+        self.assertEqual(memory.blocks, {})
+        self.assertEqual(memory.used_memory, 0)
+
+    def test_minor_collections_promote_and_remember(self):
+        memory = MemoryManager(max_memory=1000, nursery_size=1000, promote_age=2)
+        root = self.chain(memory, 1)
+        memory.minor_collect()
+        memory.minor_collect()
+        self.assertEqual(memory.young, {})
+        self.assertEqual(memory.stats.promoted, 2)
+        # An old container keeps what is stored in it alive
+        young = memory.allocate("young", 1)
+        garbage = memory.allocate("garbage", 1)
+        memory.get(root).append(Handle(young))
+        memory.minor_collect()
+        self.assertIn(young, memory.blocks)
+        self.assertNotIn(garbage, memory.blocks)
+        self.assertEqual(memory.stats.freed_blocks, 1)
+
+    def test_allocation_triggers_collections(self):
+        memory = MemoryManager(max_memory=1000, nursery_size=100)
+        root = self.chain(memory, 10)
+        for _ in range(2000):
+            memory.allocate("temporary", 10)
+        self.assertGreater(memory.stats.minor_collections, 0)
+        self.assertIn(root, memory.blocks)
+        self.assertLessEqual(memory.used_memory, memory.max_memory)
+        self.assertEqual(len(memory.stats.pauses), memory.stats.minor_collections + memory.stats.major_collections)
+
+    def test_incremental_major_collection(self):
+        memory = MemoryManager(incremental=True, step_size=1)
+        container = memory.allocate(ManagedList(), 1)
+        memory.blocks[container].increment_ref()
+        garbage = [memory.allocate([], 1) for _ in range(5)]
+        moved = memory.allocate(ManagedList(), 1)
+        memory.blocks[moved].increment_ref()
+        memory.start_major()
+        memory.collect_step()
+        # Stored in a container and unrooted after the roots were scanned
+        memory.get(container).append(Handle(moved))
+        memory.blocks[moved].decrement_ref()
+        # Allocated during the collection, so not swept by it
+        fresh = memory.allocate("fresh", 1)
+        while memory.phase != IDLE:
+            memory.collect_step()
+        self.assertEqual(set(memory.blocks), {container, moved, fresh})
+        self.assertEqual(memory.stats.major_collections, 1)
+        self.assertGreater(memory.stats.incremental_steps, len(garbage))
+        self.assertLessEqual(memory.stats.pause_percentile(50), memory.stats.max_pause)
+
+    def test_handles_moved_during_marking_survive(self):
+        memory = MemoryManager(incremental=True, step_size=1)
+        moved = memory.allocate("moved", 1)
+        source = memory.allocate(ManagedList([Handle(moved)]), 1)
+        target = memory.allocate(ManagedList(), 1)
+        memory.blocks[source].increment_ref()
+        memory.blocks[target].increment_ref()
+        memory.start_major()
+        # Scan the roots, then target, leaving source and what it holds
+        while memory.cursor < memory.snapshot_end:
+            memory.collect_step()
+        memory.collect_step()
+        self.assertIn(target, memory.marked)
+        self.assertNotIn(moved, memory.marked)
+        memory.get(target).append(memory.get(source).pop())
+        while memory.phase != IDLE:
+            memory.collect_step()
+        self.assertEqual(set(memory.blocks), {moved, source, target})
+        self.assertEqual(memory.blocks[moved].heap_references, 1)
+
+    def test_size_classes_and_address_reuse(self):
+        memory = MemoryManager()
+        small = memory.allocate("small", 10)
+        medium = memory.allocate("medium", 100)
+        large = memory.allocate("large", 5000)
+        # Each size class takes addresses from its own slab
+        self.assertEqual((small, medium, large), (1, 1 + SLAB_SLOTS, 1 + 2 * SLAB_SLOTS))
+        self.assertEqual(memory.used_memory, 10 + 100 + 5000)
+        memory.free(small)
+        memory.free(large)
+        self.assertEqual(memory.allocate("reused", 12), small)
+        self.assertEqual(memory.allocate("reused", 3000), large)
+        self.assertEqual(sorted(memory.blocks), [small, medium, large])
+        self.assertEqual((memory.blocks[medium].value, memory.blocks[medium].size), ("medium", 100))
+        self.assertNotIn(2, memory.blocks)
+        self.assertEqual(len(memory.values), 1 + 2 * SLAB_SLOTS + 1)
+
+    def test_measured_sizes_match_tracemalloc(self):
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            values = sample_values()
+            traced = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+        memory = MemoryManager(max_memory=10 ** 9)
+        for value in values:
+            memory.allocate(value)
+        self.assertAlmostEqual(memory.used_memory / traced, 1.0, delta=0.05)
+
+    def test_mutated_containers_are_measured_again(self):
+        memory = MemoryManager(max_memory=10_000)
+        address = memory.allocate([])
+        memory.blocks[address].increment_ref()
+        memory.get(address).extend(float(item) for item in range(100))
+        memory.allocate(None)
+        self.assertEqual(memory.used_memory, deep_size(memory.get(address)))
+        self.assertGreater(memory.used_memory, 100 * 24)
+        with self.assertRaises(CompilerError):
+            memory.allocate("x" * 10_000)
+
+    def test_reference_counts_free_blocks_promptly(self):
+        memory = MemoryManager(max_memory=10 ** 9, nursery_size=10 ** 9)
+        root = self.chain(memory, 50_000)
+        kept = memory.allocate("kept", 1)
+        table = memory.allocate(ManagedDict({"kept": Handle(kept), "chain": Handle(root)}))
+        memory.blocks[table].increment_ref()
+        memory.blocks[root].decrement_ref()
+        self.assertEqual(memory.blocks[root].heap_references, 1)
+        # Overwriting the only Handle to the chain frees it all, with no collection
+        memory.get(table)["chain"] = 1.5
+        memory.allocate(None)
+        self.assertEqual(memory.stats.refcount_freed, 50_001)
+        self.assertEqual(len(memory.blocks), 3)
+        self.assertEqual(memory.stats.minor_collections + memory.stats.major_collections, 0)
+        self.assertEqual(memory.used_memory, sum(memory.sizes[address] for address in memory.blocks))
+        self.assertEqual(memory.blocks[table].size, deep_size(memory.get(table)))
+        # A Handle moved between containers before the next allocation stays alive
+        other = memory.allocate(ManagedList())
+        memory.blocks[other].increment_ref()
+        memory.get(other).append(memory.get(table).pop("kept"))
+        memory.allocate(None)
+        self.assertIn(kept, memory.blocks)
+        self.assertEqual(memory.blocks[kept].heap_references, 1)
+
+    def test_cycle_detector_frees_unreachable_cycles(self):
+        memory = MemoryManager(cycle_threshold=2)
+        shared = memory.allocate("shared", 1)
+        memory.blocks[shared].increment_ref()
+        first = memory.allocate(ManagedList([Handle(shared)]), 1)
+        second = memory.allocate(ManagedList([Handle(first)]), 1)
+        memory.get(first).append(Handle(second))
+        kept = memory.allocate(ManagedList(), 1)
+        memory.get(kept).append(Handle(kept))
+        holder = memory.allocate(ManagedList([Handle(kept)]), 1)
+        for address in (first, kept, holder):
+            memory.blocks[address].increment_ref()
+        memory.blocks[first].decrement_ref()
+        memory.blocks[kept].decrement_ref()
+        self.assertEqual(memory.candidates, {first, kept})
+        # The cycle still held from outside survives; the other is freed
+        fresh = memory.allocate(None)
+        self.assertEqual(memory.stats.cycle_collections, 1)
+        self.assertEqual(memory.stats.cycle_freed, 2)
+        self.assertEqual(set(memory.blocks), {shared, kept, holder, fresh})
+        self.assertEqual(memory.blocks[shared].heap_references, 0)
+        self.assertEqual(memory.blocks[kept].heap_references, 2)
+        self.assertEqual(memory.stats.minor_collections + memory.stats.major_collections, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+import unittest
+from src.python_prototype.ast import AstArena, AstNode
+from src.python_prototype.lexer import tokenize
+from src.python_prototype.optimizer import OptimizationPass, Optimizer, copy_leaf, with_children
+from src.python_prototype.parser import parse
+
+def optimize(source: str, optimizer: Optimizer = None) -> AstNode:
+    """The optimized value of the first assignment in source"""
+    optimizer = optimizer or Optimizer()
+    return optimizer.optimize(parse(tokenize(source))).children[0].children[0]
+
+class InlineOne(OptimizationPass):
+    """Replaces the variable one with its value, after the built-in passes"""
+    node_types = frozenset(("Identifier",))
+
+    def __init__(self):
+        super().__init__("inline_one")
+
+    def optimize(self, node: AstNode) -> AstNode:
+        return AstNode("Number", "1") if node.value == "one" else node
+
+class TestOptimizer(unittest.TestCase):
+    def test_folds_nested_constants(self):
+        self.assertEqual(optimize("x ۝ (12 * 30 - 350) * 2\n"), AstNode("Number", "20.0"))
+
+    def test_earlier_passes_see_later_rewrites(self):
+        optimizer = Optimizer()
+        optimizer.passes.append(InlineOne())
+        # y * one only becomes y * 1 after expression_simplification has run on it
+        self.assertEqual(optimize("x ۝ y * one\n", optimizer), AstNode("Identifier", "y"))
+        self.assertEqual(optimizer.stats["inline_one"].rewrites, 1)
+        self.assertEqual(optimizer.stats["expression_simplification"].rewrites, 1)
+
+    def test_only_changed_nodes_are_visited_again(self):
+        optimizer = Optimizer(timed=True)
+        optimize("x ۝ (y * 2) + (3 * 4)\n", optimizer)
+        folding = optimizer.stats["constant_folding"]
+        # Both products and the sum once each; the 12 replacing 3 * 4 is
+        # visited, but no pass rewrites Numbers
+        self.assertEqual((folding.calls, folding.rewrites), (3, 1))
+        self.assertEqual(optimizer.visited, 6)
+        self.assertGreater(folding.seconds, 0)
+        self.assertEqual(optimizer.stats["dead_code_elimination"].calls, 0)
+
+    def test_disabled_passes_do_not_run(self):
+        optimizer = Optimizer()
+        for pass_ in optimizer.passes:
+            pass_.enabled = pass_.name not in ("constant_folding", "constant_propagation")
+        result = optimize("x ۝ 1 + 2\n", optimizer)
+        self.assertEqual(result.type, "BinaryOp")
+        self.assertNotIn("constant_folding", optimizer.stats)
+
+    def test_deep_expressions_do_not_recurse(self):
+        source = "x ۝ " + " + ".join(["y"] + ["1 * 2"] * 5000) + "\n"
+        result = optimize(source)
+        depth = 0
+        while result.type == "BinaryOp":
+            self.assertEqual(result.children[1], AstNode("Number", "2.0"))
+            result = result.children[0]
+            depth += 1
+        self.assertEqual((depth, result.value), (5000, "y"))
+
+    def test_optimizes_arena_trees(self):
+        arena = AstArena()
+        tree = parse(tokenize("x ۝ 1 + 2 * 3\ny ۝ x\n"), arena)
+        program = Optimizer().optimize(tree)
+        self.assertIs(program.arena, arena)
+        self.assertEqual([statement.children[0].to_node() for statement in program.children],
+                         [AstNode("Number", "7.0"), AstNode("Number", "7.0")])
+        # Nothing to rewrite, so the tree is left where it is
+        tree = parse(tokenize("x ۝ y\n"), arena)
+        self.assertIs(Optimizer().optimize(tree), tree)
+        # Each use of a propagated constant gets a node of its own
+        program = Optimizer().optimize(parse(tokenize('x ۝ "a"\ny ۝ print(x, x)\n'), arena)).to_node()
+        value, call = program.children[0].children[0], program.children[1].children[0]
+        self.assertEqual(call.children, [AstNode("String", "a"), AstNode("String", "a")])
+        self.assertEqual(len({id(value), id(call.children[0]), id(call.children[1])}), 3)
+
+    def test_copies_arena_nodes(self):
+        assignment = parse(tokenize("x ۝ 1 + 2\n"), AstArena()).children[0]
+        total = assignment.children[0]
+        copy = with_children(total, [AstNode("Number", "3"), total.children[1]])
+        self.assertEqual((copy.type, copy.value, copy.children[0]), ("BinaryOp", "+", AstNode("Number", "3")))
+        self.assertEqual(copy_leaf(total.children[0]), AstNode("Number", "1.0"))
+        self.assertEqual(with_children(assignment, [AstNode("Identifier", "y")]).name, "x")
+
+    def test_folds_strings_unary_ops_and_pure_calls(self):
+        self.assertEqual(optimize('x ۝ "a" + "b" ۩ 2\n'), AstNode("String", "ab2.0"))
+        self.assertEqual(optimize("x ۝ -(2 * 3)\n"), AstNode("Number", "-6.0"))
+        self.assertEqual(optimize('x ۝ len("abc") * 2\n'), AstNode("Number", "6.0"))
+        # Numbers are floats, so the int len gives is kept as a call
+        self.assertEqual(optimize('x ۝ len("abc")\n').type, "FunctionCall")
+        # Left for the program to fail on
+        self.assertEqual(optimize("x ۝ 1 / 0\n").type, "BinaryOp")
+        self.assertEqual(optimize("x ۝ 0 && y\n"), AstNode("Number", "0.0"))
+
+    def test_propagates_constants_through_assignments(self):
+        program = Optimizer().optimize(parse(tokenize(
+            'base ۝ 40\nname ۝ "n" ۩ base\ntotal ۝ base + 2\nbase ۝ y\nlast ۝ base\n')))
+        values = [statement.children[0] for statement in program.children]
+        self.assertEqual(values[1:], [AstNode("String", "n40.0"), AstNode("Number", "42.0"),
+                                      AstNode("Identifier", "y"), AstNode("Identifier", "base")])
+
+    def test_branches_and_loops_keep_only_what_they_agree_on(self):
+        source = ("a ۝ 1\nb ۝ 2\n"
+                  "if flag:\n    a ۝ 1\n    b ۝ 3\n"
+                  "﷽:\n    x ۝ a ۩ b\n")
+        result = Optimizer().optimize(parse(tokenize(source))).children[-1].children[0].children[0]
+        self.assertEqual(result.children, [AstNode("Number", "1.0"), AstNode("Identifier", "b")])
+        source = "a ۝ 1\nb ۝ 2\nwhile flag:\n    x ۝ a ۩ b\n    b ۝ b + 1\n"
+        result = Optimizer().optimize(parse(tokenize(source))).children[-1].children[1].children[0]
+        self.assertEqual(result.children, [AstNode("Number", "1.0"), AstNode("Identifier", "b")])
+
+    def test_functions_do_not_see_global_constants(self):
+        source = "limit ۝ 3\ndef f(n):\n    step ۝ 2\n    return limit * step + n\n"
+        body = Optimizer().optimize(parse(tokenize(source))).children[1].children
+        self.assertEqual(body[1].children[0].children[0].children,
+                         [AstNode("Identifier", "limit"), AstNode("Number", "2.0")])
+
+    def test_inlines_small_functions(self):
+        source = ("def add(x, y):\n    return x + y\n"
+                  "def twice(x):\n    add(x, x)\n"
+                  "﷽:\n    total ۝ twice(a) * add(3, 4)\n")
+        program = Optimizer().optimize(parse(tokenize(source)))
+        total = program.children[-1].children[0].children[0]
+        self.assertEqual((total.value, total.children[1]), ("*", AstNode("Number", "7.0")))
+        self.assertEqual(total.children[0].children, [AstNode("Identifier", "a"), AstNode("Identifier", "a")])
+
+    def test_keeps_calls_that_are_unsafe_to_inline(self):
+        functions = ("def first(x, y):\n    return x\n"
+                     "def square(x):\n    return x * x\n"
+                     "def scaled(x):\n    return x * factor\n"
+                     "def countdown(x):\n    return x < 1 || countdown(x - 1)\n"
+                     "def uses_scaled(factor):\n    return scaled(factor)\n")
+        calls = ["first(a, b)", "square(count())", "countdown(3)", "first(a)", "later(a)"]
+        source = functions + "﷽:\n" + "".join(f"    v ۝ {call}\n" for call in calls) + "def later(x):\n    return x\n"
+        program = Optimizer().optimize(parse(tokenize(source)))
+        values = [statement.children[0] for statement in program.children[-2].children]
+        self.assertEqual([value.type for value in values], ["FunctionCall"] * len(calls))
+        # Inside a function, factor would be read as the caller's parameter
+        self.assertEqual(program.children[4].children[0].children[0].type, "FunctionCall")
+
+    def test_inlining_stays_within_budget(self):
+        source = "def add(x, y):\n    return x + y\n﷽:\n    v ۝ add(a, b)\n"
+        for budget, inlined in ((3, "BinaryOp"), (2, "FunctionCall")):
+            optimizer = Optimizer()
+            optimizer.passes[0].budget = budget
+            program = optimizer.optimize(parse(tokenize(source)))
+            self.assertEqual(program.children[1].children[0].children[0].type, inlined)
+
+    def test_hoists_loop_invariants(self):
+        source = ("﷽:\n    n ۝ 0\n"
+                  "    while n < years * 12:\n"
+                  "        balance ۝ balance * (1 + rate / 12)\n"
+                  "        print(balance - fee * 2)\n"
+                  "        n ۝ n + 1\n")
+        entry = Optimizer().optimize(parse(tokenize(source))).children[0]
+        # 1 + rate / 12 is first evaluated in the body, so nothing may run
+        # unless the loop does
+        guard = entry.children[1]
+        self.assertEqual(guard.type, "If")
+        hoisted, loop = guard.children[1].children[:2], guard.children[1].children[2]
+        self.assertEqual([(node.value, node.children[0].value) for node in hoisted], [("invariant#1", "*"), ("invariant#2", "+")])
+        self.assertEqual(loop.children[0].children[1], AstNode("Identifier", "invariant#1"))
+        self.assertEqual(loop.children[1].children[0].children[1], AstNode("Identifier", "invariant#2"))
+        # fee * 2 comes after an assignment, which may be the one to fail
+        self.assertEqual(loop.children[2].children[0].children[1].value, "*")
+
+    def test_reduces_counter_multiplications(self):
+        source = "i ۝ 0\nwhile i < 10:\n    a ۝ i * 3\n    b ۝ a + 3 * i\n    i ۝ i + 1\n    c ۝ i * 3\n"
+        program = Optimizer().optimize(parse(tokenize(source)))
+        start, loop = program.children[1:]
+        self.assertEqual((start.value, start.children[0]), ("stride#1", AstNode("Number", "0.0")))
+        self.assertEqual([statement.value for statement in loop.children[1:]], ["a", "b", "i", "stride#1", "c"])
+        self.assertEqual(loop.children[4].children[0].children, [AstNode("Identifier", "stride#1"), AstNode("Number", "3.0")])
+        self.assertEqual(loop.children[5].children[0], AstNode("Identifier", "stride#1"))
+        # Sums of a counter starting at 0.5 could round differently from its products
+        program = Optimizer().optimize(parse(tokenize(source.replace("i ۝ 0", "i ۝ 0.5"))))
+        self.assertEqual(len(program.children), 2)
+
+    def test_drops_dead_assignments_in_function_loops(self):
+        source = ("def f(n):\n    i ۝ 0\n    while i < n:\n"
+                  "        unused ۝ i * 2 + 1\n        risky ۝ n / i\n        i ۝ i + 1\n")
+        loop = Optimizer().optimize(parse(tokenize(source))).children[0].children[1]
+        self.assertEqual([statement.value for statement in loop.children[1:]], ["risky", "i"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,10 @@
 import unittest
 from src.python_prototype.parser import parse
-from src.python_prototype.lexer import tokenize
+import io
+from src.python_prototype.lexer import tokenize, tokenize_stream
+from src.python_prototype.error import CompilerError
+from src.python_prototype.ast import AstArena
+from src.python_prototype.interpreter import Interpreter
 
 class TestParser(unittest.TestCase):
     def test_parse_function_definition(self):
@@ -27,6 +31,68 @@ class TestParser(unittest.TestCase):
         self.assertEqual(ast.type, "Program")
         self.assertEqual(ast.children[0].type, "EntryPoint")
 
+    def test_parse_token_stream(self):
+        code = """
+        def test(x, y):
+            return x + y
+        ﷽:
+            "Salam"
+            2 * 3
+        """
+        ast = parse(tokenize_stream(io.StringIO(code), 4))
+        self.assertEqual(ast, parse(tokenize(code)))
+        self.assertEqual([child.type for child in ast.children], ["FunctionDef", "EntryPoint"])
+
+    def test_syntax_error_position(self):
+        with self.assertRaises(CompilerError) as context:
+            parse(tokenize("﷽:\n    2 *\n    )"))
+        self.assertEqual((context.exception.line, context.exception.column), (3, 5))
+
+    def test_parse_operator_precedence(self):
+        ast = parse(tokenize("﷽: ok ۝ a + b * c < d ۩ e && !f || g == h"))
+        assignment = ast.children[0].children[0]
+        self.assertEqual(assignment.type, "Assignment")
+        self.assertEqual(assignment.value, "ok")
+
+        def shape(node):
+            if node.type in ("BinaryOp", "UnaryOp"):
+                return (node.value, *[shape(child) for child in node.children])
+            return node.value
+        self.assertEqual(shape(assignment.children[0]),
+                         ("||", ("&&", ("<", ("+", "a", ("*", "b", "c")), ("۩", "d", "e")), ("!", "f")),
+                          ("==", "g", "h")))
+
+    def test_parse_calls_and_grouping(self):
+        ast = parse(tokenize("﷽: print(add(1, 2) * (3 - x))"))
+        call = ast.children[0].children[0]
+        self.assertEqual((call.type, call.value), ("FunctionCall", "print"))
+        product = call.children[0]
+        self.assertEqual(product.value, "*")
+        self.assertEqual((product.children[0].type, product.children[0].value), ("FunctionCall", "add"))
+        self.assertEqual(product.children[1].value, "-")
+
+    def test_parse_long_operator_chain(self):
+        terms = 100_000
+        ast = parse(tokenize("﷽: " + " - ".join(["x"] * terms) + " * " + "-" * 5000 + "y"))
+        node = ast.children[0].children[0]
+        depth = 0
+        while node.type == "BinaryOp":
+            node = node.children[0]
+            depth += 1
+        self.assertEqual(depth, terms - 1)
+
+    def test_parse_into_arena(self):
+        code = "def add(x, y):\n    return x + y * 2\n﷽:\n    total ۝ 1 + 2 * 3 - -4\n    total\n"
+        arena = AstArena()
+        root = parse(tokenize(code), arena)
+        self.assertEqual(root.to_node(), parse(tokenize(code)))
+        self.assertEqual(len(arena), len(list(arena.walk(root.handle))))
+        function = root.children[0]
+        self.assertEqual((function.name, function.params), ("add", ["x", "y"]))
+        start, end = function.children[0].children[0].span
+        self.assertEqual(code[start:end], "x + y * 2")
+        self.assertEqual(Interpreter().interpret(root), 11.0)
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,81 @@
+import unittest
+from src.python_prototype.bytecode import CodeObject, Instruction, OpCode, from_instructions, to_instructions
+from src.python_prototype.compiler import compile_code
+from src.python_prototype.peephole import (BASIC_OPTIMIZATION, FULL_OPTIMIZATION, NO_OPTIMIZATION,
+                                           PeepholeOptimizer, optimize_code)
+from src.python_prototype.vm import VirtualMachine
+
+PROGRAM = """
+def zakat(amount, nisab):
+    due ۝ 0
+    due ۝ amount * 0.025
+    if amount < nisab:
+        return 0
+    else:
+        return due
+﷽:
+    total ۝ 0
+    n ۝ 0
+    while n < 4 && total < 1000:
+        total ۝ total + zakat(1000 * n, 1500)
+        n ۝ n + 1
+"""
+
+def opcodes(code: CodeObject):
+    return [instruction.opcode for instruction in to_instructions(code)]
+
+def run(code: CodeObject):
+    vm = VirtualMachine()
+    vm.execute(code)
+    return vm.globals["total"], vm.stack
+
+class TestPeephole(unittest.TestCase):
+    def test_levels_preserve_behaviour(self):
+        results = [run(compile_code(PROGRAM, level))
+                   for level in (NO_OPTIMIZATION, BASIC_OPTIMIZATION, FULL_OPTIMIZATION)]
+        self.assertEqual(results, [(125.0, [])] * 3)
+
+    def test_no_optimization_is_unchanged(self):
+        code = compile_code(PROGRAM, NO_OPTIMIZATION)
+        self.assertIs(optimize_code(code, NO_OPTIMIZATION), code)
+
+    def test_jumps_are_threaded_and_dead_code_removed(self):
+        code = from_instructions([
+            Instruction(OpCode.LOAD_NAME, "ready"),
+            Instruction(OpCode.POP_JUMP_IF_FALSE, 4),
+            Instruction(OpCode.LOAD_CONST, 1),
+            Instruction(OpCode.RETURN_VALUE),
+            Instruction(OpCode.JUMP_ABSOLUTE, 5),
+            Instruction(OpCode.JUMP_ABSOLUTE, 7),
+            Instruction(OpCode.LOAD_CONST, 2),
+            Instruction(OpCode.LOAD_CONST, 3),
+            Instruction(OpCode.RETURN_VALUE),
+        ])
+        optimizer = PeepholeOptimizer(BASIC_OPTIMIZATION)
+        optimized = optimizer.optimize(code)
+        self.assertEqual([(instruction.opcode, instruction.arg) for instruction in to_instructions(optimized)], [
+            (OpCode.LOAD_NAME, 0), (OpCode.POP_JUMP_IF_FALSE, 4), (OpCode.LOAD_CONST, 0),
+            (OpCode.RETURN_VALUE, 0), (OpCode.LOAD_CONST, 2), (OpCode.RETURN_VALUE, 0),
+        ])
+        self.assertEqual(optimizer.stats.removed, 3)
+        self.assertGreater(optimizer.stats.threaded_jumps, 0)
+        for ready, expected in ((True, 1), (False, 3)):
+            vm = VirtualMachine()
+            vm.globals["ready"] = ready
+            self.assertEqual(vm.execute(optimized), expected)
+
+    def test_superinstructions_and_dead_stores(self):
+        optimizer = PeepholeOptimizer(FULL_OPTIMIZATION)
+        code = optimizer.optimize(compile_code(PROGRAM, NO_OPTIMIZATION))
+        self.assertIn(OpCode.INCR_NAME, opcodes(code))
+        function = next(const for const in code.consts if isinstance(const, CodeObject))
+        self.assertIn(OpCode.COMPARE_JUMP_IF_FALSE, opcodes(function))
+        self.assertEqual(optimizer.stats.dead_stores, 1)
+        self.assertEqual(optimizer.stats.superinstructions, 2)
+        self.assertEqual(optimizer.stats.removed, optimizer.stats.instructions_before - len(code) - len(function))
+
+        code = compile_code("total ۝ 1\nprint(total + 2)", FULL_OPTIMIZATION)
+        self.assertIn(OpCode.LOAD_NAME_LOAD_CONST_ADD, opcodes(code))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from src.python_prototype.regvm import RegisterOp, RegisterVirtualMachine, compile_registers
+from src.python_prototype.vm import REGISTER_BACKEND, STACK_BACKEND, UNBOUND, run_source
+
+PROGRAM = """
+def zakat(amount, nisab):
+    if amount < nisab:
+        return 0
+    else:
+        return amount * 0.025
+def pick(a, b):
+    return a && b || -1
+﷽:
+    total ۝ 0
+    n ۝ 0
+    flag ۝ 1
+    flag ۝ 0 || flag
+    label ۝ "n" ۩ 2
+    negated ۝ !flag
+    while n < 4:
+        total ۝ total + zakat(1000 * n, 1500) - -pick(n, 1) / 2
+        n ۝ n + 1
+"""
+
+class TestRegisterVirtualMachine(unittest.TestCase):
+    def test_backends_agree(self):
+        expected = run_source(PROGRAM, STACK_BACKEND)
+        result = run_source(PROGRAM, REGISTER_BACKEND)
+        self.assertEqual({name: value for name, value in result.items() if name not in ("zakat", "pick")},
+                         {name: value for name, value in expected.items() if name not in ("zakat", "pick")})
+        self.assertEqual(result["total"], 126.0)
+        self.assertEqual(result["label"], "n2.0")
+        with self.assertRaises(ValueError):
+            run_source(PROGRAM, "tree")
+
+    def test_functions_return_their_last_value(self):
+        source = ("def double(x):\n    x * 2\ndef due(amount):\n    due ۝ amount / 40\n"
+                  "def sign(x):\n    if x < 0:\n        \"negative\"\n    else:\n        x ۩ \"\"\n"
+                  "def count(n):\n    while n < 3:\n        n ۝ n + 1\n"
+                  "﷽:\n    results ۝ list(double(4), due(80), sign(-1), sign(2), count(0))\n")
+        expected = [8.0, 2.0, "negative", "2.0", None]
+        self.assertEqual(run_source(source, REGISTER_BACKEND)["results"], expected)
+        self.assertEqual(run_source(source, STACK_BACKEND)["results"], expected)
+
+    def test_three_address_code(self):
+        code = compile_registers("x ۝ 1\ny ۝ x * 2 + x")
+        opcodes = [instruction[0] for instruction in code.instructions]
+        self.assertEqual(opcodes, [RegisterOp.MOVE, RegisterOp.STORE_NAME,
+                                   RegisterOp.MULTIPLY, RegisterOp.ADD, RegisterOp.STORE_NAME])
+        # x and y unbound, one temporary, then the constants 1.0 and 2.0
+        self.assertEqual(code.initial, [UNBOUND, UNBOUND, None, 1.0, 2.0])
+        vm = RegisterVirtualMachine()
+        vm.execute(code)
+        self.assertEqual(vm.globals, {"x": 1.0, "y": 3.0})
+
+    def test_call_errors(self):
+        with self.assertRaises(TypeError):
+            run_source("def f(a):\n    return a\n﷽:\n    f(1, 2)", REGISTER_BACKEND)
+        with self.assertRaises(NameError):
+            run_source("x ۝ missing + 1", REGISTER_BACKEND)
+
+    def test_unbound_local(self):
+        source = "def f(flag):\n    if flag:\n        x ۝ 1\n    else:\n        return x\n﷽:\n    f(0)"
+        with self.assertRaises(UnboundLocalError):
+            run_source(source, REGISTER_BACKEND)
+        # Only reads that may come before the name is bound are checked
+        code = compile_registers("def f(n):\n    t ۝ n\n    while t < 3:\n        u ۝ t + u\n        t ۝ t + 1\n")
+        function = next(value for value in code.initial if hasattr(value, "instructions"))
+        checks = [instruction for instruction in function.instructions if instruction[0] == RegisterOp.CHECK_BOUND]
+        self.assertEqual([function.names[instruction[2]] for instruction in checks], ["u"])
+        # At module level an unbound name is looked up like the stack VM does
+        with self.assertRaises(NameError):
+            run_source("q ۝ 0\nif q:\n    c ۝ 1\n﷽:\n    c ۝ c", REGISTER_BACKEND)
+        self.assertEqual(run_source("y ۝ len(\"ab\")\nlen ۝ 3", REGISTER_BACKEND)["y"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+from src.python_prototype.ast import AstArena, AstNode, node_key
+from src.python_prototype.bytecode import OpCode
+from src.python_prototype.compiler import Compiler
+from src.python_prototype.error import CompilerError
+from src.python_prototype.lexer import tokenize
+from src.python_prototype.parser import parse
+from src.python_prototype.semantic import ANY, BOOLEAN, LIST, NUMBER, STRING, SemanticAnalyzer, TypeInference
+
+def analyze(source: str, arena: AstArena = None):
+    tree = parse(tokenize(source), arena)
+    analyzer = SemanticAnalyzer()
+    analyzer.analyze(tree)
+    return tree, analyzer
+
+def nodes(tree: AstNode) -> int:
+    count = 0
+    pending = [tree]
+    while pending:
+        node = pending.pop()
+        count += 1
+        pending.extend(node.children)
+    return count
+
+class TestSemanticAnalyzer(unittest.TestCase):
+    def test_visits_each_node_once(self):
+        source = "def f(n):\n    i ۝ 0\n" + "".join(f"{'    ' * depth}while i < n:\n" for depth in range(1, 30))
+        source += "        i ۝ i + 1\n    return i\n﷽:\n    x ۝ f(3)\n"
+        tree, analyzer = analyze(source)
+        self.assertEqual(analyzer.visited, nodes(tree))
+        self.assertEqual(set(analyzer.timings), {"traverse", "resolve"})
+
+    def test_resolves_locals_to_slots_and_globals_by_name(self):
+        tree, analyzer = analyze("rate ۝ 2.5\ndef due(amount):\n    due ۝ amount * rate\n    return due\n")
+        assignment, function = tree.children
+        body = function.children
+        amount, rate = body[0].children[0].children
+        self.assertIs(analyzer.symbol(rate), analyzer.symbol(assignment))
+        self.assertIsNone(analyzer.symbol(rate).slot)
+        self.assertEqual(analyzer.symbol(amount).slot, 0)
+        # The function's own due is a local, not the function
+        self.assertIs(analyzer.symbol(body[1].children[0]), analyzer.symbol(body[0]))
+        self.assertEqual(analyzer.symbol(body[0]).slot, 1)
+
+    def test_functions_may_read_globals_assigned_later(self):
+        tree, analyzer = analyze("def f():\n    return total\n﷽:\n    total ۝ 1\n    f()\n")
+        read = tree.children[0].children[0].children[0]
+        self.assertIs(analyzer.symbol(read), analyzer.globals.symbols["total"])
+        with self.assertRaises(CompilerError):
+            analyze("def f():\n    return missing\n")
+
+    def test_compiler_reuses_function_scopes(self):
+        source = "def f(a, b):\n    c ۝ a\n    while c < b:\n        d ۝ c * 2\n        c ۝ c + d\n    return c\n"
+        tree, analyzer = analyze(source)
+        plain, analyzed = Compiler(), Compiler(analyzer=analyzer)
+        plain.compile(tree)
+        analyzed.compile(tree)
+        expected, actual = plain.get_code().consts[0], analyzed.get_code().consts[0]
+        self.assertEqual(actual.varnames, ("a", "b", "c", "d"))
+        self.assertEqual((actual.varnames, actual.code), (expected.varnames, expected.code))
+
+    def test_arena_trees_resolve_like_node_trees(self):
+        source = ("rate ۝ 2\ndef f(a, b):\n    c ۝ a + rate\n    return c * b\n"
+                  "﷽:\n    y ۝ f(1, 2)\n    z ۝ y ۩ \"s\"\n")
+        tree, analyzer = analyze(source, AstArena())
+        nodes_tree, nodes_analyzer = analyze(source)
+        self.assertEqual(len(analyzer.resolutions), len(nodes_analyzer.resolutions))
+        # Each access to an arena node makes a new view of it
+        function = tree.children[1]
+        self.assertIs(analyzer.symbol(function.children[0].children[0].children[0]),
+                      analyzer.scopes[node_key(function)].symbols["a"])
+        plain, analyzed = Compiler(), Compiler(analyzer=analyzer)
+        plain.compile(nodes_tree)
+        analyzed.compile(tree)
+        functions = [[(const.varnames, const.code) for const in compiler.get_code().consts if hasattr(const, "code")]
+                     for compiler in (plain, analyzed)]
+        self.assertEqual(functions[1], functions[0])
+
+    def test_infers_types_through_assignments_and_parameters(self):
+        source = ("def grow(amount, rate):\n    amount ۝ amount + amount * rate\n    return amount\n"
+                  "def label(x):\n    return x ۩ \"\"\n"
+                  "﷽:\n    total ۝ grow(100, 0.5)\n    name ۝ \"n\" ۩ total\n    flag ۝ total > 1\n"
+                  "    mixed ۝ 1\n    mixed ۝ name\n    items ۝ list(1, 2)\n    size ۝ len(name)\n"
+                  "    f ۝ label\n    f(1)\n")
+        tree, analyzer = analyze(source)
+        types = TypeInference(analyzer)
+        types.infer(tree)
+        grow = analyzer.scopes[node_key(tree.children[0])].symbols
+        self.assertEqual((grow["amount"].type, grow["rate"].type), (NUMBER, NUMBER))
+        self.assertEqual(types.type_of(tree.children[0].children[0].children[0]), NUMBER)
+        variables = analyzer.globals.symbols
+        self.assertEqual([variables[name].type for name in ("total", "name", "flag", "mixed", "items", "size")],
+                         [ANY, STRING, BOOLEAN, ANY, LIST, ANY])
+        # label is used as a value, so it may be called with anything
+        self.assertEqual(analyzer.scopes[node_key(tree.children[1])].symbols["x"].type, ANY)
+
+    def test_infers_types_for_arena_trees(self):
+        source = ("def add(x, y):\n    return x + y\n"
+                  "﷽:\n    total ۝ add(1, 2)\n    name ۝ \"n\" ۩ total\n    line ۝ name ۩ \"!\"\n")
+        tree, analyzer = analyze(source, AstArena())
+        types = TypeInference(analyzer)
+        types.infer(tree)
+        add = analyzer.scopes[node_key(tree.children[0])].symbols
+        self.assertEqual((add["x"].type, add["y"].type, analyzer.globals.symbols["name"].type),
+                         (NUMBER, NUMBER, STRING))
+        compiler = Compiler(analyzer=analyzer, types=types)
+        compiler.compile(tree)
+        code = compiler.get_code()
+        opcodes = [instruction.opcode for instruction in code]
+        opcodes += [instruction.opcode for const in code.consts if hasattr(const, "code") for instruction in const]
+        self.assertEqual([opcode for opcode in opcodes if opcode in (OpCode.BINARY_ADD_FLOAT, OpCode.CONCAT_STR)],
+                         [OpCode.CONCAT_STR, OpCode.BINARY_ADD_FLOAT])
+
+if __name__ == '__main__':
+    unittest.main()
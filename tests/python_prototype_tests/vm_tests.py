@@ -1,6 +1,8 @@
 import unittest
 from src.python_prototype.vm import VirtualMachine, Instruction, OpCode
+from src.python_prototype.bytecode import CodeObject
 from src.python_prototype.compiler import compile_code
+from src.python_prototype.peephole import NO_OPTIMIZATION
 
 class TestVirtualMachine(unittest.TestCase):
     def setUp(self):
@@ -67,6 +69,119 @@ class TestVirtualMachine(unittest.TestCase):
         self.assertEqual(result, 1)
         self.assertEqual(len(self.vm.stack), 2)
 
+    def test_compiled_operators_and_calls(self):
+        code = """
+        def scale(x, factor):
+            return x * factor - 1 / 2
+        ﷽:
+            n ۝ 0
+            while n < 3 && !(n == 5):
+                n ۝ n + 1
+                total ۝ scale(n, 2) + len("Salam") ۩ ""
+        """
+        self.vm.execute(compile_code(code))
+        self.assertEqual(self.vm.globals["total"], "10.5")
+        self.assertEqual(self.vm.stack, [])
+
+    def test_local_slots_and_global_cache(self):
+        code = compile_code("""
+        def zakat(amount):
+            due ۝ amount * rate
+            return due
+        ﷽:
+            rate ۝ 0.025
+            first ۝ zakat(1000)
+            rate ۝ 0.05
+            second ۝ zakat(1000)
+        """, NO_OPTIMIZATION)
+        function = next(const for const in code.consts if isinstance(const, CodeObject))
+        self.assertEqual(function.varnames, ("amount", "due"))
+        opcodes = [instruction.opcode for instruction in function]
+        self.assertEqual(opcodes[:4], [OpCode.LOAD_FAST, OpCode.LOAD_GLOBAL, OpCode.BINARY_MULTIPLY,
+                                       OpCode.STORE_FAST])
+        self.vm.execute(code)
+        # Rebinding rate invalidates the value LOAD_GLOBAL cached in zakat
+        self.assertEqual((self.vm.globals["first"], self.vm.globals["second"]), (25.0, 50.0))
+
+    def test_call_site_caches(self):
+        code = compile_code("""
+        def one(x):
+            return 1
+        def two(x):
+            return 2
+        def pick(f):
+            return f(0) + len("ab")
+        ﷽:
+            first ۝ pick(one) + pick(one)
+            second ۝ pick(two)
+        """)
+        self.vm.execute(code)
+        self.assertEqual((self.vm.globals["first"], self.vm.globals["second"]), (6.0, 4.0))
+        pick = next(const for const in code.consts if isinstance(const, CodeObject) and const.name == "pick")
+        # Each site holds the last callee it saw
+        callees = [site[0] for site in pick.call_sites if site is not None]
+        self.assertEqual([getattr(callee, "code", callee).name for callee in callees], ["two", "len"])
+        with self.assertRaises(TypeError):
+            self.vm.execute(compile_code("﷽:\n    pick(one, two)"))
+
+    def test_specialised_operators_deoptimise(self):
+        code = compile_code("""
+        def add(x, y):
+            return x + y
+        def label(x, y):
+            return x ۩ y
+        ﷽:
+            total ۝ add(1, 2)
+            text ۝ label("zakat", ": due")
+        """)
+        functions = [const for const in code.consts if isinstance(const, CodeObject)]
+        specialised = (OpCode.BINARY_ADD_FLOAT, OpCode.CONCAT_STR)
+        self.assertEqual([[instruction.opcode for instruction in function if instruction.opcode in specialised]
+                          for function in functions], [[OpCode.BINARY_ADD_FLOAT], [OpCode.CONCAT_STR]])
+        self.vm.execute(code)
+        self.assertEqual((self.vm.globals["total"], self.vm.globals["text"]), (3.0, "zakat: due"))
+        # Called from the host with other types, both turn generic for good
+        self.assertEqual(self.vm.call(self.vm.globals["add"], ["a", "b"]), "ab")
+        self.assertEqual(self.vm.call(self.vm.globals["label"], [1.0, "b"]), "1.0b")
+        self.assertEqual([[instruction.opcode for instruction in function
+                           if instruction.opcode in (OpCode.BINARY_ADD, OpCode.BINARY_CONCAT)]
+                          for function in functions], [[OpCode.BINARY_ADD], [OpCode.BINARY_CONCAT]])
+        self.assertEqual(self.vm.call(self.vm.globals["add"], [1.0, 2.0]), 3.0)
+
+    def test_functions_return_their_last_value(self):
+        # As in the interpreters, a function that falls off its end gives
+        # the value of its last statement
+        self.vm.execute(compile_code("""
+        def double(x):
+            x * 2
+        def due(amount):
+            due ۝ amount / 40
+        def sign(x):
+            if x < 0:
+                "negative"
+            else:
+                x ۩ ""
+        def count(n):
+            while n < 3:
+                n ۝ n + 1
+        ﷽:
+            results ۝ list(double(4), due(80), sign(-1), sign(2), count(0))
+        """))
+        self.assertEqual(self.vm.globals["results"], [8.0, 2.0, "negative", "2.0", None])
+
+    def test_unbound_local(self):
+        code = compile_code("""
+        def f(flag):
+            if flag:
+                x ۝ 1
+            else:
+                return x
+        ﷽:
+            f(0)
+        """)
+        with self.assertRaises(UnboundLocalError):
+            self.vm.execute(code)
+
 if __name__ == '__main__':
     unittest.main()
 